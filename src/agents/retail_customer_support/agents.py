@@ -1,5 +1,8 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from dataclasses import dataclass
-import json
+import inspect
 import logging
 import time
 from typing import (
@@ -7,53 +10,61 @@ from typing import (
     Callable, 
     Dict, 
     List, 
-    Optional
+    Optional,
+    Tuple
 )
 
-from transformers.utils import logging as transformers_logging
-
 from smolagents.tools import (
     Toolbox,
-    DEFAULT_TOOL_DESCRIPTION_TEMPLATE,
-    get_tool_description_with_args
+    DEFAULT_TOOL_DESCRIPTION_TEMPLATE
 )
 from smolagents.utils import (
-    console,
     parse_json_tool_call,
-    parse_json_blob
-)
-from smolagents.models import MessageRole
-from smolagents.agents import (
-    format_prompt_with_tools,
+    parse_json_blob,
     AgentParsingError,
     AgentExecutionError,
     AgentError,
     AgentGenerationError,
     AgentMaxIterationsError
 )
+from smolagents.models import MessageRole
 
-from rich.syntax import Syntax
-from rich.console import Group
-from rich.panel import Panel
-from rich.rule import Rule
-from rich.text import Text
-
+from .events import EventEmitter, RichConsoleEmitter
+from .memory import AgentMemory, PromptMessages
+from .prompt_templates import (
+    compile_format_template,
+    compile_marker_template,
+    format_prompt_with_tools,
+    render_tool_description,
+    render_tool_descriptions
+)
 from .prompts import (
     RETAIL_SUPPORT_AGENT_SYSTEM_PROMPT, 
+    STEP_STATE_PLACEHOLDER,
     SYSTEM_PROMPT_GENERATE_BELIEF,
     SYSTEM_PROMPT_PLAN, 
     USER_PROMPT_GENERATE_BELIEF,
-    USER_PROMPT_PLAN
+    USER_PROMPT_PLAN,
+    USER_PROMPT_STEP_STATE
 )
+from tau_bench.llm_usage import LLMUsage, collect_usage
+from tau_bench.metrics import summarize_usage
 
 
-logger = transformers_logging.get_logger(__name__)
+logger = logging.getLogger(__name__)
 logger.propagate = False
 logger.setLevel(logging.ERROR)
 ch = logging.StreamHandler()
 logger.addHandler(ch)
 
-YELLOW_HEX = "#d4b702"
+STEP_PROMPT_MARKERS = (
+    ("known_facts", "<<known_facts>>"),
+    ("unknown_facts", "<<unknown_facts>>"),
+    ("execution_plan", "<<execution_plan>>"),
+)
+BELIEF_PROMPT_MARKERS = (("domain_knowledge", "<<domain_knowledge>>"),)
+PLAN_STOP_SEQUENCES = ["<end_plan>"]
+ACTION_STOP_SEQUENCES = ["<end_action>", "Observation:"]
 
 @dataclass
 class BeliefFacts:
@@ -64,6 +75,15 @@ class BeliefFacts:
     knownFacts: List[str]
     unknownFacts: List[str]
 
+def same_facts(previous: BeliefFacts, current: BeliefFacts) -> bool:
+    """Whether two beliefs hold the same known and unknown facts, in any order."""
+    def normalized(facts: Any) -> List[str]:
+        return sorted(str(fact).strip() for fact in (facts if isinstance(facts, list) else [facts]))
+    return (
+        normalized(previous.knownFacts) == normalized(current.knownFacts)
+        and normalized(previous.unknownFacts) == normalized(current.unknownFacts)
+    )
+
 @dataclass
 class ExecutionPlan:
     step: int
@@ -82,6 +102,9 @@ class RetailSupportMultiStepAgent:
             max_iterations:  int = 10,
             belief_computation_interval: Optional[int] = None,
             planning_interval: Optional[int] = None,
+            stable_prefix_first: bool = False,
+            events: Optional[EventEmitter] = None,
+            speculative_planning: bool = False,
     ):  
         self.model = model
         self.toolbox = tool_box
@@ -96,39 +119,49 @@ class RetailSupportMultiStepAgent:
         self.planning_interval = planning_interval
         self.belief_facts = []
         self.computed_plans = []
+        self.memory: Optional[AgentMemory] = None
+        # keep the step system prompt identical across steps and send facts and plan after the memory,
+        # so that providers' prompt-prefix caches also cover the conversation
+        self.stable_prefix_first = stable_prefix_first
+        self.llm_usage: List[LLMUsage] = []
+        self.current_step: Optional[int] = None
+        self._step_usage_start = 0
         self.logger = logger
+        # progress of the run (steps, thoughts, actions, ...); rendered on the console unless told otherwise
+        self.events = events if events is not None else RichConsoleEmitter()
+        # while new beliefs are computed, already run the call waiting for them (the plan, or else the action)
+        # with the previous beliefs, and keep its output if the new beliefs hold the same facts
+        self.speculative_planning = speculative_planning
+        self._speculation_executor: Optional[ThreadPoolExecutor] = None
 
         # TODO: Add Logger Level
 
     def initialize_for_run(self):
+        """
+        Renders everything that stays constant during a run once: per-step prompts only fill the remaining slots.
+        """
         self.system_prompt = format_prompt_with_tools(
             self.toolbox, self.system_prompt_template, DEFAULT_TOOL_DESCRIPTION_TEMPLATE
         )
+        self.step_prompt_template = compile_marker_template(self.system_prompt, STEP_PROMPT_MARKERS)
+        if self.stable_prefix_first:
+            self.stable_step_system_prompt = self.step_prompt_template.render(
+                known_facts=STEP_STATE_PLACEHOLDER,
+                unknown_facts=STEP_STATE_PLACEHOLDER,
+                execution_plan=STEP_STATE_PLACEHOLDER
+            )
+        self.belief_system_prompt = compile_marker_template(SYSTEM_PROMPT_GENERATE_BELIEF, BELIEF_PROMPT_MARKERS).render(
+            domain_knowledge=self.policy_wiki
+        )
+        self.plan_system_prompt = compile_format_template(SYSTEM_PROMPT_PLAN).render(task=self.task)
+        self.plan_prompt_template = compile_format_template(USER_PROMPT_PLAN).partial(
+            task=self.task,
+            domain_knowledge=self.policy_wiki,
+            tool_descriptions=render_tool_descriptions(self.toolbox, DEFAULT_TOOL_DESCRIPTION_TEMPLATE)
+        )
 
     def create_inner_memory_from_logs(self) -> List[Dict[str, str]]:
-        task_message = {
-            "role": MessageRole.USER,
-            "content": "Task: " + self.task,
-        }
-        memory = [task_message]
-
-        for step_log in self.logs:
-            if "llm_output" in step_log:
-                thought_message = {"role": MessageRole.ASSISTANT, "content": step_log["llm_output"].strip()}
-                memory.append(thought_message)
-            if "error" in step_log or "observation" in step_log:
-                if "error" in step_log:
-                    message_content = (
-                        f"Error:\n"
-                        + str(step_log["error"])
-                        + "\nNow let's retry: take care not to repeat previous errors! If you have retried several times, try a completely different approach.\n"
-                    )
-                elif "observation" in step_log:
-                    message_content = f"Observation:\n{step_log['observation']}"
-                tool_response_message = {"role": MessageRole.USER, "content": message_content}
-                memory.append(tool_response_message)
-
-        return memory
+        return list(self.memory.messages)
     
     def extract_trajectory(self) -> List[Any]:
         trajectory = []
@@ -195,54 +228,64 @@ class RetailSupportMultiStepAgent:
             if tool_name in self.toolbox.tools:
                 raise AgentExecutionError(
                     f"Error in tool call execution: {e}\nYou should only use this tool with a correct input.\n"
-                    f"As a reminder, this tool's description is the following:\n{get_tool_description_with_args(available_tools[tool_name])}"
+                    f"As a reminder, this tool's description is the following:\n{render_tool_description(available_tools[tool_name])}"
                 )
     
-    def compute_beliefs(self, step: int):
-        #print(f"=========== Compute Facts @ {step} ===================")
-        agent_memory = self.create_inner_memory_from_logs()
-        message_system_prompt_belief_facts = {"role": MessageRole.SYSTEM, "content": SYSTEM_PROMPT_GENERATE_BELIEF.replace("<<domain_knowledge>>",self.policy_wiki)}
+    def _belief_messages(self) -> List[Dict[str, str]]:
+        message_system_prompt_belief_facts = {"role": MessageRole.SYSTEM, "content": self.belief_system_prompt}
         message_user_prompt_belief_facts = {
             "role": MessageRole.USER,
             "content": USER_PROMPT_GENERATE_BELIEF,
         }
+        return PromptMessages([message_system_prompt_belief_facts], self.memory, [message_user_prompt_belief_facts])
+
+    def _parse_beliefs(self, step: int, llm_output: str) -> Tuple[BeliefFacts, Dict[str, Any]]:
+        parsed_belief_and_facts = parse_json_blob(llm_output)
+        beliefFacts = BeliefFacts(
+            step=step,
+            llmOutput=llm_output,
+            beliefState=parsed_belief_and_facts['belief_state'], 
+            beliefStateExplaination=parsed_belief_and_facts['belief_explanation'], 
+            knownFacts=parsed_belief_and_facts['known_facts'], 
+            unknownFacts=parsed_belief_and_facts['unknown_facts']
+        )
+        return beliefFacts, parsed_belief_and_facts
+
+    def _record_beliefs(self, beliefFacts: BeliefFacts, parsed_belief_and_facts: Dict[str, Any]):
+        self.events.belief(beliefFacts.step, parsed_belief_and_facts)
+
+        self.belief_facts.append(beliefFacts)
 
-        beliefFacts = None
+    def compute_beliefs(self, step: int):
+        messages = self._belief_messages()
         trials = 0
-        while beliefFacts is None and trials < 3:
+        while True:
             try:
-                llm_output = self.llm_engine(
-                    [message_system_prompt_belief_facts] + agent_memory + [message_user_prompt_belief_facts], 
-                    stop_sequences=["<belief_state_with_facts>"]
-                )
-                parsed_belief_and_facts = parse_json_blob(llm_output)
-                #print(json.dumps(parsed_belief_and_facts, indent=2))
-                beliefFacts = BeliefFacts(
-                    step=step,
-                    llmOutput=llm_output,
-                    beliefState=parsed_belief_and_facts['belief_state'], 
-                    beliefStateExplaination=parsed_belief_and_facts['belief_explanation'], 
-                    knownFacts=parsed_belief_and_facts['known_facts'], 
-                    unknownFacts=parsed_belief_and_facts['unknown_facts']
-                )
+                llm_output = self.llm_engine(messages, stop_sequences=["<belief_state_with_facts>"], phase="belief")
+                beliefFacts, parsed_belief_and_facts = self._parse_beliefs(step, llm_output)
+                break
             except Exception as e:
                 if trials == 2:
                     raise AgentExecutionError(f"facts computation failed {e}")
                 trials+=1
                 # TODO Add logging for Failures
-        
-        
-        console.print(
-                Rule("[bold]Current Belief & Facts (Information Known/Unknown)", style="orange"), 
-                Text(json.dumps(parsed_belief_and_facts, indent=2))
-            )
+        self._record_beliefs(beliefFacts, parsed_belief_and_facts)
 
-        self.belief_facts.append(beliefFacts)
+    async def acompute_beliefs(self, step: int):
+        messages = self._belief_messages()
+        trials = 0
+        while True:
+            try:
+                llm_output = await self._acall_llm_engine(messages, stop_sequences=["<belief_state_with_facts>"], phase="belief")
+                beliefFacts, parsed_belief_and_facts = self._parse_beliefs(step, llm_output)
+                break
+            except Exception as e:
+                if trials == 2:
+                    raise AgentExecutionError(f"facts computation failed {e}")
+                trials+=1
+        self._record_beliefs(beliefFacts, parsed_belief_and_facts)
     
-    def compute_plan(self, step: int):
-        #print(f"=========== Compute Plan @ {step} ===================")
-        agent_memory = self.create_inner_memory_from_logs()
-
+    def _plan_messages(self, step: int) -> Tuple[List[Dict[str, str]], BeliefFacts]:
         # Get Latest Computed Facts (or Information Gathered)
         if len(self.belief_facts) == 0:
             raise AgentExecutionError(f"Facts not computed before computing plan @step: {step}")
@@ -250,72 +293,77 @@ class RetailSupportMultiStepAgent:
         beliefFacts = self.belief_facts[-1]
         plan_update_message = {
                 "role": MessageRole.SYSTEM,
-                "content": SYSTEM_PROMPT_PLAN.format(task=self.task),
+                "content": self.plan_system_prompt,
             }
         
         previous_plan = f"Your previous prepared plan:\n{self.computed_plans[-1]}" if len(self.computed_plans) > 0 else ""
 
         plan_update_message_user = {
                 "role": MessageRole.USER,
-                "content": USER_PROMPT_PLAN.format(
-                    task=self.task,
-                    tool_descriptions=self.toolbox.show_tool_descriptions(DEFAULT_TOOL_DESCRIPTION_TEMPLATE),
-                    domain_knowledge=self.policy_wiki,
+                "content": self.plan_prompt_template.render(
                     known_facts=beliefFacts.knownFacts,
                     unknown_facts=beliefFacts.unknownFacts,
                     previous_plan=previous_plan
                 ),
             }
-        llm_output = self.llm_engine(
-            [plan_update_message] + agent_memory + [plan_update_message_user], 
-            stop_sequences=["<end_plan>"]
-        )
-        #print(llm_output)
-        console.print(
-                Rule("[bold]Generated Plan based on Facts learned so far", style="orange"), 
-                Text(llm_output)
-            )
+        return PromptMessages([plan_update_message], self.memory, [plan_update_message_user]), beliefFacts
+
+    def _record_plan(self, step: int, beliefFacts: BeliefFacts, llm_output: str):
+        self.events.plan(step, llm_output)
         computed_plan = ExecutionPlan(
             step=step,
             beliefFactsUsed=beliefFacts,
             planDetails=llm_output
         )
         self.computed_plans.append(computed_plan)
-    
-    def execute_step(self, step_index: int, running_log_entry: Dict[str, Any]):
-        #print(f"\n\n ===================================== Step {step_index} =====================================")
 
+    def compute_plan(self, step: int):
+        messages, beliefFacts = self._plan_messages(step)
+        llm_output = self.llm_engine(messages, stop_sequences=PLAN_STOP_SEQUENCES, phase="plan")
+        self._record_plan(step, beliefFacts, llm_output)
+
+    async def acompute_plan(self, step: int):
+        messages, beliefFacts = self._plan_messages(step)
+        llm_output = await self._acall_llm_engine(messages, stop_sequences=PLAN_STOP_SEQUENCES, phase="plan")
+        self._record_plan(step, beliefFacts, llm_output)
+    
+    def _step_messages(self) -> List[Dict[str, str]]:
         # get latest plan
         latest_computed_plan = self.computed_plans[-1]
 
         # get latest computed belief
         latest_computed_facts = self.belief_facts[-1]
 
+        if self.stable_prefix_first:
+            step_state_message = {
+                "role": MessageRole.USER,
+                "content": compile_format_template(USER_PROMPT_STEP_STATE).render(
+                    known_facts='\n'.join(latest_computed_facts.knownFacts),
+                    unknown_facts='\n'.join(latest_computed_facts.unknownFacts),
+                    execution_plan=latest_computed_plan.planDetails
+                ),
+            }
+            return PromptMessages(
+                [{"role": MessageRole.SYSTEM, "content": self.stable_step_system_prompt}], self.memory, [step_state_message]
+            )
+
         # create messages
-        system_prompt = self.system_prompt.replace(
-            "<<known_facts>>", 
-            '\n'.join(latest_computed_facts.knownFacts)
-        ).replace(
-            "<<unknown_facts>>",
-            '\n'.join(latest_computed_facts.unknownFacts)
-        ).replace(
-            "<<execution_plan>>", 
-            latest_computed_plan.planDetails
+        system_prompt = self.step_prompt_template.render(
+            known_facts='\n'.join(latest_computed_facts.knownFacts),
+            unknown_facts='\n'.join(latest_computed_facts.unknownFacts),
+            execution_plan=latest_computed_plan.planDetails
         )
         message_system_prompt_step_execution = {"role": MessageRole.SYSTEM, "content": system_prompt}
+        return PromptMessages([message_system_prompt_step_execution], self.memory, [])
 
-        agent_memory = self.create_inner_memory_from_logs()
-        try:
-            llm_output = self.llm_engine([message_system_prompt_step_execution] + agent_memory, stop_sequences=["<end_action>", "Observation:"])
-            #print(llm_output)
-        except Exception as e:
-            raise AgentGenerationError(f"Error in generating llm output: {e}.")
-        
+    def _parse_step_output(self, llm_output: str, running_log_entry: Dict[str, Any]) -> Tuple[str, Any]:
+        """
+        Parses the action from the LLM output and records it in the running log entry.
+        Returns the tool name and its arguments; a `final_answer` call is also recorded as the final answer.
+        """
         running_log_entry['llm_output'] = llm_output
         rationale, action = self.extract_action(llm_output=llm_output, split_token="Action:")
-        console.print(
-                f"[Thought]: {rationale}"
-            )
+        self.events.thought(rationale)
 
         try:
             tool_name, arguments = self.tool_parser(action)
@@ -325,9 +373,7 @@ class RetailSupportMultiStepAgent:
         running_log_entry["rationale"] = rationale
         running_log_entry["tool_call"] = {"tool_name": tool_name, "tool_arguments": arguments}
 
-        console.print(
-                f"[Action]: Calling tool :: '{tool_name}' with arguments :: {arguments}"
-            )
+        self.events.action(tool_name, arguments)
 
         if tool_name == "final_answer":
             if isinstance(arguments, dict):
@@ -338,81 +384,242 @@ class RetailSupportMultiStepAgent:
             else:
                 answer = arguments
             running_log_entry["final_answer"] = answer
-            console.print(
-                    Text(f"[Final answer]: {answer}", style=f"bold {YELLOW_HEX}")
-                )
-            return answer
-        else:
-            if arguments is None:
-                arguments = {}
-            observation = self.execute_tool_call(tool_name, arguments)
-            updated_information = str(observation).strip()
-            #print(f"Observation: {updated_information}")
-            #self.logger.info(updated_information)
-            running_log_entry["observation"] = updated_information
-            prefix_obs = "[Customer] " if tool_name == 'respond_customer' else ""
-            console.print(
-               f"[Observation]: {prefix_obs}{updated_information}"
-            )
-            return running_log_entry
+            self.events.final_answer(answer)
+        elif arguments is None:
+            arguments = {}
+        return tool_name, arguments
+
+    def _record_observation(self, tool_name: str, observation: Any, running_log_entry: Dict[str, Any]):
+        updated_information = str(observation).strip()
+        running_log_entry["observation"] = updated_information
+        self.events.observation(tool_name, updated_information)
+
+    def execute_step(self, step_index: int, running_log_entry: Dict[str, Any], llm_output: Optional[str] = None):
+        """Runs the step's action; `llm_output` is the action output when it was already generated (see `prepare_step`)."""
+        if llm_output is None:
+            messages = self._step_messages()
+            try:
+                llm_output = self.llm_engine(messages, stop_sequences=ACTION_STOP_SEQUENCES, phase="action")
+            except Exception as e:
+                raise AgentGenerationError(f"Error in generating llm output: {e}.")
+
+        tool_name, arguments = self._parse_step_output(llm_output, running_log_entry)
+        if tool_name == "final_answer":
+            return running_log_entry["final_answer"]
+        observation = self.execute_tool_call(tool_name, arguments)
+        self._record_observation(tool_name, observation, running_log_entry)
+        return running_log_entry
+
+    async def aexecute_step(self, step_index: int, running_log_entry: Dict[str, Any], llm_output: Optional[str] = None):
+        if llm_output is None:
+            messages = self._step_messages()
+            try:
+                llm_output = await self._acall_llm_engine(messages, stop_sequences=ACTION_STOP_SEQUENCES, phase="action")
+            except Exception as e:
+                raise AgentGenerationError(f"Error in generating llm output: {e}.")
+
+        tool_name, arguments = self._parse_step_output(llm_output, running_log_entry)
+        if tool_name == "final_answer":
+            return running_log_entry["final_answer"]
+        # tools are synchronous (respond_customer blocks on the user simulator), keep them off the event loop
+        observation = await asyncio.to_thread(self.execute_tool_call, tool_name, arguments)
+        self._record_observation(tool_name, observation, running_log_entry)
+        return running_log_entry
         
+    async def _acall_llm_engine(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        Calls the LLM engine from `arun`: async engines are awaited, sync engines run in a worker thread.
+        """
+        if inspect.iscoroutinefunction(self.llm_engine) or inspect.iscoroutinefunction(getattr(self.llm_engine, "__call__", None)):
+            return await self.llm_engine(messages, **kwargs)
+        return await asyncio.to_thread(self.llm_engine, messages, **kwargs)
+
+    def _final_answer_messages(self, task) -> List[Dict[str, str]]:
+        self.prompt = PromptMessages(
+            [
+                {
+                    "role": MessageRole.SYSTEM,
+                    "content": "An agent tried to answer an user query but it got stuck and failed to do so. You are tasked with providing an answer instead. Here is the agent's memory:",
+                }
+            ],
+            self.memory,
+            [
+                {
+                    "role": MessageRole.USER,
+                    "content": f"Based on the above, please provide an answer to the following user request:\n{task}",
+                }
+            ],
+        )
+        return self.prompt
+
     def provide_final_answer(self, task) -> str:
         """
         This method provides a final answer to the task, based on the logs of the agent's interactions.
         """
-        self.prompt = [
-            {
-                "role": MessageRole.SYSTEM,
-                "content": "An agent tried to answer an user query but it got stuck and failed to do so. You are tasked with providing an answer instead. Here is the agent's memory:",
-            }
-        ]
-        self.prompt += self.create_inner_memory_from_logs()
-        self.prompt += [
-            {
-                "role": MessageRole.USER,
-                "content": f"Based on the above, please provide an answer to the following user request:\n{task}",
-            }
-        ]
+        messages = self._final_answer_messages(task)
         try:
-            return self.llm_engine(self.prompt)
+            return self.llm_engine(messages, phase="final_answer")
         except Exception as e:
             return f"Error in generating final llm output: {e}."
-    
-    def run(self, task: str):
+
+    async def aprovide_final_answer(self, task) -> str:
+        messages = self._final_answer_messages(task)
+        try:
+            return await self._acall_llm_engine(messages, phase="final_answer")
+        except Exception as e:
+            return f"Error in generating final llm output: {e}."
+
+    def _speculative_call(self, iteration: int) -> Optional[Tuple[str, List[Dict[str, str]], Dict[str, Any]]]:
+        """
+        The call that waits for the beliefs of `iteration` (the plan if one is due, otherwise the action) as
+        (kind, messages, engine kwargs) built from the previous beliefs, or None if it cannot be speculated on.
+        """
+        if not self.speculative_planning or not self._should_compute_beliefs(iteration) or not self.belief_facts:
+            return None
+        if self._should_compute_plan(iteration):
+            messages, _ = self._plan_messages(iteration)
+            return "plan", messages, {"stop_sequences": PLAN_STOP_SEQUENCES, "phase": "plan"}
+        if not self.computed_plans:
+            return None
+        return "action", self._step_messages(), {"stop_sequences": ACTION_STOP_SEQUENCES, "phase": "action"}
+
+    def _resolve_speculation(
+        self,
+        iteration: int,
+        kind: str,
+        used_beliefs: BeliefFacts,
+        llm_output: Optional[str],
+        running_log_entry: Dict[str, Any],
+    ) -> Optional[str]:
+        """
+        Keeps the speculative output if it did not fail and the new beliefs hold the same facts as the ones it was
+        computed with, so that it is what the call would have returned anyway. Returns a kept action output.
+        """
+        accepted = llm_output is not None and same_facts(used_beliefs, self.belief_facts[-1])
+        running_log_entry["speculation"] = {"call": kind, "accepted": accepted}
+        if not accepted:
+            return None
+        if kind == "plan":
+            self._record_plan(iteration, self.belief_facts[-1], llm_output)
+            return None
+        return llm_output
+
+    def _plan_computed(self, iteration: int) -> bool:
+        return len(self.computed_plans) > 0 and self.computed_plans[-1].step == iteration
+
+    def prepare_step(self, iteration: int, running_log_entry: Dict[str, Any]) -> Optional[str]:
+        """
+        Computes the beliefs and the plan due at `iteration`. With `speculative_planning` the call waiting for the
+        beliefs runs in a worker thread meanwhile (see `_speculative_call`). Returns the action output if the
+        speculative action was kept.
+        """
+        action_output = None
+        speculation = self._speculative_call(iteration)
+        if speculation is not None:
+            kind, messages, kwargs = speculation
+            used_beliefs = self.belief_facts[-1]
+            # the copied context keeps reporting the call's usage to this run
+            future = self._speculation_executor.submit(contextvars.copy_context().run, self.llm_engine, messages, **kwargs)
+            try:
+                self.compute_beliefs(iteration)
+            finally:
+                error = future.exception()
+            llm_output = future.result() if error is None else None
+            action_output = self._resolve_speculation(iteration, kind, used_beliefs, llm_output, running_log_entry)
+        elif self._should_compute_beliefs(iteration):
+            self.compute_beliefs(iteration)
+
+        if self._should_compute_plan(iteration) and not self._plan_computed(iteration):
+            self.compute_plan(iteration)
+        return action_output
+
+    async def aprepare_step(self, iteration: int, running_log_entry: Dict[str, Any]) -> Optional[str]:
+        action_output = None
+        speculation = self._speculative_call(iteration)
+        if speculation is not None:
+            kind, messages, kwargs = speculation
+            used_beliefs = self.belief_facts[-1]
+            speculative_call = asyncio.ensure_future(self._acall_llm_engine(messages, **kwargs))
+            try:
+                await self.acompute_beliefs(iteration)
+            finally:
+                await asyncio.wait([speculative_call])
+            llm_output = speculative_call.result() if speculative_call.exception() is None else None
+            action_output = self._resolve_speculation(iteration, kind, used_beliefs, llm_output, running_log_entry)
+        elif self._should_compute_beliefs(iteration):
+            await self.acompute_beliefs(iteration)
+
+        if self._should_compute_plan(iteration) and not self._plan_computed(iteration):
+            await self.acompute_plan(iteration)
+        return action_output
+
+    def _should_compute_beliefs(self, iteration: int) -> bool:
+        return self.belief_computation_interval is None or iteration % self.belief_computation_interval == 0
+
+    def _should_compute_plan(self, iteration: int) -> bool:
+        return self.planning_interval is None or iteration % self.planning_interval == 0
+
+    def _start_run(self, task: str):
         self.task = task
+        self.memory = AgentMemory(task)
         self.initialize_for_run()
 
-        console.print(
-            Panel(Text(f"[Customer] {task}"))
-        )
+        self.events.customer_request(task)
+
+    def _record_usage(self, usage: LLMUsage):
+        usage.step = self.current_step
+        self.llm_usage.append(usage)
+
+    def _start_step(self, iteration: int) -> Dict[str, Any]:
+        self.current_step = iteration
+        self._step_usage_start = len(self.llm_usage)
+        return {"iteration": iteration, "start_time": time.time()}
+
+    def _finish_step(self, step_log_entry: Dict[str, Any], step_start_time: float):
+        step_end_time = time.time()
+        step_log_entry["step_end_time"] = step_end_time
+        step_log_entry["step_duration"] = step_end_time - step_start_time
+        step_log_entry["llm_usage"] = summarize_usage(self.llm_usage[self._step_usage_start:])
+        self.logs.append(step_log_entry)
+        self.memory.append_step_log(step_log_entry)
+
+    def _max_iterations_reached(self) -> Dict[str, Any]:
+        error_message = "Reached max iterations."
+        final_step_log = {"error": AgentMaxIterationsError(error_message)}
+        self.logs.append(final_step_log)
+        self.memory.append_step_log(final_step_log)
+        self.logger.error(error_message, exc_info=1)
+        return final_step_log
+    
+    def run(self, task: str):
+        # usage of every LLM call of the run (including the user simulator behind respond_customer)
+        if self.speculative_planning:
+            self._speculation_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            with collect_usage(self._record_usage):
+                return self._run(task)
+        finally:
+            if self._speculation_executor is not None:
+                self._speculation_executor.shutdown()
+                self._speculation_executor = None
+
+    def _run(self, task: str):
+        self._start_run(task)
 
         iteration = 0
         final_answer = None
         
         while final_answer is None and iteration < self.max_iterations:
-            step_start_time = time.time()
-            step_log_entry = {"iteration": iteration, "start_time": step_start_time}
+            step_log_entry = self._start_step(iteration)
+            step_start_time = step_log_entry["start_time"]
             try:
-                # Compute Facts
-                if self.belief_computation_interval is None:
-                    self.compute_beliefs(iteration)
-                else:
-                    if iteration % self.belief_computation_interval == 0:
-                        self.compute_beliefs(iteration)
-                
-                # Compute Plan
-                if self.planning_interval is None:
-                    self.compute_plan(iteration)
-                else:
-                    if iteration % self.planning_interval == 0:
-                        self.compute_plan(iteration)
+                # Compute Facts and Plan
+                action_output = self.prepare_step(iteration, step_log_entry)
 
-                console.print(
-                    Rule(f"[bold]Step {iteration}", characters="━", style=YELLOW_HEX)
-                )
+                self.events.step(iteration)
 
                 # Execute Step
-                self.execute_step(step_index=iteration, running_log_entry=step_log_entry)
+                self.execute_step(step_index=iteration, running_log_entry=step_log_entry, llm_output=action_output)
 
 
                 if "final_answer" in step_log_entry:
@@ -421,19 +628,53 @@ class RetailSupportMultiStepAgent:
                 self.logger.error(e, exc_info=1)
                 step_log_entry["error"] = e
             finally:
-                step_end_time = time.time()
-                step_log_entry["step_end_time"] = step_end_time
-                step_log_entry["step_duration"] = step_end_time - step_start_time
-                self.logs.append(step_log_entry)
+                self._finish_step(step_log_entry, step_start_time)
                 iteration += 1
         
         if final_answer is None and iteration == self.max_iterations:
-            error_message = "Reached max iterations."
-            final_step_log = {"error": AgentMaxIterationsError(error_message)}
-            self.logs.append(final_step_log)
-            self.logger.error(error_message, exc_info=1)
+            final_step_log = self._max_iterations_reached()
             final_answer = self.provide_final_answer(task)
             final_step_log["final_answer"] = final_answer
             final_step_log["step_duration"] = 0
 
-        return final_answer
\ No newline at end of file
+        return final_answer
+
+    async def arun(self, task: str):
+        """
+        Same as `run`, but awaits the LLM calls so that many episodes can share a single event loop.
+        """
+        with collect_usage(self._record_usage):
+            return await self._arun(task)
+
+    async def _arun(self, task: str):
+        self._start_run(task)
+
+        iteration = 0
+        final_answer = None
+
+        while final_answer is None and iteration < self.max_iterations:
+            step_log_entry = self._start_step(iteration)
+            step_start_time = step_log_entry["start_time"]
+            try:
+                action_output = await self.aprepare_step(iteration, step_log_entry)
+
+                self.events.step(iteration)
+
+                await self.aexecute_step(step_index=iteration, running_log_entry=step_log_entry, llm_output=action_output)
+
+                if "final_answer" in step_log_entry:
+                    final_answer = step_log_entry["final_answer"]
+            except AgentError as e:
+                self.logger.error(e, exc_info=1)
+                step_log_entry["error"] = e
+            finally:
+                self._finish_step(step_log_entry, step_start_time)
+                iteration += 1
+
+        if final_answer is None and iteration == self.max_iterations:
+            final_step_log = self._max_iterations_reached()
+            final_answer = await self.aprovide_final_answer(task)
+            final_step_log["final_answer"] = final_answer
+            final_step_log["step_duration"] = 0
+
+        return final_answer
@@ -0,0 +1,177 @@
+"""Where an agent's progress goes: the task, steps, thoughts, actions, observations, beliefs and plans.
+
+`RetailSupportMultiStepAgent` and the episode runner only call an `EventEmitter`; what is done with the events
+is up to the backend. `RichConsoleEmitter` renders them on the console (the default), `JsonlEventEmitter`
+appends one JSON line per event to a file and `NullEventEmitter` drops them. Only the rich backend builds
+renderables or pretty-prints JSON, so the other two keep that work off the episode's hot path.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, IO, Optional
+
+from rich.panel import Panel
+from rich.rule import Rule
+from rich.text import Text
+
+from smolagents.utils import console
+
+YELLOW_HEX = "#d4b702"
+EVENT_OUTPUTS = ("rich", "jsonl", "none")
+
+
+class EventEmitter:
+    """Receives the events of episodes. Every method does nothing by default."""
+
+    def bind(self, **context: Any) -> "EventEmitter":
+        """An emitter for one episode, tagging its events with `context` (e.g. task_id and trial) where supported."""
+        return self
+
+    def task(self, model: str, instruction: str) -> None:
+        pass
+
+    def customer_request(self, request: str) -> None:
+        pass
+
+    def step(self, step: int) -> None:
+        pass
+
+    def thought(self, rationale: str) -> None:
+        pass
+
+    def action(self, tool_name: str, arguments: Any) -> None:
+        pass
+
+    def final_answer(self, answer: Any) -> None:
+        pass
+
+    def observation(self, tool_name: str, observation: str) -> None:
+        pass
+
+    def belief(self, step: int, belief_and_facts: Dict[str, Any]) -> None:
+        pass
+
+    def plan(self, step: int, plan: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NullEventEmitter(EventEmitter):
+    """Drops every event."""
+
+
+class RichConsoleEmitter(EventEmitter):
+    """Renders events on the shared rich console, as the agent always did."""
+
+    def task(self, model: str, instruction: str) -> None:
+        console.print(
+            Panel(
+                f"\n[bold]{instruction.strip()}\n",
+                title="[bold]New Task Instruction",
+                subtitle=f"{model}",
+                border_style=YELLOW_HEX,
+                subtitle_align="left",
+            )
+        )
+
+    def customer_request(self, request: str) -> None:
+        console.print(Panel(Text(f"[Customer] {request}")))
+
+    def step(self, step: int) -> None:
+        console.print(Rule(f"[bold]Step {step}", characters="━", style=YELLOW_HEX))
+
+    def thought(self, rationale: str) -> None:
+        console.print(f"[Thought]: {rationale}")
+
+    def action(self, tool_name: str, arguments: Any) -> None:
+        console.print(f"[Action]: Calling tool :: '{tool_name}' with arguments :: {arguments}")
+
+    def final_answer(self, answer: Any) -> None:
+        console.print(Text(f"[Final answer]: {answer}", style=f"bold {YELLOW_HEX}"))
+
+    def observation(self, tool_name: str, observation: str) -> None:
+        prefix_obs = "[Customer] " if tool_name == 'respond_customer' else ""
+        console.print(f"[Observation]: {prefix_obs}{observation}")
+
+    def belief(self, step: int, belief_and_facts: Dict[str, Any]) -> None:
+        console.print(
+            Rule("[bold]Current Belief & Facts (Information Known/Unknown)", style="orange"),
+            Text(json.dumps(belief_and_facts, indent=2)),
+        )
+
+    def plan(self, step: int, plan: str) -> None:
+        console.print(Rule("[bold]Generated Plan based on Facts learned so far", style="orange"), Text(plan))
+
+
+class JsonlEventEmitter(EventEmitter):
+    """
+    Appends every event as one JSON line `{"event": ..., "time": ..., **context, **fields}` to a text stream.
+
+    Emitters returned by `bind` share the stream and its lock, so lines of concurrent episodes never interleave
+    and can be told apart by their context. Lines are flushed as they are written.
+    """
+
+    def __init__(self, stream: IO[str], context: Optional[Dict[str, Any]] = None, lock: Optional[threading.Lock] = None) -> None:
+        self.stream = stream
+        self.context = context or {}
+        self._lock = lock or threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> "JsonlEventEmitter":
+        return cls(open(path, "a", encoding="utf-8"))
+
+    def bind(self, **context: Any) -> "JsonlEventEmitter":
+        return JsonlEventEmitter(self.stream, {**self.context, **context}, self._lock)
+
+    def _emit(self, event: str, **fields: Any) -> None:
+        line = json.dumps({"event": event, "time": time.time(), **self.context, **fields}, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def task(self, model: str, instruction: str) -> None:
+        self._emit("task", model=model, instruction=instruction)
+
+    def customer_request(self, request: str) -> None:
+        self._emit("customer_request", request=request)
+
+    def step(self, step: int) -> None:
+        self._emit("step", step=step)
+
+    def thought(self, rationale: str) -> None:
+        self._emit("thought", rationale=rationale)
+
+    def action(self, tool_name: str, arguments: Any) -> None:
+        self._emit("action", tool_name=tool_name, arguments=arguments)
+
+    def final_answer(self, answer: Any) -> None:
+        self._emit("final_answer", answer=answer)
+
+    def observation(self, tool_name: str, observation: str) -> None:
+        self._emit("observation", tool_name=tool_name, observation=observation)
+
+    def belief(self, step: int, belief_and_facts: Dict[str, Any]) -> None:
+        self._emit("belief", step=step, belief=belief_and_facts)
+
+    def plan(self, step: int, plan: str) -> None:
+        self._emit("plan", step=step, plan=plan)
+
+    def close(self) -> None:
+        with self._lock:
+            self.stream.close()
+
+
+def create_event_emitter(output: str, path: Optional[str] = None) -> EventEmitter:
+    """The emitter of one of `EVENT_OUTPUTS`; the jsonl backend appends to `path`."""
+    if output == "rich":
+        return RichConsoleEmitter()
+    if output == "jsonl":
+        if path is None:
+            raise ValueError("the jsonl event output needs a file path")
+        return JsonlEventEmitter.open(path)
+    if output == "none":
+        return NullEventEmitter()
+    raise ValueError(f"unknown event output {output!r}, expected one of {EVENT_OUTPUTS}")
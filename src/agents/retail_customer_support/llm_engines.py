@@ -1,16 +1,28 @@
-from copy import deepcopy
+import asyncio
+from collections import OrderedDict
 import os
-import random
+import threading
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from smolagents.models import MessageRole
+from tau_bench.llm_cache import PersistentLLMCache
+from tau_bench.llm_usage import LLMUsage, gemini_usage, openai_usage, report_usage
+from .memory import PromptMessages, append_clean_messages
+from tau_bench.rate_limit import RateLimitScheduler, estimate_tokens, get_default_scheduler, priority_for_phase
 import google.generativeai as genai
-from google.api_core.exceptions import ResourceExhausted
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 
 class GeminiEngine:
-    def __init__(self, model_name="gemini-2.0-flash-exp"):
+    provider = "google"
+
+    def __init__(self, model_name="gemini-2.0-flash-exp", cache: Optional[PersistentLLMCache] = None, scheduler: Optional[RateLimitScheduler] = None):
         self.model_name = model_name
+        self.cache = cache
+        self.scheduler = scheduler or get_default_scheduler()
+        self.max_cached_models = 16
+        self._models: OrderedDict[str, genai.GenerativeModel] = OrderedDict()
+        self._models_lock = threading.Lock()
         self.role_conversions = {
             MessageRole.ASSISTANT : 'model',
             MessageRole.TOOL_CALL : 'model',
@@ -18,34 +30,49 @@ class GeminiEngine:
             MessageRole.USER : 'user',
         }
     
+    def clean_message(self, message: Dict[str, str]) -> Dict[str, str]:
+        if not set(message.keys()) == {"role", "content"}:
+            raise ValueError("Message should contain only 'role' and 'content' keys!")
+
+        role = message["role"]
+        if role not in MessageRole.roles():
+            raise ValueError(f"Incorrect role {role}, only {MessageRole.roles()} are supported for now.")
+
+        return {
+            'role' : self.role_conversions[role],
+            'parts' : message["content"],
+        }
+
     def get_clean_message_list(self, message_lists: List[Dict[str, str]]):
         """
-        Subsequent messages with the same role will be concatenated to a single message.
+        Converts messages to Gemini contents. The input messages are not modified.
 
         Args:
             message_list (`List[Dict[str, str]]`): List of chat messages.
         """
-        final_message_list = []
-        message_list_cpy = deepcopy(message_lists)  # Avoid modifying the original list
-        for message in message_list_cpy:
-            if not set(message.keys()) == {"role", "content"}:
-                raise ValueError("Message should contain only 'role' and 'content' keys!")
-
-            role = message["role"]
-            if role not in MessageRole.roles():
-                raise ValueError(f"Incorrect role {role}, only {MessageRole.roles()} are supported for now.")
-
-            gemini_role = self.role_conversions[role]
-            final_message_list.append({
-                'role' : gemini_role,
-                'parts' : message["content"],
-            })
-        return final_message_list
-
-    def __call__(self, messages, stop_sequences=[], grammar=None):
-        system_instruction = ""
+        return append_clean_messages([], message_lists, self.clean_message)
+
+    def get_model(self, system_instruction: str) -> genai.GenerativeModel:
+        """
+        Returns a `GenerativeModel` for the given system instruction, reusing recently built ones.
+        The generation config is passed per request, so the same model serves every stop sequence.
+        """
+        with self._models_lock:
+            model = self._models.get(system_instruction)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+                self._models[system_instruction] = model
+                if len(self._models) > self.max_cached_models:
+                    self._models.popitem(last=False)
+            else:
+                self._models.move_to_end(system_instruction)
+            return model
+
+    def prepare_request(self, messages, stop_sequences) -> Tuple[str, List[Dict[str, str]], str, genai.types.GenerationConfig]:
+        """
+        Splits messages into the system instruction, the cleaned history and the last message to send.
+        """
         system_messages = list(filter(lambda m : m['role'] == MessageRole.SYSTEM, messages))
-       
         system_instruction = system_messages[0]['content']
         generation_config = genai.types.GenerationConfig(
             max_output_tokens=4096,
@@ -53,72 +80,225 @@ class GeminiEngine:
             top_p=0.9,
             stop_sequences=stop_sequences
         )
-        model = genai.GenerativeModel(self.model_name, system_instruction=system_instruction, generation_config=generation_config)
-        messages_cpy = deepcopy(messages)
-        messages_cpy = list(filter(lambda m : m['role'] != MessageRole.SYSTEM, messages_cpy))
-        messages_cleaned = self.get_clean_message_list(messages_cpy[:-1])
-        chat_session = model.start_chat(history=messages_cleaned)
-        sleep_attempts = 0
-        sleep_time = 2
-        while True:
-            try:
-                response = chat_session.send_message(
-                    messages_cpy[-1]['content']
-                )
-                return response.text
-            except ResourceExhausted as re:
-                sleep_attempts += 1
-                if sleep_attempts > 5:
-                    print(f"ResourceExhausted exception occurred 5 times in a row. Exiting.")
-                    break
-                time.sleep(sleep_time)
-                sleep_time *= (2 + random.uniform(0, 1))
+        if isinstance(messages, PromptMessages):
+            # the cleaned agent memory is memoized, only the messages around it are converted
+            messages_cleaned = messages.clean(self.clean_message, drop_roles=(MessageRole.SYSTEM,))
+        else:
+            messages_cleaned = self.get_clean_message_list(
+                list(filter(lambda m : m['role'] != MessageRole.SYSTEM, messages))
+            )
+        return system_instruction, messages_cleaned[:-1], messages_cleaned[-1]['parts'], generation_config
+
+    def get_cache_key(self, messages, stop_sequences) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            model=self.model_name, messages=messages, stop_sequences=stop_sequences, temperature=0.5, top_p=0.9
+        )
+
+    def record_usage(self, response, estimated_tokens: int, phase=None, latency_s: float = 0.0) -> None:
+        """
+        Corrects the scheduler's token reservation and reports the call's usage, including prompt tokens served
+        from Gemini's implicit prefix cache.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        self.scheduler.record_usage(self.provider, estimated_tokens, getattr(usage, "total_token_count", None))
+        report_usage(gemini_usage(self.provider, self.model_name, phase, usage, latency_s=latency_s))
+
+    def __call__(self, messages, stop_sequences=[], grammar=None, phase=None):
+        cache_key = self.get_cache_key(messages, stop_sequences)
+        if cache_key is not None:
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                report_usage(LLMUsage(self.provider, self.model_name, phase, from_response_cache=True))
+                return cached_response
+        system_instruction, history, last_message, generation_config = self.prepare_request(messages, stop_sequences)
+        chat_session = self.get_model(system_instruction).start_chat(history=history)
+        estimated_tokens = estimate_tokens(messages)
+        # ResourceExhausted is retried by the scheduler and raised once retries run out
+        started = time.perf_counter()
+        response = self.scheduler.call(
+            self.provider,
+            lambda: chat_session.send_message(last_message, generation_config=generation_config),
+            priority=priority_for_phase(phase),
+            estimated_tokens=estimated_tokens,
+        )
+        self.record_usage(response, estimated_tokens, phase, latency_s=time.perf_counter() - started)
+        if cache_key is not None:
+            self.cache.set(cache_key, response.text)
+        return response.text
+
+
+class AsyncGeminiEngine(GeminiEngine):
+    """
+    Async counterpart of `GeminiEngine`: requests go through `generate_content_async` on reused models
+    (no chat session per call), with at most `max_in_flight` requests outstanding.
+    """
+    def __init__(self, model_name="gemini-2.0-flash-exp", cache: Optional[PersistentLLMCache] = None, max_in_flight: int = 64, scheduler: Optional[RateLimitScheduler] = None):
+        super().__init__(model_name=model_name, cache=cache, scheduler=scheduler)
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def __call__(self, messages, stop_sequences=[], grammar=None, phase=None):
+        cache_key = self.get_cache_key(messages, stop_sequences)
+        if cache_key is not None:
+            # the cache is SQLite and may wait for other processes' locks, which must not stall the event loop
+            cached_response = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached_response is not None:
+                report_usage(LLMUsage(self.provider, self.model_name, phase, from_response_cache=True))
+                return cached_response
+        system_instruction, history, last_message, generation_config = self.prepare_request(messages, stop_sequences)
+        contents = history + [{'role': 'user', 'parts': last_message}]
+        model = self.get_model(system_instruction)
+        estimated_tokens = estimate_tokens(messages)
+
+        async def generate():
+            async with self._semaphore:
+                return await model.generate_content_async(contents, generation_config=generation_config)
+
+        started = time.perf_counter()
+        response = await self.scheduler.acall(
+            self.provider, generate, priority=priority_for_phase(phase), estimated_tokens=estimated_tokens
+        )
+        self.record_usage(response, estimated_tokens, phase, latency_s=time.perf_counter() - started)
+        if cache_key is not None:
+            await asyncio.to_thread(self.cache.set, cache_key, response.text)
+        return response.text
 
 class OpenAIEngine:
     role_conversions = {
         MessageRole.TOOL_RESPONSE: MessageRole.USER,
     }
 
-    def __init__(self, model_name="gpt-4o"):
+    provider = "openai"
+
+    def __init__(self, model_name="gpt-4o", cache: Optional[PersistentLLMCache] = None, scheduler: Optional[RateLimitScheduler] = None):
         self.model_name = model_name
+        self.cache = cache
+        self.scheduler = scheduler or get_default_scheduler()
         self.client = OpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
         )
 
+    merge_separator = "\n=======\n"
+
+    def clean_message(self, message: Dict[str, str]) -> Dict[str, str]:
+        if not set(message.keys()) == {"role", "content"}:
+            raise ValueError("Message should contain only 'role' and 'content' keys!")
+
+        role = message["role"]
+        if role not in MessageRole.roles():
+            raise ValueError(f"Incorrect role {role}, only {MessageRole.roles()} are supported for now.")
+
+        return {"role": self.role_conversions.get(role, role), "content": message["content"]}
+
     def get_clean_message_list(self, message_list: List[Dict[str, str]]):
         """
         Subsequent messages with the same role will be concatenated to a single message.
+        The input messages are not modified; for `PromptMessages` the cleaned agent memory is reused.
 
         Args:
             message_list (`List[Dict[str, str]]`): List of chat messages.
         """
-        final_message_list = []
-        message_list = deepcopy(message_list)  # Avoid modifying the original list
-        for message in message_list:
-            if not set(message.keys()) == {"role", "content"}:
-                raise ValueError("Message should contain only 'role' and 'content' keys!")
+        if isinstance(message_list, PromptMessages):
+            return message_list.clean(self.clean_message, self.merge_separator)
+        return append_clean_messages([], message_list, self.clean_message, self.merge_separator)
 
-            role = message["role"]
-            if role not in MessageRole.roles():
-                raise ValueError(f"Incorrect role {role}, only {MessageRole.roles()} are supported for now.")
+    def get_cache_key(self, messages, stop_sequences, grammar) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            model=self.model_name, messages=messages, stop_sequences=stop_sequences, temperature=0.5, response_format=grammar
+        )
 
-            if role in self.role_conversions:
-                message["role"] = self.role_conversions[role]
+    def parse_raw_response(self, raw_response, estimated_tokens: int, phase=None, latency_s: float = 0.0):
+        """
+        Feeds the `x-ratelimit-*` headers and the token usage of a raw response to the scheduler and reports
+        the call's usage. OpenAI caches prompt prefixes automatically, the hits show up as cached prompt tokens.
+        """
+        self.scheduler.record_headers(self.provider, raw_response.headers)
+        response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        self.scheduler.record_usage(self.provider, estimated_tokens, getattr(usage, "total_tokens", None))
+        report_usage(openai_usage(self.provider, self.model_name, phase, usage, latency_s=latency_s))
+        return response
 
-            if len(final_message_list) > 0 and message["role"] == final_message_list[-1]["role"]:
-                final_message_list[-1]["content"] += "\n=======\n" + message["content"]
-            else:
-                final_message_list.append(message)
-        return final_message_list
+    def __call__(self, messages, stop_sequences=[], grammar=None, phase=None):
+        messages = self.get_clean_message_list(messages)
+
+        cache_key = self.get_cache_key(messages, stop_sequences, grammar)
+        if cache_key is not None:
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                report_usage(LLMUsage(self.provider, self.model_name, phase, from_response_cache=True))
+                return cached_response
+
+        estimated_tokens = estimate_tokens(messages)
+        started = time.perf_counter()
+        raw_response = self.scheduler.call(
+            self.provider,
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model_name,
+                messages=messages,
+                stop=stop_sequences,
+                temperature=0.5,
+                response_format=grammar
+            ),
+            priority=priority_for_phase(phase),
+            estimated_tokens=estimated_tokens,
+        )
+        response = self.parse_raw_response(raw_response, estimated_tokens, phase, latency_s=time.perf_counter() - started)
+        content = response.choices[0].message.content
+        if cache_key is not None and content is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+
+class AsyncOpenAIEngine(OpenAIEngine):
+    """
+    Async counterpart of `OpenAIEngine`. Every call goes through one pooled HTTP client
+    and at most `max_in_flight` requests are outstanding at once.
+    """
+    def __init__(self, model_name="gpt-4o", cache: Optional[PersistentLLMCache] = None, max_in_flight: int = 64, scheduler: Optional[RateLimitScheduler] = None):
+        self.model_name = model_name
+        self.cache = cache
+        self.scheduler = scheduler or get_default_scheduler()
+        self.max_in_flight = max_in_flight
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(max_in_flight)
 
-    def __call__(self, messages, stop_sequences=[], grammar=None):
+    async def __call__(self, messages, stop_sequences=[], grammar=None, phase=None):
         messages = self.get_clean_message_list(messages)
 
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            stop=stop_sequences,
-            temperature=0.5,
-            response_format=grammar
+        cache_key = self.get_cache_key(messages, stop_sequences, grammar)
+        if cache_key is not None:
+            cached_response = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached_response is not None:
+                report_usage(LLMUsage(self.provider, self.model_name, phase, from_response_cache=True))
+                return cached_response
+
+        async def create():
+            async with self._semaphore:
+                return await self.client.chat.completions.with_raw_response.create(
+                    model=self.model_name,
+                    messages=messages,
+                    stop=stop_sequences,
+                    temperature=0.5,
+                    response_format=grammar
+                )
+
+        estimated_tokens = estimate_tokens(messages)
+        started = time.perf_counter()
+        raw_response = await self.scheduler.acall(
+            self.provider, create, priority=priority_for_phase(phase), estimated_tokens=estimated_tokens
         )
-        return response.choices[0].message.content
\ No newline at end of file
+        response = self.parse_raw_response(raw_response, estimated_tokens, phase, latency_s=time.perf_counter() - started)
+        content = response.choices[0].message.content
+        if cache_key is not None and content is not None:
+            await asyncio.to_thread(self.cache.set, cache_key, content)
+        return content
@@ -0,0 +1,116 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from smolagents.models import MessageRole
+
+CleanMessageFunc = Callable[[Dict[str, str]], Dict[str, Any]]
+
+
+def step_log_messages(step_log: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Returns the messages a committed step log contributes to the agent memory:
+    the LLM output, then the observation or the error it produced.
+    """
+    messages = []
+    if "llm_output" in step_log:
+        messages.append({"role": MessageRole.ASSISTANT, "content": step_log["llm_output"].strip()})
+    if "error" in step_log:
+        message_content = (
+            "Error:\n"
+            + str(step_log["error"])
+            + "\nNow let's retry: take care not to repeat previous errors! If you have retried several times, try a completely different approach.\n"
+        )
+        messages.append({"role": MessageRole.USER, "content": message_content})
+    elif "observation" in step_log:
+        messages.append({"role": MessageRole.USER, "content": f"Observation:\n{step_log['observation']}"})
+    return messages
+
+
+def append_clean_messages(
+    cleaned: List[Dict[str, Any]],
+    messages: Sequence[Dict[str, str]],
+    clean_message: CleanMessageFunc,
+    merge_separator: Optional[str] = None,
+    drop_roles: Tuple[str, ...] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Cleans `messages` one by one onto `cleaned`. With a `merge_separator`, a message with the same role
+    as the previous one is concatenated to it (into a new dict, so earlier results are never mutated).
+    """
+    for message in messages:
+        if message["role"] in drop_roles:
+            continue
+        clean = clean_message(message)
+        if merge_separator is not None and cleaned and cleaned[-1]["role"] == clean["role"]:
+            content_key = "content" if "content" in clean else "parts"
+            cleaned[-1] = {**cleaned[-1], content_key: cleaned[-1][content_key] + merge_separator + clean[content_key]}
+        else:
+            cleaned.append(clean)
+    return cleaned
+
+
+class AgentMemory:
+    """
+    Append-only conversation memory of an agent run: the task message followed by the messages of every
+    committed step log.
+
+    Messages are never modified once appended, so engines can memoize their cleaned form: `clean` only
+    converts the messages appended since its previous call. Concurrent calls of the same run (see
+    `speculative_planning`) clean under a lock.
+    """
+
+    def __init__(self, task: str):
+        self.messages: List[Dict[str, str]] = [{"role": MessageRole.USER, "content": "Task: " + task}]
+        self._cleaned: Dict[Hashable, Tuple[int, List[Dict[str, Any]]]] = {}
+        self._clean_lock = threading.Lock()
+
+    def append_step_log(self, step_log: Dict[str, Any]):
+        self.messages.extend(step_log_messages(step_log))
+
+    def clean(
+        self,
+        clean_message: CleanMessageFunc,
+        merge_separator: Optional[str] = None,
+        drop_roles: Tuple[str, ...] = (),
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the memory cleaned with `clean_message`, extending the memoized result for that cleaner.
+        The returned list is shared: copy it before modifying it.
+        """
+        key = (getattr(clean_message, "__func__", clean_message), merge_separator, drop_roles)
+        with self._clean_lock:
+            consumed, cleaned = self._cleaned.get(key, (0, []))
+            if consumed < len(self.messages):
+                append_clean_messages(cleaned, self.messages[consumed:], clean_message, merge_separator, drop_roles)
+                self._cleaned[key] = (len(self.messages), cleaned)
+            return cleaned
+
+
+class PromptMessages(list):
+    """
+    A prompt laid out as `head + memory.messages + tail`. It is a plain message list for any engine,
+    while engines aware of it clean only `head` and `tail` and reuse the memoized memory.
+    """
+
+    def __init__(self, head: List[Dict[str, str]], memory: AgentMemory, tail: List[Dict[str, str]]):
+        super().__init__(head + memory.messages + tail)
+        self.head = head
+        self.memory = memory
+        self.tail = tail
+
+    def clean(
+        self,
+        clean_message: CleanMessageFunc,
+        merge_separator: Optional[str] = None,
+        drop_roles: Tuple[str, ...] = (),
+    ) -> List[Dict[str, Any]]:
+        """Same result as cleaning the whole list at once, in O(len(head) + len(tail) + new memory messages)."""
+        cleaned = append_clean_messages([], self.head, clean_message, merge_separator, drop_roles)
+        memory_cleaned = self.memory.clean(clean_message, merge_separator, drop_roles)
+        if memory_cleaned:
+            if merge_separator is not None and cleaned and cleaned[-1]["role"] == memory_cleaned[0]["role"]:
+                append_clean_messages(cleaned, memory_cleaned[:1], lambda message: message, merge_separator)
+                cleaned.extend(memory_cleaned[1:])
+            else:
+                cleaned.extend(memory_cleaned)
+        return append_clean_messages(cleaned, self.tail, clean_message, merge_separator, drop_roles)
@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from smolagents.tools import DEFAULT_TOOL_DESCRIPTION_TEMPLATE, Tool, Toolbox, get_tool_description_with_args
+
+from .tool_wrapper import ValidatedOnceTool
+
+
+@dataclass(frozen=True)
+class _Slot:
+    name: str
+    conversion: Optional[str] = None
+    format_spec: str = ""
+
+
+_FORMATTER = Formatter()
+
+
+class PromptTemplate:
+    """
+    A prompt template precompiled into static text and named slots, so rendering is a single join
+    instead of repeated `str.replace` / `str.format` passes over the whole prompt.
+    """
+
+    def __init__(self, parts: Sequence[Union[str, _Slot]]):
+        # merge adjacent static text so that every static run is a single string
+        self.parts: List[Union[str, _Slot]] = []
+        for part in parts:
+            if isinstance(part, str):
+                if not part:
+                    continue
+                if self.parts and isinstance(self.parts[-1], str):
+                    self.parts[-1] += part
+                    continue
+            self.parts.append(part)
+
+    @classmethod
+    def from_markers(cls, template: str, markers: Dict[str, str]) -> "PromptTemplate":
+        """
+        Compiles a template whose slots are literal markers (e.g. `{"known_facts": "<<known_facts>>"}`),
+        matching chained `str.replace` calls. Markers may occur several times.
+        """
+        parts: List[Union[str, _Slot]] = [template]
+        for name, marker in markers.items():
+            split_parts: List[Union[str, _Slot]] = []
+            for part in parts:
+                if isinstance(part, _Slot):
+                    split_parts.append(part)
+                    continue
+                pieces = part.split(marker)
+                for index, piece in enumerate(pieces):
+                    if index > 0:
+                        split_parts.append(_Slot(name))
+                    split_parts.append(piece)
+            parts = split_parts
+        return cls(parts)
+
+    @classmethod
+    def from_format(cls, template: str) -> "PromptTemplate":
+        """Compiles a `str.format` template: `{name}` fields become slots, `{{` and `}}` are unescaped."""
+        parts: List[Union[str, _Slot]] = []
+        for literal_text, field_name, format_spec, conversion in _FORMATTER.parse(template):
+            parts.append(literal_text)
+            if field_name is not None:
+                parts.append(_Slot(field_name, conversion, format_spec or ""))
+        return cls(parts)
+
+    @staticmethod
+    def _format_value(slot: _Slot, value: Any) -> str:
+        if slot.conversion is not None:
+            value = _FORMATTER.convert_field(value, slot.conversion)
+        return format(value, slot.format_spec)
+
+    def partial(self, **values: Any) -> "PromptTemplate":
+        """Fills some slots once (e.g. per run), folding their values into the static text."""
+        return PromptTemplate([
+            self._format_value(part, values[part.name]) if isinstance(part, _Slot) and part.name in values else part
+            for part in self.parts
+        ])
+
+    def render(self, **values: Any) -> str:
+        return "".join(
+            self._format_value(part, values[part.name]) if isinstance(part, _Slot) else part
+            for part in self.parts
+        )
+
+
+@lru_cache(maxsize=64)
+def compile_marker_template(template: str, markers: Tuple[Tuple[str, str], ...]) -> PromptTemplate:
+    return PromptTemplate.from_markers(template, dict(markers))
+
+
+@lru_cache(maxsize=64)
+def compile_format_template(template: str) -> PromptTemplate:
+    return PromptTemplate.from_format(template)
+
+
+def _tool_description_key(tool: Tool) -> Hashable:
+    if isinstance(tool, ValidatedOnceTool):
+        # name, description, inputs and output type are class constants
+        return type(tool)
+    return (tool.name, tool.description, repr(tool.inputs), tool.output_type)
+
+
+_TOOL_DESCRIPTIONS: Dict[Tuple[str, Hashable], str] = {}
+
+
+def render_tool_description(tool: Tool, tool_description_template: Optional[str] = None) -> str:
+    """`get_tool_description_with_args`, memoized per tool content and template for the whole process."""
+    template = tool_description_template or DEFAULT_TOOL_DESCRIPTION_TEMPLATE
+    key = (template, _tool_description_key(tool))
+    description = _TOOL_DESCRIPTIONS.get(key)
+    if description is None:
+        description = get_tool_description_with_args(tool, template)
+        _TOOL_DESCRIPTIONS[key] = description
+    return description
+
+
+def render_tool_descriptions(toolbox: Toolbox, tool_description_template: Optional[str] = None) -> str:
+    """
+    Same output as `toolbox.show_tool_descriptions`, without re-rendering Jinja for tools already seen.
+    The memo is keyed by tool content, so adding, removing or updating tools never serves a stale block.
+    """
+    return "\n".join(render_tool_description(tool, tool_description_template) for tool in toolbox.tools.values())
+
+
+def format_prompt_with_tools(toolbox: Toolbox, prompt_template: str, tool_description_template: str) -> str:
+    """`smolagents.agents.format_prompt_with_tools` using the memoized tool descriptions."""
+    prompt = prompt_template
+    if "{{tool_descriptions}}" in prompt:
+        prompt = prompt.replace("{{tool_descriptions}}", render_tool_descriptions(toolbox, tool_description_template))
+    if "{{tool_names}}" in prompt:
+        prompt = prompt.replace(
+            "{{tool_names}}",
+            ", ".join([f"'{tool_name}'" for tool_name in toolbox.tools.keys()]),
+        )
+    return prompt
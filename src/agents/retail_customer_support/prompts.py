@@ -585,4 +585,20 @@ This plan should involve individual tasks based on the available tools, that if
 Do not skip steps, do not add any superfluous steps. DO NOT USE ANY TOOL which is NOT mentioned above.
 After writing the final step of the plan, write the '\n<end_plan>' tag and stop there.
 
-Now write your new plan below."""
\ No newline at end of file
+Now write your new plan below."""
+
+# Used when the agent keeps the step system prompt identical across steps (stable prefix first, for provider
+# prompt caching): the facts and the plan are sent after the conversation instead of inside the system prompt.
+STEP_STATE_PLACEHOLDER = "(given at the end of the conversation)"
+
+USER_PROMPT_STEP_STATE = """Here are the facts gathered so far:
+Known Facts:
+{known_facts}
+
+Unknown Facts:
+{unknown_facts}
+
+And the computed plan for your guidance:
+{execution_plan}
+
+Now continue with your next 'Thought:' and 'Action:'."""
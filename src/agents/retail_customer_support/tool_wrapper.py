@@ -1,5 +1,6 @@
 import inspect
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, List, Type
 
 from tau_bench.envs.tool import Tool as TauBenchTool
 from smolagents.tools import Tool
@@ -7,22 +8,41 @@ from smolagents.tools import Tool
 from tau_bench.envs.user import BaseUserSimulationEnv
 
 
-def convert_tool(tau_retail_tool : TauBenchTool, data: Dict[str, Any]) -> Tool:
+class ValidatedOnceTool(Tool):
+    """
+    A `Tool` whose name, description, inputs and `forward` signature are class-level constants, so the smolagents
+    argument validation (signature introspection and JSON schema conversion) only runs for the first instance of each class.
+    """
+
+    def validate_arguments(self):
+        if type(self).__dict__.get("_arguments_validated", False):
+            return
+        super().validate_arguments()
+        type(self)._arguments_validated = True
+
+
+@lru_cache(maxsize=None)
+def get_tool_wrapper_class(tau_retail_tool: Type[TauBenchTool]) -> Type[Tool]:
+    """
+    Builds (once per process) the smolagents tool class wrapping a tau-bench tool. Instances only hold the
+    episode's data; instantiating one does not redo any introspection.
+    """
+    tool_info = tau_retail_tool.get_info()['function']
 
-    class TauRetailToolWrapper(Tool):
-        def __init__(self, tau_retail_tool : TauBenchTool, data: Dict[str, Any]):
-            tool_info = tau_retail_tool.get_info()['function']
-            self.name = tool_info['name']
-            self.description = tool_info['description']
-            self.output_type = "string"
-            self.inputs = tool_info['parameters']['properties']
+    class TauRetailToolWrapper(ValidatedOnceTool):
+        name = tool_info['name']
+        description = tool_info['description']
+        output_type = "string"
+        inputs = tool_info['parameters']['properties']
+
+        def __init__(self, data: Dict[str, Any]):
             self.tau_retail_tool = tau_retail_tool
             self.data = data
             super().__init__()
 
         def forward(self, *args, **kwargs):
             return self.tau_retail_tool.invoke(data=self.data, **kwargs)
-    
+
     original_signature = inspect.signature(tau_retail_tool.invoke)
     new_parameters = [inspect.Parameter("self", inspect.Parameter.POSITIONAL_OR_KEYWORD)] + list(
         original_signature.parameters.values()
@@ -30,10 +50,31 @@ def convert_tool(tau_retail_tool : TauBenchTool, data: Dict[str, Any]) -> Tool:
     new_parameters = list(filter(lambda p : p.name != 'data', new_parameters))
     new_signature = original_signature.replace(parameters=new_parameters)
     TauRetailToolWrapper.forward.__signature__ = new_signature
-    return TauRetailToolWrapper(tau_retail_tool, data)
+    TauRetailToolWrapper.__name__ = TauRetailToolWrapper.__qualname__ = f"{tau_retail_tool.__name__}Wrapper"
+    return TauRetailToolWrapper
+
+
+def convert_tool(tau_retail_tool : TauBenchTool, data: Dict[str, Any]) -> Tool:
+    return get_tool_wrapper_class(tau_retail_tool)(data)
+
+
+class ToolRegistry:
+    """
+    Wrapper classes of a fixed set of tau-bench tools, built and validated when the registry is created.
+    `bind` instantiates them for one episode's data.
+    """
+
+    def __init__(self, tau_retail_tools: List[Type[TauBenchTool]]):
+        self.tool_classes = [get_tool_wrapper_class(tool) for tool in tau_retail_tools]
+        for tool_class in self.tool_classes:
+            # validate each wrapper class up front, outside of any episode
+            tool_class(data={})
+
+    def bind(self, data: Dict[str, Any]) -> List[Tool]:
+        return [tool_class(data) for tool_class in self.tool_classes]
 
 
-class RespondToCustomer(Tool):
+class RespondToCustomer(ValidatedOnceTool):
     name = 'respond_customer'
     description = "Use this function to respond to customer with defined query."
     inputs = {"query": {
@@ -48,4 +89,4 @@ class RespondToCustomer(Tool):
 
     def forward(self, query: str) -> str:
         response = self.user.step(content=query)
-        return response
\ No newline at end of file
+        return response
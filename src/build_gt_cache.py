@@ -0,0 +1,12 @@
+import argparse
+
+from tau_bench.envs.gt_cache import TASK_SPLITS, build_gt_hash_cache
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute ground-truth data hashes for every task split.")
+    parser.add_argument("--env", nargs="+", default=list(TASK_SPLITS), choices=list(TASK_SPLITS))
+    args = parser.parse_args()
+
+    for env_name in args.env:
+        hashes = build_gt_hash_cache(env_name)
+        print(f"{env_name}: {len(hashes)} ground-truth hashes written")
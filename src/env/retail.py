@@ -1,17 +1,19 @@
+import asyncio
 from dataclasses import dataclass
 import json
-from typing import Any, Callable, Dict, List, Type
+from typing import Any, Callable, Dict, List, Optional
 from agents.retail_customer_support.llm_engines import GeminiEngine, OpenAIEngine
-from tau_bench.envs.base import consistent_hash, to_hashable
+from tau_bench.envs.reward import check_actions, check_outputs, diff_against_ground_truth
 from tau_bench.envs.retail.data import load_data
 from tau_bench.envs.retail.tools import ALL_TOOLS
 from tau_bench.envs.retail.wiki import WIKI
-from tau_bench.envs.tool import Tool
 from tau_bench.envs.user import BaseUserSimulationEnv
+from tau_bench.llm_usage import collect_usage
+from tau_bench.metrics import MetricsCollector
 from tau_bench.types import RewardActionInfo, RewardOutputInfo, RewardResult, Task
 from agents.retail_customer_support.tool_wrapper import (
-    convert_tool,
-    RespondToCustomer
+    RespondToCustomer,
+    ToolRegistry
 )
 from smolagents.tools import (
     Toolbox
@@ -20,33 +22,35 @@ from smolagents.tools import (
 from agents.retail_customer_support.agents import (
     RetailSupportMultiStepAgent
 )
+from agents.retail_customer_support.events import EventEmitter, RichConsoleEmitter
 
-from rich.syntax import Syntax
-from rich.console import Group
-from rich.panel import Panel
-from rich.rule import Rule
-from rich.text import Text
-
-from smolagents.utils import (
-    console
-)
+# wrapper classes are built and validated once per process, episodes only bind their dataset
+RETAIL_TOOL_REGISTRY = ToolRegistry(ALL_TOOLS)
+RETAIL_TOOLS_MAP = {tool.get_info()["function"]["name"]: tool for tool in ALL_TOOLS}
 
 @dataclass
 class TaskExecutionResult:
     task: Task
-    computedHash: str
-    groundTruthHash: str
+    # the database hashes and action info are None when missing outputs made the database check unnecessary
+    computedHash: Optional[str]
+    groundTruthHash: Optional[str]
     trajectory: List[Any]
     agentLogs: List[Any]
-    rewardActionInfo: RewardActionInfo
+    rewardActionInfo: Optional[RewardActionInfo]
     rewardOutputInfo: RewardOutputInfo
     rewardResult: RewardResult
+    # usage of the agent's and the user simulator's LLM calls during the episode
+    metrics: Optional[MetricsCollector] = None
+    # position of the task in its split, set by the runner
+    taskId: Optional[int] = None
+    trial: int = 0
+    # field-level differences to the ground-truth database, only for episodes with wrong actions
+    stateDiff: Optional[List[Dict[str, Any]]] = None
 
-def generate_trajectory_and_evaluate_reward(model:str, task: Task, user: BaseUserSimulationEnv, llm_engine: Callable) -> TaskExecutionResult : 
-    dataset = load_data()
-    converted_tools = [convert_tool(tool, dataset) for tool in ALL_TOOLS]
+def build_agent(model: str, dataset: Dict[str, Any], user: BaseUserSimulationEnv, llm_engine: Callable, stable_prefix_first: bool = False, events: Optional[EventEmitter] = None, speculative_planning: bool = False) -> RetailSupportMultiStepAgent:
+    converted_tools = RETAIL_TOOL_REGISTRY.bind(dataset)
     converted_tools.append(RespondToCustomer(user))
-    agent = RetailSupportMultiStepAgent(
+    return RetailSupportMultiStepAgent(
         model=model,
         tool_box=Toolbox(
             tools=converted_tools
@@ -56,62 +60,74 @@ def generate_trajectory_and_evaluate_reward(model:str, task: Task, user: BaseUse
         policy_wiki=WIKI, 
         max_iterations=50, 
         planning_interval=4, 
-        belief_computation_interval=2
+        belief_computation_interval=2,
+        stable_prefix_first=stable_prefix_first,
+        events=events,
+        speculative_planning=speculative_planning
     )
-    console.print(
-            Panel(
-                f"\n[bold]{task.instruction.strip()}\n",
-                title="[bold]New Task Instruction",
-                subtitle=f"{model}",
-                border_style="#d4b702",
-                subtitle_align="left",
-            )
-        )
-    response = user.reset(instruction=task.instruction)
-    agent.run(response)
 
-    data_hash = consistent_hash(to_hashable(dataset))
+def generate_trajectory_and_evaluate_reward(model:str, task: Task, user: BaseUserSimulationEnv, llm_engine: Callable, stable_prefix_first: bool = False, events: Optional[EventEmitter] = None, speculative_planning: bool = False) -> TaskExecutionResult : 
+    dataset = load_data()
+    events = events if events is not None else RichConsoleEmitter()
+    agent = build_agent(model, dataset, user, llm_engine, stable_prefix_first, events, speculative_planning)
+    events.task(model, task.instruction)
+    metrics = MetricsCollector()
+    with collect_usage(metrics.record):
+        response = user.reset(instruction=task.instruction)
+        agent.run(response)
+    return evaluate_reward(task, dataset, agent, metrics)
+
+async def agenerate_trajectory_and_evaluate_reward(model:str, task: Task, user: BaseUserSimulationEnv, llm_engine: Callable, stable_prefix_first: bool = False, events: Optional[EventEmitter] = None, speculative_planning: bool = False) -> TaskExecutionResult : 
+    """
+    Async variant of `generate_trajectory_and_evaluate_reward` for running many episodes on one event loop.
+    The user simulator is synchronous, so its calls run in worker threads.
+    """
+    dataset = load_data()
+    events = events if events is not None else RichConsoleEmitter()
+    agent = build_agent(model, dataset, user, llm_engine, stable_prefix_first, events, speculative_planning)
+    events.task(model, task.instruction)
+    metrics = MetricsCollector()
+    with collect_usage(metrics.record):
+        response = await asyncio.to_thread(user.reset, instruction=task.instruction)
+        await agent.arun(response)
+    return evaluate_reward(task, dataset, agent, metrics)
+
+def evaluate_reward(task: Task, dataset: Dict[str, Any], agent: RetailSupportMultiStepAgent, metrics: Optional[MetricsCollector] = None) -> TaskExecutionResult:
     trajectory = agent.extract_trajectory()
+    tool_calls = [step_log["tool_call"] for step_log in agent.logs if "tool_call" in step_log]
     reward = 1.0
-    new_data = load_data()
-    tools_map: Dict[str, Type[Tool]] = {
-        tool.get_info()["function"]["name"]: tool for tool in ALL_TOOLS
-    }
-    for action in task.actions:
-       tools_map[action.name].invoke(data=new_data, **action.kwargs)
-    gt_data_hash = consistent_hash(to_hashable(new_data))
-    reward_action_info = RewardActionInfo(
-        r_actions=data_hash == gt_data_hash, gt_data_hash=gt_data_hash
-    )
     reward_output_info = None
 
     if len(task.outputs) > 0:
-        # check outputs
-        r_outputs = 1.0
-        outputs = {}
-        for output in task.outputs:
-            found = False
-            for i, step_log in enumerate(agent.logs):
-                if "tool_call" in step_log:
-                    tool_call = step_log["tool_call"]
-                    if tool_call['tool_name'] == 'respond_customer':
-                        responsed_content = tool_call['tool_arguments']['query']
-                        if output.lower() in responsed_content.lower().replace(",", ""):
-                            found = True
-                            break
-            outputs[output] = found
-            if not found:
-                r_outputs = 0.0
-                reward = 0.0
-        reward_output_info = RewardOutputInfo(r_outputs=r_outputs, outputs=outputs)
+        # check outputs first, they are plain substring checks
+        responses = [
+            tool_call['tool_arguments']['query'] for tool_call in tool_calls if tool_call['tool_name'] == 'respond_customer'
+        ]
+        reward_output_info = check_outputs(task.outputs, responses)
+        if not reward_output_info.r_outputs:
+            reward = 0.0
+
+    reward_action_info = None
+    agent_data_hash = gt_data_hash = None
+    state_diff = None
+    if reward:
+        # missing outputs already decide the reward, the database is only checked when they do not
+        reward_action_info, agent_data_hash = check_actions(
+            "retail", task, dataset, [tool_call['tool_name'] for tool_call in tool_calls], RETAIL_TOOLS_MAP
+        )
+        gt_data_hash = reward_action_info.gt_data_hash
+        if not reward_action_info.r_actions:
+            state_diff = diff_against_ground_truth("retail", task, dataset)
     reward_result = RewardResult(reward=reward, info= reward_output_info if reward_output_info else reward_action_info, actions=[])
     return TaskExecutionResult(
         task=task,
-        computedHash=data_hash,
+        computedHash=agent_data_hash,
         groundTruthHash=gt_data_hash,
         trajectory=trajectory,
         agentLogs=agent.logs,
         rewardActionInfo=reward_action_info,
         rewardOutputInfo=reward_output_info,
-        rewardResult=reward_result
+        rewardResult=reward_result,
+        metrics=metrics,
+        stateDiff=state_diff
     )
\ No newline at end of file
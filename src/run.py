@@ -1,30 +1,249 @@
 import argparse
+import asyncio
 import json
 import math
 import os
-from typing import List
+import subprocess
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from datetime import datetime
 from litellm import provider_list
-from env.retail import TaskExecutionResult, generate_trajectory_and_evaluate_reward
-from tau_bench.envs.retail.tasks_dev import TASKS_DEV
-from tau_bench.envs.retail.tasks_test import TASKS_TEST
-from tau_bench.envs.retail.tasks_train import TASKS_TRAIN
-from tau_bench.envs.user import UserStrategy, load_user
-from agents.retail_customer_support.llm_engines import GeminiEngine, OpenAIEngine
+from env.retail import TaskExecutionResult, agenerate_trajectory_and_evaluate_reward, generate_trajectory_and_evaluate_reward
+from tau_bench.envs.task_splits import select_tasks
+from tau_bench.envs.user import BaseUserSimulationEnv, UserStrategy, load_user
+from tau_bench.llm_cache import PersistentLLMCache, cache_sample
+from tau_bench.metrics import MetricsCollector
+from tau_bench.run_manifest import (
+    MANIFEST_FILE_NAME,
+    ManifestEntry,
+    RunManifest,
+    in_shard,
+    latest_entries,
+    manifest_paths,
+    merge_manifests,
+    move_aside,
+    read_manifest,
+    shard_directories,
+    shard_directory,
+)
+from tau_bench.reward_summary import format_task_success_table, pass_hat_k, task_success_counts
+from tau_bench.rate_limit import RateLimitScheduler, set_default_scheduler
+from tau_bench.trajectory_store import COMPRESSIONS, TrajectoryWriter
+from tau_bench.types import Task
+from agents.retail_customer_support.events import EVENT_OUTPUTS, EventEmitter, create_event_emitter
+from agents.retail_customer_support.llm_engines import AsyncGeminiEngine, AsyncOpenAIEngine, GeminiEngine, OpenAIEngine
+
+def trajectory_record(result: TaskExecutionResult) -> Dict[str, Any]:
+    data = {
+        'instruction': result.task.instruction,
+        'trajectory': result.trajectory,
+        'ground_truth_tool_calls': [{'tool_name': action.name, 'tool_arguments': action.kwargs} for action in result.task.actions],
+        'reward_info': {
+            'correct_actions_reward': result.rewardActionInfo.r_actions if result.rewardActionInfo is not None else None,
+            'final_reward': result.rewardResult.reward
+        } 
+    }
+    if result.stateDiff is not None:
+        data['reward_info']['state_diff'] = result.stateDiff
+    if result.metrics is not None:
+        data['metrics'] = result.metrics.summary(include_steps=True)
+    return data
 
 def save_trajectory(result: TaskExecutionResult, file_str: str) :
     with open(file_str, 'w', encoding='utf-8') as f:
-        data = {
-            'instruction': result.task.instruction,
-            'trajectory': result.trajectory,
-            'ground_truth_tool_calls': [{'tool_name': action.name, 'tool_arguments': action.kwargs} for action in result.task.actions],
-            'reward_info': {
-                'correct_actions_reward': result.rewardActionInfo.r_actions,
-                'final_reward': result.rewardResult.reward
-            } 
-        }
-        json.dump(data, f, ensure_ascii=False)
+        json.dump(trajectory_record(result), f, ensure_ascii=False)
+
+_worker_state = threading.local()
+
+def parse_rate_limit(value: str) -> tuple[str, float, Optional[float]]:
+    """Parses `PROVIDER=RPM` or `PROVIDER=RPM:TPM`."""
+    try:
+        provider, limits = value.split("=", 1)
+        rpm, _, tpm = limits.partition(":")
+        return provider, float(rpm), float(tpm) if tpm else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PROVIDER=RPM[:TPM], got {value!r}")
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parses `I/N` (shard I of N, 0 <= I < N)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"expected 0 <= I < N, got {value!r}")
+    return index, count
+
+def worker_shards(shard: Tuple[int, int], workers: int) -> List[Tuple[int, int]]:
+    """Splits shard I of N into `workers` shards of I + N * j of N * workers, which together hold the same tasks."""
+    index, count = shard
+    return [(index + count * worker, count * workers) for worker in range(workers)]
+
+def worker_argv(argv: List[str], shard: Tuple[int, int]) -> List[str]:
+    """The command line of the worker process running `shard`: `argv` with --shard replaced and without --workers."""
+    worker_args = []
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg in ('--workers', '--shard'):
+            skip_value = True
+        elif not arg.startswith(('--workers=', '--shard=')):
+            worker_args.append(arg)
+    return worker_args + ['--shard', f'{shard[0]}/{shard[1]}']
+
+def run_workers(log_dir: str, shards: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Runs every shard in its own process (with its own event loop, connection pools and rate limiter), logging
+    to `worker.log` in the shard's directory, and waits for all of them. Returns the shards that failed.
+    """
+    workers = []
+    for shard in shards:
+        directory = shard_directory(log_dir, shard)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'worker.log'), 'ab') as log:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), *worker_argv(sys.argv[1:], shard)],
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        workers.append((shard, process))
+    failed = []
+    for shard, process in workers:
+        returncode = process.wait()
+        print(f"shard {shard[0]}/{shard[1]} finished with exit code {returncode}")
+        if returncode != 0:
+            failed.append(shard)
+    return failed
+
+def report_rewards(rewards: List[ManifestEntry], num_trials: int, run_metrics: MetricsCollector, log_dir: str, time_str: str) -> None:
+    """Prints the REWARD SUMMARY of the finished episodes and writes the metrics and rewards files to `log_dir`."""
+    print("\n\n>>>>>>>>>> REWARD SUMMARY >>>>>>>>>>>>>")
+    r_actions = 0.0
+    r_total = 0.0
+    for r in rewards:
+        if r.r_actions is not None:
+            r_actions += r.r_actions
+        r_total += r.reward
+    print('total_executions: ' + str(len(rewards)))
+    print('total_actions rewards: ' + str(r_actions))
+    print('total rewards: ' + str(r_total))
+    task_counts = task_success_counts(rewards)
+    pass_hat_ks = pass_hat_k(task_counts, num_trials)
+    if num_trials > 1:
+        for k, pass_k in pass_hat_ks.items():
+            print(f'pass^{k}: {pass_k:.4f}')
+        print('success rate per task:')
+        print(format_task_success_table(task_counts))
+    print('llm usage:')
+    print(run_metrics.format_table())
+    print(">>>>>>>>>> REWARD SUMMARY >>>>>>>>>>>>>")
+    with open(f"{log_dir}/metrics_{time_str}.json", 'w', encoding='utf-8') as f:
+        json.dump(run_metrics.summary(), f)
+    with open(f"{log_dir}/rewards_{time_str}.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            'pass_hat_k': pass_hat_ks,
+            'tasks': [
+                {'split': split, 'task_id': task_id, 'successes': successes, 'trials': trials}
+                for (split, task_id), (successes, trials) in task_counts.items()
+            ],
+        }, f)
+
+def get_worker_user(args: argparse.Namespace, llm_cache: Optional[PersistentLLMCache] = None) -> BaseUserSimulationEnv:
+    # user simulators keep the conversation in `self.messages`, so each worker thread needs its own
+    user = getattr(_worker_state, 'user', None)
+    if user is None:
+        user = load_user(
+            user_strategy=args.user_strategy, model=args.user_model, provider=args.user_model_provider, cache=llm_cache
+        )
+        _worker_state.user = user
+    return user
+
+def report_failed_episode(task_id: int, trial: int) -> None:
+    """Prints the traceback of the exception being handled for an episode that did not finish."""
+    print(f"episode of task {task_id} (trial {trial}) failed, it is not recorded:\n{traceback.format_exc()}", file=sys.stderr)
+
+def run_tasks(episodes: List[Tuple[int, int, Task]], args: argparse.Namespace, agent_engine: Callable, events: EventEmitter, llm_cache: Optional[PersistentLLMCache] = None) -> Iterator[TaskExecutionResult]:
+    """
+    Runs the (task id, trial, task) episodes on a pool of `args.max_concurrency` worker threads, in order,
+    and yields results as they finish. An episode that raises is reported and skipped; if the run itself is
+    interrupted, episodes that have not started are cancelled.
+    """
+    def run_task(task_id: int, trial: int, task: Task) -> Optional[TaskExecutionResult]:
+        try:
+            # trials are independent samples, they must not replay each other's cached responses
+            with cache_sample(trial):
+                result = generate_trajectory_and_evaluate_reward(
+                    model=args.model, 
+                    task=task, 
+                    user=get_worker_user(args, llm_cache), 
+                    llm_engine=agent_engine,
+                    stable_prefix_first=args.stable_prefix_first,
+                    events=events.bind(task_id=task_id, trial=trial),
+                    speculative_planning=args.speculative_planning
+                )
+        except Exception:
+            report_failed_episode(task_id, trial)
+            return None
+        result.taskId = task_id
+        result.trial = trial
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=args.max_concurrency)
+    try:
+        futures = [executor.submit(run_task, task_id, trial, task) for task_id, trial, task in episodes]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None:
+                yield result
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+async def arun_tasks(episodes: List[Tuple[int, int, Task]], args: argparse.Namespace, agent_engine: Callable, on_result: Callable[[TaskExecutionResult], None], events: EventEmitter, llm_cache: Optional[PersistentLLMCache] = None):
+    """
+    Runs up to `args.max_concurrency` episodes at once on the current event loop and hands results to `on_result` as they finish;
+    an episode that raises is reported and skipped.
+    Each concurrent slot owns one user simulator; the synchronous user calls run on a thread pool of the same size.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.max_concurrency))
+    users: asyncio.Queue = asyncio.Queue()
+    for _ in range(min(args.max_concurrency, len(episodes))):
+        users.put_nowait(None)
+
+    async def run_task(task_id: int, trial: int, task: Task) -> Optional[TaskExecutionResult]:
+        user = await users.get()
+        try:
+            if user is None:
+                user = await asyncio.to_thread(
+                    load_user, user_strategy=args.user_strategy, model=args.user_model, provider=args.user_model_provider, cache=llm_cache
+                )
+            with cache_sample(trial):
+                result = await agenerate_trajectory_and_evaluate_reward(
+                    model=args.model, 
+                    task=task, 
+                    user=user, 
+                    llm_engine=agent_engine,
+                    stable_prefix_first=args.stable_prefix_first,
+                    events=events.bind(task_id=task_id, trial=trial),
+                    speculative_planning=args.speculative_planning
+                )
+            result.taskId = task_id
+            result.trial = trial
+            return result
+        except Exception:
+            report_failed_episode(task_id, trial)
+            return None
+        finally:
+            users.put_nowait(user)
+
+    for future in asyncio.as_completed([run_task(task_id, trial, task) for task_id, trial, task in episodes]):
+        result = await future
+        if result is not None:
+            on_result(result)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -70,8 +289,134 @@ if __name__ == '__main__':
         choices=["train", "test", "dev"],
         help="The split of tasks to run (only applies to the retail domain for now",
     )
+    parser.add_argument("--user-id", type=str, default=None, help="Only run the tasks of this user (within the index range).")
+    parser.add_argument(
+        "--tools",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Only run the tasks whose ground-truth actions call any of these tools, e.g. exchange_delivered_order_items.",
+    )
+    parser.add_argument(
+        "--outputs",
+        type=str,
+        default="any",
+        choices=["any", "with", "without"],
+        help="Only run the tasks with (or without) expected outputs.",
+    )
     parser.add_argument("--log-dir", type=str, default="results")
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=1,
+        help="Number of episodes to run in parallel (each worker gets its own user simulator).",
+    )
+    parser.add_argument(
+        "--llm-cache-dir",
+        type=str,
+        default=None,
+        help="Directory of a persistent LLM response cache shared by the agent and the user simulator (disabled by default). "
+        "Responses are cached per trial, so --num-trials still samples independent episodes.",
+    )
+    parser.add_argument(
+        "--async-engine",
+        action="store_true",
+        help="Drive all episodes from one event loop with the async LLM engines instead of one thread per episode.",
+    )
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Maximum concurrent requests of the async LLM engine.")
+    parser.add_argument("--llm-cache-max-mb", type=int, default=1024, help="Size bound of the LLM response cache.")
+    parser.add_argument(
+        "--rate-limit",
+        type=parse_rate_limit,
+        action="append",
+        default=[],
+        metavar="PROVIDER=RPM[:TPM]",
+        help="Requests (and tokens) per minute allowed for a provider, shared by the agent and the user simulator. "
+        "Without it, limits are learned from the provider's rate limit headers.",
+    )
+    parser.add_argument("--max-retries", type=int, default=6, help="Retries of a rate-limited LLM call before giving up.")
+    parser.add_argument(
+        "--stable-prefix-first",
+        action="store_true",
+        help="Keep the agent's step system prompt identical across steps and send the facts and plan after the "
+        "conversation, so provider prompt caching also covers the conversation history (changes the prompt layout).",
+    )
+    parser.add_argument(
+        "--speculative-planning",
+        action="store_true",
+        help="While the agent recomputes its beliefs, already run the plan (or action) call with the previous beliefs "
+        "and keep it if the new beliefs hold the same facts; saves a round trip per hit, costs a call per miss.",
+    )
+    parser.add_argument(
+        "--trajectory-format",
+        type=str,
+        default="jsonl",
+        choices=["jsonl", "json"],
+        help="jsonl appends episodes to rotating shards in --log-dir with an index.jsonl (task id, split, reward, "
+        "offset); json writes one file per episode.",
+    )
+    parser.add_argument("--shard-max-mb", type=int, default=256, help="Size at which a trajectory shard is rotated.")
+    parser.add_argument(
+        "--trajectory-compression",
+        type=str,
+        default="none",
+        choices=list(COMPRESSIONS),
+        help="Compression of trajectory shards (zstd needs the zstandard package).",
+    )
+    parser.add_argument("--fsync-interval", type=float, default=5.0, help="Seconds between fsyncs of the trajectory shards.")
+    parser.add_argument(
+        "--events",
+        type=str,
+        default="rich",
+        choices=list(EVENT_OUTPUTS),
+        help="Where the agents' steps, thoughts, actions, observations, beliefs and plans go: rendered on the console "
+        "(rich), appended as JSON lines to --log-dir/events_<time>.jsonl, or nowhere (none).",
+    )
+    parser.add_argument(
+        "--num-trials",
+        type=int,
+        default=1,
+        help="Independent episodes per task; the summary reports pass^k and per-task success rates.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the run recorded in --log-dir/manifest.jsonl: finished tasks are skipped and the summary "
+        "includes their recorded rewards.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Only run the selected tasks whose task id modulo N is I, writing to --log-dir/shard-I-of-N. Shards can "
+        "run on different machines that share --log-dir.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Run the selected tasks (of --shard, if given) in this many processes, one shard each, then merge their "
+        "manifests into --log-dir/manifest.jsonl and print the combined summary.",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Do not run anything: merge the shard manifests in --log-dir and print the summary of the selected tasks.",
+    )
     args = parser.parse_args()
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1")
+    if args.num_trials < 1:
+        parser.error("--num-trials must be at least 1")
+    if args.max_concurrency > 1 and args.user_strategy == UserStrategy.HUMAN.value:
+        parser.error("--max-concurrency > 1 is not supported with the human user strategy")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.user_strategy == UserStrategy.HUMAN.value:
+        parser.error("--workers > 1 is not supported with the human user strategy")
+    if args.workers > 1 and args.merge:
+        parser.error("--merge does not run episodes, it cannot be combined with --workers")
     print(args)
 
     time_str = datetime.now().strftime("%m%d%H%M%S")
@@ -79,45 +424,167 @@ if __name__ == '__main__':
     if not os.path.exists(args.log_dir):
         os.makedirs(args.log_dir)
 
-    user = load_user(
-            user_strategy=args.user_strategy, model=args.user_model, provider=args.user_model_provider
-        )
-    
-    if args.model_provider == 'openai':
-        agent_engine = OpenAIEngine(model_name=args.model)
+    # only the selected tasks of the split are parsed; indices behave like a slice of the split
+    tasks = select_tasks(
+        'retail',
+        args.task_split,
+        args.start_index,
+        args.end_index,
+        user_id=args.user_id,
+        tools=args.tools,
+        has_outputs={'any': None, 'with': True, 'without': False}[args.outputs],
+    )
+    if args.shard is not None:
+        tasks = [(task_id, task) for task_id, task in tasks if in_shard(task_id, args.shard)]
+    # trial-major order: trials of the same task are len(tasks) episodes apart, so they are rarely in flight
+    # together and a task's (identical) prompts do not hit the provider in bursts
+    episodes = [(task_id, trial, task) for trial in range(args.num_trials) for task_id, task in tasks]
+    requested = {(args.task_split, task_id, trial) for task_id, trial, _ in episodes}
+
+    # changing any of these makes earlier episodes incomparable, the task range may change between resumes
+    run_config = {
+        'model': args.model,
+        'model_provider': args.model_provider,
+        'user_model': args.user_model,
+        'user_model_provider': args.user_model_provider,
+        'user_strategy': args.user_strategy,
+        'task_split': args.task_split,
+        'stable_prefix_first': args.stable_prefix_first,
+    }
+
+    if args.workers > 1 or args.merge:
+        failed = []
+        if args.workers > 1:
+            shards = worker_shards(args.shard or (0, 1), args.workers)
+            if not args.resume:
+                # the merged manifest is rebuilt from the shards, and shards of another layout (left by an
+                # earlier run) are not part of this run; machines sharing --log-dir must use the same --workers
+                move_aside(os.path.join(args.log_dir, MANIFEST_FILE_NAME))
+                for directory in shard_directories(args.log_dir):
+                    if not directory.endswith(f"-of-{shards[0][1]}"):
+                        move_aside(os.path.join(directory, MANIFEST_FILE_NAME))
+            print(f"running {len(episodes)} episodes in {args.workers} worker processes, logs in {args.log_dir}/shard-*/worker.log")
+            failed = run_workers(args.log_dir, shards)
+        try:
+            merged_entries = merge_manifests(args.log_dir, run_config)
+        except ValueError as e:
+            parser.error(str(e))
+        rewards = [entry for entry in merged_entries if entry.key in requested]
+        run_metrics = MetricsCollector(keep_calls=False)
+        for entry in rewards:
+            if entry.usage is not None:
+                run_metrics.merge_summary(entry.usage)
+        report_rewards(rewards, args.num_trials, run_metrics, args.log_dir, time_str)
+        if failed:
+            sys.exit(
+                f"shards {', '.join(f'{index}/{count}' for index, count in failed)} failed (see their worker.log), "
+                "rerun with --resume to finish them"
+            )
+        sys.exit(0)
+
+    log_dir = shard_directory(args.log_dir, args.shard) if args.shard is not None else args.log_dir
+
+    scheduler = RateLimitScheduler(max_retries=args.max_retries)
+    for provider, requests_per_minute, tokens_per_minute in args.rate_limit:
+        scheduler.configure(provider, requests_per_minute, tokens_per_minute)
+    set_default_scheduler(scheduler)
+
+    llm_cache = None
+    if args.llm_cache_dir is not None:
+        llm_cache = PersistentLLMCache(args.llm_cache_dir, max_size_bytes=args.llm_cache_max_mb * 1024 * 1024)
+
+    if args.model_provider == 'openai' and args.async_engine:
+        agent_engine = AsyncOpenAIEngine(model_name=args.model, cache=llm_cache, max_in_flight=args.max_in_flight)
+    elif args.model_provider == 'openai':
+        agent_engine = OpenAIEngine(model_name=args.model, cache=llm_cache)
+    elif args.model_provider == 'google' and args.async_engine:
+        agent_engine = AsyncGeminiEngine(model_name=args.model, cache=llm_cache, max_in_flight=args.max_in_flight)
     elif args.model_provider == 'google':
-        agent_engine = GeminiEngine(model_name=args.model)
+        agent_engine = GeminiEngine(model_name=args.model, cache=llm_cache)
     else:
         raise NotImplementedError('provider is not supported yet, please free feel to implement it.')
     
-    if args.task_split == 'train':
-        tasks = TASKS_TRAIN[args.start_index:args.end_index]
-    elif args.task_split == 'dev':
-        tasks = TASKS_DEV[args.start_index:args.end_index]
-    else:
-        tasks = TASKS_TEST[args.start_index:args.end_index]
-    rewards = []
-    
-    for task in tasks:
-        task_reward = generate_trajectory_and_evaluate_reward(
-            model=args.model, 
-            task=task, 
-            user=user, 
-            llm_engine=agent_engine
+    try:
+        manifest = RunManifest(log_dir, run_config, resume=args.resume)
+        # on resume, episodes finished in the run's other manifests count as well, e.g. those of shards of
+        # another layout or those merged into --log-dir/manifest.jsonl
+        other_entries = [
+            entry
+            for path in (manifest_paths(args.log_dir) if args.resume else [])
+            if os.path.abspath(path) != os.path.abspath(manifest.path)
+            for entry in read_manifest(path, run_config)
+        ]
+    except ValueError as e:
+        parser.error(str(e))
+    completed = manifest.completed() | {entry.key for entry in other_entries}
+    if completed & requested:
+        print(f"resuming: {len(completed & requested)} of {len(episodes)} episodes already finished")
+    episodes = [
+        (task_id, trial, task) for task_id, trial, task in episodes if (args.task_split, task_id, trial) not in completed
+    ]
+    run_metrics = MetricsCollector(keep_calls=False)
+    for entry in latest_entries(manifest.entries + other_entries):
+        if entry.key in requested and entry.usage is not None:
+            run_metrics.merge_summary(entry.usage)
+    trajectory_writer = None
+    if args.trajectory_format == 'jsonl':
+        trajectory_writer = TrajectoryWriter(
+            log_dir,
+            prefix=f"trajectories-{args.task_split}-{time_str}",
+            max_shard_bytes=args.shard_max_mb * 1024 * 1024,
+            compression=args.trajectory_compression,
+            fsync_interval_s=args.fsync_interval,
         )
-        rewards.append(task_reward)
+
+    def on_result(task_reward: TaskExecutionResult):
+        if task_reward.metrics is not None:
+            run_metrics.merge(task_reward.metrics)
         # print(f"Task Instruction:\n{task.instruction}\n")
         # print(f"Task rewards: {task_reward.rewardActionInfo.r_actions}")
-        file_str = f"{args.log_dir}/{task_reward.computedHash}_{time_str}.json"
-        save_trajectory(task_reward, file_str)
+        if trajectory_writer is not None:
+            record = {
+                'task_id': task_reward.taskId,
+                'trial': task_reward.trial,
+                'split': args.task_split,
+                **trajectory_record(task_reward),
+            }
+            trajectory_writer.write(
+                record,
+                task_id=task_reward.taskId,
+                split=args.task_split,
+                reward=task_reward.rewardResult.reward,
+                trial=task_reward.trial,
+            )
+        else:
+            trial_str = f"_trial{task_reward.trial}" if args.num_trials > 1 else ""
+            file_str = f"{log_dir}/{task_reward.computedHash or f'task{task_reward.taskId}'}_{time_str}{trial_str}.json"
+            save_trajectory(task_reward, file_str)
+        # recorded last: an episode only counts as finished once its trajectory is written
+        manifest.record(ManifestEntry(
+            split=args.task_split,
+            task_id=task_reward.taskId,
+            trial=task_reward.trial,
+            reward=task_reward.rewardResult.reward,
+            r_actions=task_reward.rewardActionInfo.r_actions if task_reward.rewardActionInfo is not None else None,
+            usage=task_reward.metrics.summary() if task_reward.metrics is not None else None,
+        ))
+
+    events = create_event_emitter(args.events, f"{log_dir}/events_{time_str}.jsonl")
+    try:
+        if args.async_engine:
+            asyncio.run(arun_tasks(episodes, args, agent_engine, on_result, events, llm_cache))
+        else:
+            for task_reward in run_tasks(episodes, args, agent_engine, events, llm_cache):
+                on_result(task_reward)
+    finally:
+        if trajectory_writer is not None:
+            trajectory_writer.close()
+        manifest.close()
+        events.close()
+        if llm_cache is not None:
+            llm_cache.flush()
     
-    print("\n\n>>>>>>>>>> REWARD SUMMARY >>>>>>>>>>>>>")
-    r_actions = 0.0
-    r_total = 0.0
-    for r in rewards:
-        r_actions += r.rewardActionInfo.r_actions
-        r_total += r.rewardResult.reward
-    print('total_executions: ' + str(len(rewards)))
-    print('total_actions rewards: ' + str(r_actions))
-    print('total rewards: ' + str(r_total))
-    print(">>>>>>>>>> REWARD SUMMARY >>>>>>>>>>>>>")
\ No newline at end of file
+    rewards = [entry for entry in latest_entries(manifest.entries + other_entries) if entry.key in requested]
+    if len(rewards) < len(requested):
+        print(f"{len(requested) - len(rewards)} of {len(requested)} episodes did not finish, rerun with --resume to retry them")
+    report_rewards(rewards, args.num_trials, run_metrics, log_dir, time_str)
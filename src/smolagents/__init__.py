@@ -16,10 +16,49 @@
 # limitations under the License.
 __version__ = "1.1.0.dev0"
 
+import importlib
 from typing import TYPE_CHECKING
 
-from transformers.utils import _LazyModule
-from transformers.utils.import_utils import define_import_structure
+
+# submodule -> public names, imported on first access so that e.g. `smolagents.tools` does not load transformers
+_import_structure = {
+    "agents": ["ManagedAgent", "MultiStepAgent", "CodeAgent", "ToolCallingAgent", "Toolbox"],
+    "default_tools": [
+        "PythonInterpreterTool",
+        "FinalAnswerTool",
+        "UserInputTool",
+        "DuckDuckGoSearchTool",
+        "GoogleSearchTool",
+        "VisitWebpageTool",
+        "SpeechToTextTool",
+    ],
+    "gradio_ui": ["stream_to_gradio", "GradioUI"],
+    "models": [
+        "MessageRole",
+        "tool_role_conversions",
+        "get_clean_message_list",
+        "Model",
+        "TransformersModel",
+        "HfApiModel",
+        "LiteLLMModel",
+    ],
+    "local_python_executor": ["evaluate_python_code", "LocalPythonInterpreter"],
+    "e2b_executor": ["E2BExecutor"],
+    "monitoring": ["Monitor"],
+    "prompts": [
+        "USER_PROMPT_PLAN_UPDATE",
+        "PLAN_UPDATE_FINAL_PLAN_REDACTION",
+        "SINGLE_STEP_CODE_SYSTEM_PROMPT",
+        "CODE_SYSTEM_PROMPT",
+        "TOOL_CALLING_SYSTEM_PROMPT",
+        "MANAGED_AGENT_PROMPT",
+    ],
+    "tools": ["AUTHORIZED_TYPES", "Tool", "tool", "load_tool", "launch_gradio_demo", "Toolbox", "ToolCollection"],
+    "types": ["AgentType", "AgentImage", "AgentText", "AgentAudio"],
+    "utils": ["AgentError"],
+}
+_name_to_module = {name: module for module, names in _import_structure.items() for name in names}
+__all__ = ["__version__", *_name_to_module]
 
 
 if TYPE_CHECKING:
@@ -36,16 +75,13 @@ if TYPE_CHECKING:
     from .utils import *
 
 
-else:
-    import sys
+def __getattr__(name):
+    if name in _name_to_module:
+        value = getattr(importlib.import_module(f".{_name_to_module[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-    _file = globals()["__file__"]
-    import_structure = define_import_structure(_file)
-    import_structure[""] = {"__version__": __version__}
-    sys.modules[__name__] = _LazyModule(
-        __name__,
-        _file,
-        import_structure,
-        module_spec=__spec__,
-        extra_objects={"__version__": __version__},
-    )
+def __dir__():
+    return sorted(set(globals()) | set(_name_to_module))
@@ -17,24 +17,20 @@
 from copy import deepcopy
 from enum import Enum
 import json
-from typing import Dict, List, Optional
-from transformers import (
-    AutoTokenizer,
-    AutoModelForCausalLM,
-    StoppingCriteria,
-    StoppingCriteriaList,
-)
-
-import litellm
+from typing import TYPE_CHECKING, Dict, List, Optional
+
 import logging
 import os
 import random
 
-from huggingface_hub import InferenceClient
-
+# transformers, litellm and huggingface_hub are imported by the models that use them, so that importing
+# `MessageRole` does not pull in torch
 from .tools import Tool
 from .utils import parse_json_tool_call
 
+if TYPE_CHECKING:
+    from transformers import StoppingCriteriaList
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_JSONAGENT_REGEX_GRAMMAR = {
@@ -227,6 +223,8 @@ class HfApiModel(Model):
         self.model_id = model_id
         if token is None:
             token = os.getenv("HF_TOKEN")
+        from huggingface_hub import InferenceClient
+
         self.client = InferenceClient(self.model_id, token=token, timeout=timeout)
 
     def generate(
@@ -293,6 +291,8 @@ class TransformersModel(Model):
                 f"`model_id`not provided, using this default tokenizer for token counts: '{model_id}'"
             )
         self.model_id = model_id
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(model_id)
             self.model = AutoModelForCausalLM.from_pretrained(model_id)
@@ -303,7 +303,9 @@ class TransformersModel(Model):
             self.tokenizer = AutoTokenizer.from_pretrained(default_model_id)
             self.model = AutoModelForCausalLM.from_pretrained(default_model_id)
 
-    def make_stopping_criteria(self, stop_sequences: List[str]) -> StoppingCriteriaList:
+    def make_stopping_criteria(self, stop_sequences: List[str]) -> "StoppingCriteriaList":
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
         class StopOnStrings(StoppingCriteria):
             def __init__(self, stop_strings: List[str], tokenizer):
                 self.stop_strings = stop_strings
@@ -418,6 +420,8 @@ class LiteLLMModel(Model):
     ):
         super().__init__()
         self.model_id = model_id
+        import litellm
+
         # IMPORTANT - Set this to TRUE to add the function to the prompt for Non OpenAI LLMs
         litellm.add_function_to_prompt = True
         self.api_base = api_base
@@ -434,6 +438,8 @@ class LiteLLMModel(Model):
             messages, role_conversions=tool_role_conversions
         )
 
+        import litellm
+
         response = litellm.completion(
             model=self.model_id,
             messages=messages,
@@ -456,6 +462,8 @@ class LiteLLMModel(Model):
         messages = get_clean_message_list(
             messages, role_conversions=tool_role_conversions
         )
+        import litellm
+
         response = litellm.completion(
             model=self.model_id,
             messages=messages,
@@ -21,34 +21,16 @@ import json
 import os
 import sys
 import tempfile
-import torch
 import textwrap
 from functools import lru_cache, wraps
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Union, get_type_hints
-from huggingface_hub import (
-    create_repo,
-    get_collection,
-    hf_hub_download,
-    metadata_update,
-    upload_folder,
-)
-from huggingface_hub.utils import RepositoryNotFoundError
 from packaging import version
 import logging
-from transformers.utils import (
-    TypeHintParsingException,
-    cached_file,
-    get_json_schema,
-    is_accelerate_available,
-    is_torch_available,
-)
-from transformers.utils.chat_template_utils import _parse_type_hint
-
-from transformers.dynamic_module_utils import get_imports
-from transformers import AutoProcessor
-
-from .types import ImageType, handle_agent_input_types, handle_agent_output_types
+
+# torch, transformers, huggingface_hub and .types are only imported by the code paths that need them (Hub
+# loading/saving, pipeline tools, input/output sanitization), so defining and calling tools stays lightweight
+from ._function_type_hints_utils import TypeHintParsingException, _parse_type_hint
 from .utils import instance_to_source
 from .tool_validation import validate_tool_attributes, MethodChecker
 
@@ -56,17 +38,13 @@ from .tool_validation import validate_tool_attributes, MethodChecker
 logger = logging.getLogger(__name__)
 
 
-if is_torch_available():
-    pass
-
-if is_accelerate_available():
-    pass
-
-
 TOOL_CONFIG_FILE = "tool_config.json"
 
 
 def get_repo_type(repo_id, repo_type=None, **hub_kwargs):
+    from huggingface_hub import hf_hub_download
+    from huggingface_hub.utils import RepositoryNotFoundError
+
     if repo_type is not None:
         return repo_type
     try:
@@ -237,6 +215,8 @@ class Tool:
         if not self.is_initialized:
             self.setup()
         if sanitize_inputs_outputs:
+            from .types import handle_agent_input_types, handle_agent_output_types
+
             args, kwargs = handle_agent_input_types(*args, **kwargs)
         outputs = self.forward(*args, **kwargs)
         if sanitize_inputs_outputs:
@@ -344,6 +324,8 @@ class Tool:
         # Save requirements file
         requirements_file = os.path.join(output_dir, "requirements.txt")
 
+        from transformers.dynamic_module_utils import get_imports
+
         imports = []
         for module in [tool_file]:
             imports.extend(get_imports(module))
@@ -392,6 +374,8 @@ class Tool:
             create_pr (`bool`, *optional*, defaults to `False`):
                 Whether or not to create a PR with the uploaded files or directly commit.
         """
+        from huggingface_hub import create_repo, metadata_update, upload_folder
+
         repo_url = create_repo(
             repo_id=repo_id,
             token=token,
@@ -455,6 +439,7 @@ class Tool:
                 others will be passed along to its init.
         """
         assert trust_remote_code, "Loading a tool from Hub requires to trust remote code. Make sure you've inspected the repo and pass `trust_remote_code=True` to load the tool."
+        from transformers.utils import cached_file
 
         hub_kwargs_names = [
             "cache_dir",
@@ -627,6 +612,7 @@ class Tool:
 
             def sanitize_argument_for_prediction(self, arg):
                 from gradio_client.utils import is_http_url_like
+                from .types import ImageType
 
                 if isinstance(arg, ImageType):
                     temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
@@ -906,6 +892,8 @@ class ToolCollection:
     """
 
     def __init__(self, collection_slug: str, token: Optional[str] = None):
+        from huggingface_hub import get_collection
+
         self._collection = get_collection(collection_slug, token=token)
         self._hub_repo_ids = {
             item.item_id for item in self._collection.items if item.item_type == "space"
@@ -921,6 +909,8 @@ def tool(tool_function: Callable) -> Tool:
         tool_function: Your function. Should have type hints for each input and a type hint for the output.
         Should also have a docstring description including an 'Args:' part where each argument is described.
     """
+    from transformers.utils import get_json_schema
+
     parameters = get_json_schema(tool_function)["function"]
     if "return" not in parameters:
         raise TypeHintParsingException(
@@ -1091,9 +1081,10 @@ class PipelineTool(Tool):
             Any additional keyword argument to send to the methods that will load the data from the Hub.
     """
 
-    pre_processor_class = AutoProcessor
+    # None stands for `transformers.AutoProcessor`, resolved in `setup`
+    pre_processor_class = None
     model_class = None
-    post_processor_class = AutoProcessor
+    post_processor_class = None
     default_checkpoint = None
     description = "This is a pipeline tool"
     name = "pipeline"
@@ -1112,6 +1103,8 @@ class PipelineTool(Tool):
         token=None,
         **hub_kwargs,
     ):
+        from transformers.utils import is_accelerate_available, is_torch_available
+
         if not is_torch_available():
             raise ImportError("Please install torch in order to use this tool.")
 
@@ -1145,9 +1138,10 @@ class PipelineTool(Tool):
         Instantiates the `pre_processor`, `model` and `post_processor` if necessary.
         """
         from accelerate import PartialState
+        from transformers import AutoProcessor
 
         if isinstance(self.pre_processor, str):
-            self.pre_processor = self.pre_processor_class.from_pretrained(
+            self.pre_processor = (self.pre_processor_class or AutoProcessor).from_pretrained(
                 self.pre_processor, **self.hub_kwargs
             )
 
@@ -1159,7 +1153,7 @@ class PipelineTool(Tool):
         if self.post_processor is None:
             self.post_processor = self.pre_processor
         elif isinstance(self.post_processor, str):
-            self.post_processor = self.post_processor_class.from_pretrained(
+            self.post_processor = (self.post_processor_class or AutoProcessor).from_pretrained(
                 self.post_processor, **self.hub_kwargs
             )
 
@@ -1184,6 +1178,8 @@ class PipelineTool(Tool):
         """
         Sends the inputs through the `model`.
         """
+        import torch
+
         with torch.no_grad():
             return self.model(**inputs)
 
@@ -1194,6 +1190,8 @@ class PipelineTool(Tool):
         return self.post_processor(outputs)
 
     def __call__(self, *args, **kwargs):
+        from .types import handle_agent_input_types, handle_agent_output_types
+
         args, kwargs = handle_agent_input_types(*args, **kwargs)
 
         if not self.is_initialized:
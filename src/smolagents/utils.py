@@ -18,13 +18,12 @@ import json
 import re
 from typing import Tuple, Dict, Union
 import ast
+import importlib.util
 from rich.console import Console
 import inspect
 import types
 
-from transformers.utils.import_utils import _is_package_available
-
-_pygments_available = _is_package_available("pygments")
+_pygments_available = importlib.util.find_spec("pygments") is not None
 
 
 def is_pygments_available():
@@ -5,6 +5,7 @@ from tau_bench.envs.airline.rules import RULES
 from tau_bench.envs.airline.tools import ALL_TOOLS
 from tau_bench.envs.airline.wiki import WIKI
 from tau_bench.envs.base import Env
+from tau_bench.envs.task_splits import load_tasks
 from typing import Optional, Union
 from tau_bench.envs.user import UserStrategy
 
@@ -18,11 +19,7 @@ class MockAirlineDomainEnv(Env):
         task_split: str = "test",
         task_index: Optional[int] = None,
     ):
-        match task_split:
-            case "test":
-                from tau_bench.envs.airline.tasks_test import TASKS as tasks
-            case _:
-                raise ValueError(f"Unknown task split: {task_split}")
+        tasks = load_tasks("airline", task_split)
         super().__init__(
             data_load_func=load_data,
             tools=ALL_TOOLS,
@@ -35,3 +32,4 @@ class MockAirlineDomainEnv(Env):
             task_index=task_index,
         )
         self.terminate_tools = ["transfer_to_human_agents"]
+        self.env_name = "airline"
@@ -0,0 +1,11 @@
+# Copyright Sierra
+
+from typing import Any, Dict, Tuple
+
+
+def origin_key(flight: Dict[str, Any]) -> str:
+    return flight["origin"]
+
+
+def route_key(flight: Dict[str, Any]) -> Tuple[str, str]:
+    return flight["origin"], flight["destination"]
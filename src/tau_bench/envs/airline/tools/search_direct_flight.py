@@ -2,6 +2,8 @@
 
 import json
 from typing import Any, Dict
+from tau_bench.envs.airline.tools.routes import route_key
+from tau_bench.envs.snapshot import find_all, peek
 from tau_bench.envs.tool import Tool
 
 
@@ -10,15 +12,15 @@ class SearchDirectFlight(Tool):
     def invoke(data: Dict[str, Any], origin: str, destination: str, date: str) -> str:
         flights = data["flights"]
         results = []
-        for flight in flights.values():
-            if flight["origin"] == origin and flight["destination"] == destination:
-                if (
-                    date in flight["dates"]
-                    and flight["dates"][date]["status"] == "available"
-                ):
-                    # results add flight except dates, but add flight["datas"][date]
-                    results.append({k: v for k, v in flight.items() if k != "dates"})
-                    results[-1].update(flight["dates"][date])
+        for flight_number in find_all(flights, route_key, (origin, destination)):
+            flight = peek(flights, flight_number)
+            if (
+                date in flight["dates"]
+                and flight["dates"][date]["status"] == "available"
+            ):
+                # results add flight except dates, but add flight["datas"][date]
+                results.append({k: v for k, v in flight.items() if k != "dates"})
+                results[-1].update(flight["dates"][date])
         return json.dumps(results)
 
     @staticmethod
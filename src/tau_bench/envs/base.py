@@ -1,9 +1,16 @@
 # Copyright Sierra
 
 import random
-from hashlib import sha256
+from tau_bench.envs.gt_cache import lookup_gt_data_hash
+from tau_bench.envs.state_hash import (
+    Hashable as Hashable,
+    ToHashable as ToHashable,
+    consistent_hash as consistent_hash,
+    data_hash,
+    to_hashable as to_hashable,
+)
 from tau_bench.envs.tool import Tool
-from typing import Any, Callable, Dict, List, Type, Optional, Set, Union, Tuple
+from typing import Any, Callable, Dict, List, Type, Optional, Union
 
 from tau_bench.envs.user import load_user, UserStrategy
 from tau_bench.types import (
@@ -18,29 +25,6 @@ from tau_bench.types import (
     RESPOND_ACTION_NAME,
 )
 
-ToHashable = Union[
-    str, int, float, Dict[str, "ToHashable"], List["ToHashable"], Set["ToHashable"]
-]
-Hashable = Union[str, int, float, Tuple["Hashable"], Tuple[Tuple[str, "Hashable"]]]
-
-
-def to_hashable(item: ToHashable) -> Hashable:
-    if isinstance(item, dict):
-        return tuple((key, to_hashable(value)) for key, value in sorted(item.items()))
-    elif isinstance(item, list):
-        return tuple(to_hashable(element) for element in item)
-    elif isinstance(item, set):
-        return tuple(sorted(to_hashable(element) for element in item))
-    else:
-        return item
-
-
-def consistent_hash(
-    value: Hashable,
-) -> str:
-    return sha256(str(value).encode("utf-8")).hexdigest()
-
-
 class Env(object):
     def __init__(
         self,
@@ -62,6 +46,8 @@ class Env(object):
         }
         self.tools_info = [tool.get_info() for tool in tools]
         self.terminate_tools = []
+        # set by domain envs so that rewards can use the precomputed ground-truth hashes in gt_cache
+        self.env_name: Optional[str] = None
         self.tasks = tasks
         if task_index is not None:
             self.task_index = task_index
@@ -119,7 +105,7 @@ class Env(object):
         return EnvResponse(observation=observation, reward=reward, done=done, info=info)
 
     def get_data_hash(self) -> str:
-        return consistent_hash(to_hashable(self.data))
+        return data_hash(self.data)
 
     def calculate_reward(self) -> RewardResult:
         data_hash = self.get_data_hash()
@@ -129,12 +115,15 @@ class Env(object):
         ]
 
         # Check if the database changes are correct. If they are not correct, then we set the reward to 0.
-        # TODO: cache gt_data_hash in tasks.py (low priority)
-        self.data = self.data_load_func()
-        for action in self.task.actions:
-            if action.name not in self.terminate_tools:
-                self.step(action)
-        gt_data_hash = self.get_data_hash()
+        gt_data_hash = (
+            lookup_gt_data_hash(self.env_name, self.task) if self.env_name else None
+        )
+        if gt_data_hash is None:
+            self.data = self.data_load_func()
+            for action in self.task.actions:
+                if action.name not in self.terminate_tools:
+                    self.step(action)
+            gt_data_hash = self.get_data_hash()
         info = RewardActionInfo(
             r_actions=data_hash == gt_data_hash, gt_data_hash=gt_data_hash
         )
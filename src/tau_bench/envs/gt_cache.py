@@ -0,0 +1,224 @@
+# Copyright Sierra
+
+"""Offline cache of ground-truth database hashes.
+
+Rewards compare the agent's final database against the database obtained by
+replaying `task.actions` on a fresh copy. That replay only depends on the task,
+the data JSON files and the tool code, so it can be computed once per task:
+
+    python src/build_gt_cache.py --env retail airline
+
+writes `<env>/data/gt_data_hashes.json`, keyed by task content hash. The file is
+stamped with a fingerprint of the data files and of the source of the replay path
+(the data loader, the tools, this module and the `tau_bench` modules they import)
+and is ignored as soon as any of them changes, in which case rewards fall back to
+replaying the actions.
+"""
+
+import ast
+import importlib
+import json
+import os
+from functools import lru_cache
+from hashlib import sha256
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from tau_bench.envs.state_hash import data_hash
+from tau_bench.envs.task_splits import TASK_SPLITS, load_tasks
+from tau_bench.envs.task_store import INDEX_SUFFIX as TASK_INDEX_SUFFIX
+from tau_bench.envs.tool import Tool
+from tau_bench.types import RESPOND_ACTION_NAME, Task
+
+ENVS_FOLDER_PATH = os.path.dirname(__file__)
+# the directory holding the tau_bench package
+SOURCE_ROOT = os.path.dirname(os.path.dirname(ENVS_FOLDER_PATH))
+CACHE_FILE_NAME = "gt_data_hashes.json"
+
+TERMINATE_TOOLS = ["transfer_to_human_agents"]
+
+
+def task_content_hash(task: Task) -> str:
+    return sha256(json.dumps(task.model_dump(), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _cache_path(env_name: str) -> str:
+    return os.path.join(ENVS_FOLDER_PATH, env_name, "data", CACHE_FILE_NAME)
+
+
+def _module_path(module: str) -> Optional[str]:
+    """The source file of a `tau_bench` module, None for modules of other packages."""
+    if module.split(".")[0] != "tau_bench":
+        return None
+    path = os.path.join(SOURCE_ROOT, *module.split("."))
+    if os.path.isdir(path):
+        path = os.path.join(path, "__init__.py")
+    else:
+        path += ".py"
+    return path if os.path.exists(path) else None
+
+
+def _imported_modules(path: str, module: str) -> List[str]:
+    """The modules `path` imports explicitly, including `from package import submodule` and relative imports."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    package = module if os.path.basename(path) == "__init__.py" else module.rpartition(".")[0]
+    imported = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imported += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = package.split(".")[: len(package.split(".")) - node.level + 1] if node.level else []
+            parent = ".".join(base + ([node.module] if node.module else []))
+            imported.append(parent)
+            imported += [f"{parent}.{alias.name}" for alias in node.names]
+    return imported
+
+
+def replay_source_paths(env_name: str) -> List[str]:
+    """
+    The source files of the replay path: the env's data and tools packages, this module and every `tau_bench`
+    module they import, transitively. Parent packages' `__init__` modules are not followed, they only
+    re-export the env classes.
+    """
+    seen: Dict[str, str] = {}
+    pending = [f"tau_bench.envs.{env_name}.data", f"tau_bench.envs.{env_name}.tools", __name__]
+    while pending:
+        module = pending.pop()
+        path = _module_path(module)
+        if path is None or module in seen:
+            continue
+        seen[module] = path
+        pending += _imported_modules(path, module)
+    return sorted(set(seen.values()))
+
+
+@lru_cache(maxsize=None)
+def env_fingerprint(env_name: str) -> str:
+    """Hashes everything the ground-truth replay depends on: the data files and the source of the replay path."""
+    data_folder = os.path.join(ENVS_FOLDER_PATH, env_name, "data")
+    paths = [
+        os.path.join(data_folder, name)
+        for name in sorted(os.listdir(data_folder))
+        if name.endswith(".json") and name != CACHE_FILE_NAME and not name.endswith(TASK_INDEX_SUFFIX)
+    ]
+    paths += replay_source_paths(env_name)
+    hasher = sha256()
+    for path in paths:
+        hasher.update(os.path.relpath(path, SOURCE_ROOT).encode("utf-8"))
+        with open(path, "rb") as f:
+            hasher.update(sha256(f.read()).digest())
+    return hasher.hexdigest()
+
+
+def _load_env(env_name: str) -> tuple[Callable[[], Dict[str, Any]], List[Type[Tool]]]:
+    data_module = importlib.import_module(f"tau_bench.envs.{env_name}.data")
+    tools_module = importlib.import_module(f"tau_bench.envs.{env_name}.tools")
+    return data_module.load_data, tools_module.ALL_TOOLS
+
+
+def replay_ground_truth(
+    data: Dict[str, Any],
+    tools_map: Dict[str, Type[Tool]],
+    task: Task,
+    terminate_tools: List[str] = TERMINATE_TOOLS,
+) -> Dict[str, Any]:
+    """Applies `task.actions` to `data` the way `Env.calculate_reward` does: tool errors are ignored."""
+    for action in task.actions:
+        if action.name == RESPOND_ACTION_NAME or action.name in terminate_tools:
+            continue
+        if action.name not in tools_map:
+            continue
+        try:
+            tools_map[action.name].invoke(data=data, **action.kwargs)
+        except Exception:
+            pass
+    return data
+
+
+def compute_gt_data_hash(
+    task: Task,
+    data_load_func: Callable[[], Dict[str, Any]],
+    tools_map: Dict[str, Type[Tool]],
+    terminate_tools: List[str] = TERMINATE_TOOLS,
+) -> str:
+    return data_hash(replay_ground_truth(data_load_func(), tools_map, task, terminate_tools))
+
+
+@lru_cache(maxsize=None)
+def _load_cache(env_name: str) -> Dict[str, str]:
+    path = _cache_path(env_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    if cache.get("fingerprint") != env_fingerprint(env_name):
+        return {}
+    return cache["hashes"]
+
+
+def lookup_gt_data_hash(env_name: str, task: Task) -> Optional[str]:
+    """Returns the precomputed ground-truth hash for `task`, or None if it is not cached or the cache is stale."""
+    if env_name not in TASK_SPLITS:
+        return None
+    return _load_cache(env_name).get(task_content_hash(task))
+
+
+_GT_DATA: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_COMPUTED_GT_HASHES: Dict[Tuple[str, str], str] = {}
+
+
+def get_gt_data(env_name: str, task: Task) -> Dict[str, Any]:
+    """
+    The database after replaying `task.actions`, replayed once per process and task content. With copy-on-write
+    data it only holds the records the replay touched. Shared between episodes, never mutate it.
+    """
+    key = (env_name, task_content_hash(task))
+    gt_data = _GT_DATA.get(key)
+    if gt_data is None:
+        data_load_func, tools = _load_env(env_name)
+        tools_map = {tool.get_info()["function"]["name"]: tool for tool in tools}
+        gt_data = replay_ground_truth(data_load_func(), tools_map, task)
+        _GT_DATA[key] = gt_data
+    return gt_data
+
+
+@lru_cache(maxsize=None)
+def get_base_data_hash(env_name: str) -> str:
+    """The hash of the untouched data, computed once per process. It is the ground truth of any task that writes nothing."""
+    data_load_func, _ = _load_env(env_name)
+    return data_hash(data_load_func())
+
+
+def get_gt_data_hash(env_name: str, task: Task) -> str:
+    """
+    The ground-truth hash of `task`, from the offline cache if possible. Otherwise it is computed once per
+    process and task content, so trials of the same task share it.
+    """
+    gt_data_hash = lookup_gt_data_hash(env_name, task)
+    if gt_data_hash is not None:
+        return gt_data_hash
+    key = (env_name, task_content_hash(task))
+    gt_data_hash = _COMPUTED_GT_HASHES.get(key)
+    if gt_data_hash is None:
+        gt_data_hash = data_hash(get_gt_data(env_name, task))
+        _COMPUTED_GT_HASHES[key] = gt_data_hash
+    return gt_data_hash
+
+
+def build_gt_hash_cache(env_name: str) -> Dict[str, str]:
+    data_load_func, tools = _load_env(env_name)
+    tools_map = {tool.get_info()["function"]["name"]: tool for tool in tools}
+    hashes = {}
+    for split in TASK_SPLITS[env_name]:
+        for task in load_tasks(env_name, split):
+            key = task_content_hash(task)
+            if key not in hashes:
+                hashes[key] = compute_gt_data_hash(task, data_load_func, tools_map)
+    path = _cache_path(env_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"fingerprint": env_fingerprint(env_name), "hashes": hashes}, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, path)
+    _load_cache.cache_clear()
+    return hashes
+
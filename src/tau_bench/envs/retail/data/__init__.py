@@ -2,12 +2,17 @@
 
 import json
 import os
+from functools import lru_cache
 from typing import Any
 
+from tau_bench.envs.snapshot import copy_on_write_snapshot
+
 FOLDER_PATH = os.path.dirname(__file__)
 
 
-def load_data() -> dict[str, Any]:
+@lru_cache(maxsize=None)
+def load_base_data() -> dict[str, Any]:
+    """Parses the JSON files once per process. The result is shared and must never be mutated."""
     with open(os.path.join(FOLDER_PATH, "orders.json")) as f:
         order_data = json.load(f)
     with open(os.path.join(FOLDER_PATH, "products.json")) as f:
@@ -19,3 +24,8 @@ def load_data() -> dict[str, Any]:
         "products": product_data,
         "users": user_data,
     }
+
+
+def load_data() -> dict[str, Any]:
+    """Returns a fresh copy-on-write view of the database for a single episode."""
+    return copy_on_write_snapshot(load_base_data())
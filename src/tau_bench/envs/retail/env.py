@@ -5,6 +5,7 @@ from tau_bench.envs.retail.data import load_data
 from tau_bench.envs.retail.rules import RULES
 from tau_bench.envs.retail.tools import ALL_TOOLS
 from tau_bench.envs.retail.wiki import WIKI
+from tau_bench.envs.task_splits import load_tasks
 from typing import Optional, Union
 from tau_bench.envs.user import UserStrategy
 
@@ -18,15 +19,7 @@ class MockRetailDomainEnv(Env):
         task_split: str = "test",
         task_index: Optional[int] = None,
     ):
-        match task_split:
-            case "test":
-                from tau_bench.envs.retail.tasks_test import TASKS_TEST as tasks
-            case "train":
-                from tau_bench.envs.retail.tasks_train import TASKS_TRAIN as tasks
-            case "dev":
-                from tau_bench.envs.retail.tasks_dev import TASKS_DEV as tasks
-            case _:
-                raise ValueError(f"Unknown task split: {task_split}")
+        tasks = load_tasks("retail", task_split)
         super().__init__(
             data_load_func=load_data,
             tools=ALL_TOOLS,
@@ -39,3 +32,4 @@ class MockRetailDomainEnv(Env):
             task_index=task_index,
         )
         self.terminate_tools = ["transfer_to_human_agents"]
+        self.env_name = "retail"
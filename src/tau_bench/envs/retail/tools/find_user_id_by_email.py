@@ -1,16 +1,22 @@
 # Copyright Sierra
 
 from typing import Any, Dict
+from tau_bench.envs.snapshot import find_first
 from tau_bench.envs.tool import Tool
 
 
+def _email_key(profile: Dict[str, Any]) -> str:
+    return profile["email"].lower()
+
+
 class FindUserIdByEmail(Tool):
+    read_only = True
+
     @staticmethod
     def invoke(data: Dict[str, Any], email: str) -> str:
-        users = data["users"]
-        for user_id, profile in users.items():
-            if profile["email"].lower() == email.lower():
-                return user_id
+        user_id = find_first(data["users"], _email_key, email.lower())
+        if user_id is not None:
+            return user_id
         return "Error: user not found"
 
     @staticmethod
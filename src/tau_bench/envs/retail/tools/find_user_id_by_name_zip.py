@@ -1,20 +1,28 @@
 # Copyright Sierra
 
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
+from tau_bench.envs.snapshot import find_first
 from tau_bench.envs.tool import Tool
 
 
+def _name_zip_key(profile: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (
+        profile["name"]["first_name"].lower(),
+        profile["name"]["last_name"].lower(),
+        profile["address"]["zip"],
+    )
+
+
 class FindUserIdByNameZip(Tool):
+    read_only = True
+
     @staticmethod
     def invoke(data: Dict[str, Any], first_name: str, last_name: str, zip: str) -> str:
-        users = data["users"]
-        for user_id, profile in users.items():
-            if (
-                profile["name"]["first_name"].lower() == first_name.lower()
-                and profile["name"]["last_name"].lower() == last_name.lower()
-                and profile["address"]["zip"] == zip
-            ):
-                return user_id
+        user_id = find_first(
+            data["users"], _name_zip_key, (first_name.lower(), last_name.lower(), zip)
+        )
+        if user_id is not None:
+            return user_id
         return "Error: user not found"
 
     @staticmethod
@@ -0,0 +1,66 @@
+"""Reward evaluation that does as little database work as the episode allows.
+
+Output checks are plain substring searches and run first; when an expected output
+is missing the reward is 0 and the database is not checked at all. The database check is
+also skipped when neither the agent nor the ground truth called a tool that can write
+(see `Tool.read_only`), since both databases are then the untouched base data:
+no replay and no comparison is needed, and both hashes are the base-data hash,
+computed once per process. Otherwise only the records touched by either side are compared
+(`state_hash.data_equal`); the agent's database is hashed only when it differs
+from the ground truth, since its hash is the ground-truth hash otherwise. The
+field-level diff of a failed episode (`diff_against_ground_truth`) covers the same
+touched records.
+"""
+
+from typing import Any, Dict, Iterable, List, Type
+
+from tau_bench.envs.gt_cache import TERMINATE_TOOLS, get_base_data_hash, get_gt_data, get_gt_data_hash
+from tau_bench.envs.state_diff import diff_data
+from tau_bench.envs.state_hash import data_equal, data_hash
+from tau_bench.envs.tool import Tool
+from tau_bench.types import RESPOND_ACTION_NAME, RewardActionInfo, RewardOutputInfo, Task
+
+
+def calls_write_tool(tool_names: Iterable[str], tools_map: Dict[str, Type[Tool]]) -> bool:
+    """Whether any of the calls may have modified the data. Names that are not data tools never do."""
+    return any(name in tools_map and not tools_map[name].read_only for name in tool_names)
+
+
+def ground_truth_writes(task: Task, tools_map: Dict[str, Type[Tool]], terminate_tools: List[str] = TERMINATE_TOOLS) -> bool:
+    """Whether replaying `task.actions` (see `gt_cache.replay_ground_truth`) may modify the data."""
+    return calls_write_tool(
+        (action.name for action in task.actions if action.name != RESPOND_ACTION_NAME and action.name not in terminate_tools),
+        tools_map,
+    )
+
+
+def check_outputs(outputs: List[str], responses: List[str]) -> RewardOutputInfo:
+    """Every expected output has to appear in one of the agent's responses (case-insensitive, commas ignored)."""
+    normalized_responses = [response.lower().replace(",", "") for response in responses]
+    found = {output: any(output.lower() in response for response in normalized_responses) for output in outputs}
+    return RewardOutputInfo(r_outputs=1.0 if all(found.values()) else 0.0, outputs=found)
+
+
+def check_actions(
+    env_name: str,
+    task: Task,
+    data: Dict[str, Any],
+    called_tool_names: Iterable[str],
+    tools_map: Dict[str, Type[Tool]],
+) -> tuple[RewardActionInfo, str]:
+    """
+    Compares the agent's database with the ground truth. Returns the action info and the hash of `data`,
+    which is only computed when it differs from the ground-truth hash.
+    """
+    if not calls_write_tool(called_tool_names, tools_map) and not ground_truth_writes(task, tools_map):
+        base_data_hash = get_base_data_hash(env_name)
+        return RewardActionInfo(r_actions=True, gt_data_hash=base_data_hash), base_data_hash
+    gt_data_hash = get_gt_data_hash(env_name, task)
+    r_actions = data_equal(data, get_gt_data(env_name, task))
+    computed_hash = gt_data_hash if r_actions else data_hash(data)
+    return RewardActionInfo(r_actions=r_actions, gt_data_hash=gt_data_hash), computed_hash
+
+
+def diff_against_ground_truth(env_name: str, task: Task, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Field-level differences between the agent's database and the ground truth, see `state_diff.diff_data`."""
+    return diff_data(data, get_gt_data(env_name, task))
@@ -0,0 +1,465 @@
+from collections.abc import ItemsView, Mapping, MutableMapping, ValuesView
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple, Union
+
+IndexKeyFunc = Callable[[Any], Hashable]
+PathElement = Union[str, int]
+
+# id(base) -> (base, {key_func: index value -> keys in base order}, key -> position in base)
+_BASE_INDEXES: Dict[int, Tuple[Dict[str, Any], Dict[IndexKeyFunc, Dict[Hashable, List[str]]], Dict[str, int]]] = {}
+
+
+def _base_indexes(base: Dict[str, Any]) -> Tuple[Dict[IndexKeyFunc, Dict[Hashable, List[str]]], Dict[str, int]]:
+    entry = _BASE_INDEXES.get(id(base))
+    if entry is None or entry[0] is not base:
+        entry = (base, {}, {key: position for position, key in enumerate(base)})
+        _BASE_INDEXES[id(base)] = entry
+    return entry[1], entry[2]
+
+
+class _Absent:
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+
+# `old` of a write that created a field or record, `new` of one that deleted it
+ABSENT: Any = _Absent()
+
+
+@dataclass(frozen=True)
+class WriteEntry:
+    """One write: the value at `path` inside record `key` of `collection` went from `old` to `new`.
+
+    An empty path is the whole record. List mutations other than item assignment
+    (append, extend, pop, ...) are logged with the whole list as old and new value.
+    """
+
+    collection: str
+    key: str
+    path: Tuple[PathElement, ...]
+    old: Any = ABSENT
+    new: Any = ABSENT
+
+    def model_dump(self) -> Dict[str, Any]:
+        entry = {"collection": self.collection, "key": self.key, "path": list(self.path)}
+        if self.old is not ABSENT:
+            entry["old"] = self.old
+        if self.new is not ABSENT:
+            entry["new"] = self.new
+        return entry
+
+
+class WriteLog:
+    """The writes made to the records of one copy-on-write snapshot, in order."""
+
+    def __init__(self) -> None:
+        self.entries: List[WriteEntry] = []
+        self._written: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def record(self, entry: WriteEntry) -> None:
+        self.entries.append(entry)
+        self._written.setdefault(entry.collection, set()).add(entry.key)
+
+    def written_keys(self, collection: str) -> Set[str]:
+        return self._written.get(collection, set())
+
+    def mark(self) -> int:
+        """A position to `rollback` to, or to read the writes made since with `since`."""
+        return len(self.entries)
+
+    def since(self, mark: int) -> List[WriteEntry]:
+        return self.entries[mark:]
+
+    def truncate(self, mark: int) -> None:
+        del self.entries[mark:]
+        self._written = {}
+        for entry in self.entries:
+            self._written.setdefault(entry.collection, set()).add(entry.key)
+
+
+def to_plain(value: Any) -> Any:
+    """Deep copy of a record value as plain dicts and lists."""
+    if isinstance(value, dict):
+        return {field: to_plain(item) for field, item in value.items()}
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    return value
+
+
+class _RecordRef:
+    """The record a tracked container belongs to, and the log its writes go to."""
+
+    __slots__ = ("log", "collection", "key")
+
+    def __init__(self, log: WriteLog, collection: str, key: str) -> None:
+        self.log = log
+        self.collection = collection
+        self.key = key
+
+    def record(self, path: Tuple[PathElement, ...], old: Any, new: Any) -> None:
+        self.log.record(WriteEntry(self.collection, self.key, path, old, new))
+
+
+def _track(value: Any, ref: _RecordRef, path: Tuple[PathElement, ...]) -> Any:
+    # always copies containers, so a value stored in two places (e.g. product options assigned to an order
+    # item) never shares tracked state with its source
+    if isinstance(value, dict):
+        tracked = TrackedDict()
+        tracked._ref, tracked._path = ref, path
+        for field, item in value.items():
+            dict.__setitem__(tracked, field, _track(item, ref, path + (field,)))
+        return tracked
+    if isinstance(value, list):
+        tracked = TrackedList()
+        tracked._ref, tracked._path = ref, path
+        list.extend(tracked, [_track(item, ref, path + (index,)) for index, item in enumerate(value)])
+        return tracked
+    return value
+
+
+def _set_path(value: Any, path: Tuple[PathElement, ...]) -> None:
+    if isinstance(value, TrackedDict):
+        value._path = path
+        for field, item in dict.items(value):
+            _set_path(item, path + (field,))
+    elif isinstance(value, TrackedList):
+        value._path = path
+        for index, item in enumerate(list.__iter__(value)):
+            _set_path(item, path + (index,))
+
+
+class TrackedDict(dict):
+    """A record (or a dict inside one) that logs every write. Reads are plain dict reads."""
+
+    __slots__ = ("_ref", "_path")
+
+    def __setitem__(self, field: Any, value: Any) -> None:
+        old = to_plain(dict.get(self, field, ABSENT))
+        value = _track(value, self._ref, self._path + (field,))
+        dict.__setitem__(self, field, value)
+        self._ref.record(self._path + (field,), old, to_plain(value))
+
+    def __delitem__(self, field: Any) -> None:
+        old = to_plain(self[field])
+        dict.__delitem__(self, field)
+        self._ref.record(self._path + (field,), old, ABSENT)
+
+    def pop(self, field: Any, *default: Any) -> Any:
+        if field not in self:
+            return dict.pop(self, field, *default)
+        value = self[field]
+        del self[field]
+        return value
+
+    def popitem(self) -> Tuple[Any, Any]:
+        field = next(reversed(self))
+        return field, self.pop(field)
+
+    def clear(self) -> None:
+        for field in list(self):
+            del self[field]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for field, value in dict(*args, **kwargs).items():
+            self[field] = value
+
+    def setdefault(self, field: Any, default: Any = None) -> Any:
+        if field not in self:
+            self[field] = default
+        return self[field]
+
+    def __ior__(self, other: Any) -> "TrackedDict":
+        self.update(other)
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> Dict[str, Any]:
+        return to_plain(self)
+
+    def __reduce_ex__(self, protocol: int) -> Any:
+        return (dict, (to_plain(self),))
+
+
+class TrackedList(list):
+    """A list inside a record that logs every write. Reads are plain list reads."""
+
+    __slots__ = ("_ref", "_path")
+
+    def _mutate(self, mutation: Callable[[], Any]) -> Any:
+        old = to_plain(self)
+        result = mutation()
+        # new items are copied into tracked containers, moved ones get their new index
+        for index, item in enumerate(list.__iter__(self)):
+            if isinstance(item, (TrackedDict, TrackedList)) and item._ref is self._ref:
+                if item._path != self._path + (index,):
+                    _set_path(item, self._path + (index,))
+            elif isinstance(item, (dict, list)):
+                list.__setitem__(self, index, _track(item, self._ref, self._path + (index,)))
+        self._ref.record(self._path, old, to_plain(self))
+        return result
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        if isinstance(index, slice):
+            self._mutate(lambda: list.__setitem__(self, index, [to_plain(item) for item in value]))
+            return
+        position = index if index >= 0 else len(self) + index
+        old = to_plain(self[index])
+        value = _track(value, self._ref, self._path + (position,))
+        list.__setitem__(self, index, value)
+        self._ref.record(self._path + (position,), old, to_plain(value))
+
+    def __delitem__(self, index: Any) -> None:
+        self._mutate(lambda: list.__delitem__(self, index))
+
+    def append(self, value: Any) -> None:
+        self._mutate(lambda: list.append(self, to_plain(value)))
+
+    def extend(self, values: Any) -> None:
+        values = [to_plain(value) for value in values]
+        self._mutate(lambda: list.extend(self, values))
+
+    def insert(self, index: int, value: Any) -> None:
+        self._mutate(lambda: list.insert(self, index, to_plain(value)))
+
+    def pop(self, index: int = -1) -> Any:
+        return self._mutate(lambda: list.pop(self, index))
+
+    def remove(self, value: Any) -> None:
+        self._mutate(lambda: list.remove(self, value))
+
+    def clear(self) -> None:
+        self._mutate(lambda: list.clear(self))
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self._mutate(lambda: list.sort(self, *args, **kwargs))
+
+    def reverse(self) -> None:
+        self._mutate(lambda: list.reverse(self))
+
+    def __iadd__(self, values: Any) -> "TrackedList":
+        self.extend(values)
+        return self
+
+    def __imul__(self, count: int) -> "TrackedList":
+        items = to_plain(self)
+        self._mutate(lambda: list.__setitem__(self, slice(None), items * count))
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> List[Any]:
+        return to_plain(self)
+
+    def __reduce_ex__(self, protocol: int) -> Any:
+        return (list, (to_plain(self),))
+
+
+class CopyOnWriteCollection(MutableMapping):
+    """A collection of records (e.g. `orders`) layered over a shared base dict.
+
+    The base dict is parsed once per process and is never mutated. Indexing a
+    record (`collection[key]`) copies it into a per-episode overlay first, so tools
+    can keep mutating the returned dict in place. Iterating with `values()` or
+    `items()` hands out the shared records without copying them; those must be
+    treated as read-only.
+
+    With a `log`, copied records are `TrackedDict`s and every write to them, and
+    every record set or deleted on the collection, is appended to the log. The
+    records the log has written are then exactly the ones that can differ from the
+    base, and the writes can be undone with `rollback`.
+    """
+
+    def __init__(self, base: Dict[str, Any], name: Optional[str] = None, log: Optional[WriteLog] = None) -> None:
+        self._base = base
+        self._overlay: Dict[str, Any] = {}
+        self._deleted: Set[str] = set()
+        self.name = name
+        self.log = log
+
+    def _copy(self, key: str, record: Any) -> Any:
+        if self.log is None:
+            return deepcopy(record)
+        return _track(record, _RecordRef(self.log, self.name, key), ())
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        record = self._copy(key, self._base[key])
+        self._overlay[key] = record
+        return record
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.log is not None:
+            old = to_plain(self.peek(key)) if key in self else ABSENT
+            value = self._copy(key, value)
+            self.log.record(WriteEntry(self.name, key, (), old, to_plain(value)))
+        self._overlay[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if self.log is not None:
+            self.log.record(WriteEntry(self.name, key, (), to_plain(self.peek(key)), ABSENT))
+        self._overlay.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._overlay:
+            return True
+        return key in self._base and key not in self._deleted
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._base:
+            if key not in self._deleted:
+                yield key
+        for key in self._overlay:
+            if key not in self._base:
+                yield key
+
+    def __len__(self) -> int:
+        added = sum(1 for key in self._overlay if key not in self._base)
+        return len(self._base) - len(self._deleted) + added
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(base={len(self._base)}, overlay={len(self._overlay)}, deleted={len(self._deleted)})"
+
+    def peek(self, key: str) -> Any:
+        """Returns the current record without copying it into the overlay. Do not mutate the result."""
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    @property
+    def touched_keys(self) -> Set[str]:
+        """Keys whose record may differ from the base: written to, replaced, added or deleted.
+
+        Without a write log every record copied into the overlay counts, including the ones
+        that were only read.
+        """
+        if self.log is None:
+            return set(self._overlay) | self._deleted
+        return self.log.written_keys(self.name) | self._deleted
+
+    def _undo(self, entry: WriteEntry) -> None:
+        if not entry.path:
+            if entry.old is ABSENT:
+                del self._overlay[entry.key]
+                if entry.key in self._base:
+                    self._deleted.add(entry.key)
+            else:
+                self._overlay[entry.key] = self._copy(entry.key, entry.old)
+                self._deleted.discard(entry.key)
+            return
+        record = self._overlay[entry.key]
+        container = record
+        for element in entry.path[:-1]:
+            container = container[element]
+        field = entry.path[-1]
+        if entry.old is ABSENT:
+            dict.__delitem__(container, field)
+        elif isinstance(container, list):
+            list.__setitem__(container, field, _track(entry.old, record._ref, entry.path))
+        else:
+            dict.__setitem__(container, field, _track(entry.old, record._ref, entry.path))
+
+    def find_all(self, key_func: IndexKeyFunc, value: Hashable) -> List[str]:
+        """Returns the keys, in iteration order, whose record satisfies `key_func(record) == value`.
+
+        The index over the base is built once per `key_func` and shared by every snapshot
+        of that base; records touched by this snapshot are re-checked against their
+        current value, so lookups stay consistent with in-place edits.
+        """
+        indexes, positions = _base_indexes(self._base)
+        index = indexes.get(key_func)
+        if index is None:
+            index = {}
+            for key, record in self._base.items():
+                index.setdefault(key_func(record), []).append(key)
+            indexes[key_func] = index
+
+        # every record that is not the base record any more, even if it still has the base value
+        copied = self._overlay.keys() | self._deleted
+        matches = [(positions[key], key) for key in index.get(value, ()) if key not in copied]
+        for offset, key in enumerate(self._overlay):
+            if key_func(self._overlay[key]) == value:
+                matches.append((positions.get(key, len(positions) + offset), key))
+        return [key for _, key in sorted(matches)]
+
+    def find_first(self, key_func: IndexKeyFunc, value: Hashable) -> Optional[str]:
+        """Returns the first key found by `find_all`, or None."""
+        matches = self.find_all(key_func, value)
+        return matches[0] if matches else None
+
+    def items(self) -> ItemsView:
+        return _PeekItemsView(self)
+
+    def values(self) -> ValuesView:
+        return _PeekValuesView(self)
+
+
+class _PeekItemsView(ItemsView):
+    def __iter__(self):
+        for key in self._mapping:
+            yield key, self._mapping.peek(key)
+
+
+class _PeekValuesView(ValuesView):
+    def __iter__(self):
+        for key in self._mapping:
+            yield self._mapping.peek(key)
+
+
+def copy_on_write_snapshot(base: Dict[str, Dict[str, Any]]) -> Dict[str, CopyOnWriteCollection]:
+    """Wraps every collection of a base database in a fresh copy-on-write overlay, sharing one write log."""
+    log = WriteLog()
+    return {name: CopyOnWriteCollection(collection, name, log) for name, collection in base.items()}
+
+
+def get_write_log(data: Dict[str, Any]) -> Optional[WriteLog]:
+    """The write log of a snapshot made by `copy_on_write_snapshot`, None for plain data."""
+    for collection in data.values():
+        if isinstance(collection, CopyOnWriteCollection) and collection.log is not None:
+            return collection.log
+    return None
+
+
+def rollback(data: Dict[str, Any], mark: int) -> None:
+    """Undoes the writes made to a snapshot since `mark` (see `WriteLog.mark`), newest first."""
+    log = get_write_log(data)
+    if log is None:
+        raise ValueError("rollback needs a snapshot made by copy_on_write_snapshot")
+    collections = {collection.name: collection for collection in data.values() if isinstance(collection, CopyOnWriteCollection)}
+    for entry in reversed(log.since(mark)):
+        collections[entry.collection]._undo(entry)
+    log.truncate(mark)
+
+
+def peek(collection: Mapping, key: str) -> Any:
+    """Reads a record without copying it into a copy-on-write overlay. Do not mutate the result."""
+    if isinstance(collection, CopyOnWriteCollection):
+        return collection.peek(key)
+    return collection[key]
+
+
+def find_all(collection: Mapping, key_func: IndexKeyFunc, value: Hashable) -> List[str]:
+    """Indexed lookup on copy-on-write collections, linear scan on plain dicts."""
+    if isinstance(collection, CopyOnWriteCollection):
+        return collection.find_all(key_func, value)
+    return [key for key, record in collection.items() if key_func(record) == value]
+
+
+def find_first(collection: Mapping, key_func: IndexKeyFunc, value: Hashable) -> Optional[str]:
+    """Indexed lookup on copy-on-write collections, linear scan on plain dicts."""
+    if isinstance(collection, CopyOnWriteCollection):
+        return collection.find_first(key_func, value)
+    for key, record in collection.items():
+        if key_func(record) == value:
+            return key
+    return None
@@ -0,0 +1,99 @@
+"""Field-level differences between two databases, e.g. an agent's final state and the ground truth.
+
+Only records that either copy-on-write snapshot wrote to can differ (see
+`snapshot.WriteLog`), so the diff never walks the untouched base data. Values are compared with the same
+serialization as `state_hash.data_hash`: two databases have the same hash
+exactly when their diff is empty.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List
+
+from tau_bench.envs.snapshot import CopyOnWriteCollection, PathElement, to_plain
+from tau_bench.envs.state_hash import to_hashable
+
+_MISSING = object()
+
+
+def _same(value: Any, other: Any) -> bool:
+    return repr(to_hashable(value)) == repr(to_hashable(other))
+
+
+def _child(value: Any, key: PathElement) -> Any:
+    if isinstance(value, Mapping):
+        return value.get(key, _MISSING)
+    if isinstance(value, list) and isinstance(key, int) and key < len(value):
+        return value[key]
+    return _MISSING
+
+
+def _diff_entry(collection: str, key: str, path: List[PathElement], values: Dict[str, Any]) -> Dict[str, Any]:
+    # sides where the field does not exist are left out
+    entry = {"collection": collection, "key": key, "path": path}
+    entry.update({side: to_plain(value) for side, value in values.items() if value is not _MISSING})
+    return entry
+
+
+def _diff_values(
+    collection: str, key: str, path: List[PathElement], agent: Any, expected: Any, base: Any, out: List[Dict[str, Any]]
+) -> None:
+    if isinstance(agent, Mapping) and isinstance(expected, Mapping):
+        for field in sorted(set(agent) | set(expected), key=str):
+            _diff_values(
+                collection, key, path + [field],
+                agent.get(field, _MISSING), expected.get(field, _MISSING), _child(base, field), out,
+            )
+    elif isinstance(agent, list) and isinstance(expected, list) and len(agent) == len(expected):
+        for index, (agent_item, expected_item) in enumerate(zip(agent, expected)):
+            _diff_values(collection, key, path + [index], agent_item, expected_item, _child(base, index), out)
+    elif (agent is _MISSING) != (expected is _MISSING) or not _same(agent, expected):
+        out.append(_diff_entry(collection, key, path, {"agent": agent, "expected": expected, "base": base}))
+
+
+def _candidate_keys(collection: Any, other: Any) -> Iterable[str]:
+    if (
+        isinstance(collection, CopyOnWriteCollection)
+        and isinstance(other, CopyOnWriteCollection)
+        and collection._base is other._base
+    ):
+        return sorted(collection.touched_keys | other.touched_keys)
+    return sorted(set(collection) | set(other))
+
+
+def _record(collection: Any, key: str) -> Any:
+    if key not in collection:
+        return _MISSING
+    if isinstance(collection, CopyOnWriteCollection):
+        return collection.peek(key)
+    return collection[key]
+
+
+def _base_record(collection: Any, key: str) -> Any:
+    if isinstance(collection, CopyOnWriteCollection):
+        return collection._base.get(key, _MISSING)
+    return _MISSING
+
+
+def diff_data(data: Dict[str, Any], expected: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Differences between `data` and `expected`, one entry per differing field:
+    `{"collection": "orders", "key": "#W0000000", "path": ["items", 0, "item_id"], "agent": ..., "expected": ..., "base": ...}`
+    where `base` is the value before the episode. A side is left out when the field (or record) does not exist
+    there; lists of different lengths are reported as a whole.
+    """
+    out: List[Dict[str, Any]] = []
+    for name in sorted(set(data) | set(expected)):
+        collection, other = data.get(name, {}), expected.get(name, {})
+        if not isinstance(collection, Mapping) or not isinstance(other, Mapping):
+            if not _same(collection, other):
+                out.append(_diff_entry(name, None, [], {"agent": collection, "expected": other}))
+            continue
+        for key in _candidate_keys(collection, other):
+            agent_record, expected_record = _record(collection, key), _record(other, key)
+            base_record = _base_record(collection, key)
+            if agent_record is _MISSING or expected_record is _MISSING:
+                if agent_record is not expected_record:
+                    out.append(_diff_entry(name, key, [], {"agent": agent_record, "expected": expected_record, "base": base_record}))
+                continue
+            _diff_values(name, key, [], agent_record, expected_record, base_record, out)
+    return out
@@ -0,0 +1,206 @@
+# Copyright Sierra
+
+from collections.abc import Mapping
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from tau_bench.envs.snapshot import CopyOnWriteCollection
+
+ToHashable = Union[
+    str, int, float, Dict[str, "ToHashable"], List["ToHashable"], Set["ToHashable"]
+]
+Hashable = Union[str, int, float, Tuple["Hashable"], Tuple[Tuple[str, "Hashable"]]]
+
+def to_hashable(item: ToHashable) -> Hashable:
+    if isinstance(item, (dict, Mapping)):
+        return tuple((key, to_hashable(value)) for key, value in sorted(item.items()))
+    elif isinstance(item, list):
+        return tuple(to_hashable(element) for element in item)
+    elif isinstance(item, set):
+        return tuple(sorted(to_hashable(element) for element in item))
+    else:
+        return item
+
+
+def consistent_hash(
+    value: Hashable,
+) -> str:
+    return sha256(str(value).encode("utf-8")).hexdigest()
+
+
+def _entry_repr(key: str, value: Any) -> str:
+    # str() of the `(key, to_hashable(value))` pair that to_hashable emits for a dict entry
+    return f"({key!r}, {to_hashable(value)!r})"
+
+
+# records of a collection are spread over this many buckets of the incremental hash tree, by key
+TREE_BUCKETS = 64
+
+
+def _bucket(key: str) -> int:
+    return sha256(repr(key).encode("utf-8")).digest()[0] % TREE_BUCKETS
+
+
+def _record_digest(key: str, value: Any) -> bytes:
+    return sha256(_entry_repr(key, value).encode("utf-8")).digest()
+
+
+def _node_digest(children: List[bytes]) -> bytes:
+    # children are fixed-size digests, so their concatenation is unambiguous
+    return sha256(b"".join(children)).digest()
+
+
+class _BaseHashCache:
+    """Per-record hash material for one immutable base collection, filled lazily and shared by all snapshots."""
+
+    def __init__(self, base: Dict[str, Any]) -> None:
+        self.base = base
+        self.entries: Dict[str, str] = {}
+        self.digests: Dict[str, bytes] = {}
+        self._buckets: Optional[List[List[str]]] = None
+        self._bucket_digests: Optional[List[bytes]] = None
+        self._root: Optional[bytes] = None
+
+    def entry(self, key: str) -> str:
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = _entry_repr(key, self.base[key])
+            self.entries[key] = entry
+        return entry
+
+    def digest(self, key: str) -> bytes:
+        digest = self.digests.get(key)
+        if digest is None:
+            digest = _record_digest(key, self.base[key])
+            self.digests[key] = digest
+        return digest
+
+    @property
+    def buckets(self) -> List[List[str]]:
+        """The base keys of every bucket, sorted."""
+        if self._buckets is None:
+            buckets: List[List[str]] = [[] for _ in range(TREE_BUCKETS)]
+            for key in sorted(self.base):
+                buckets[_bucket(key)].append(key)
+            self._buckets = buckets
+        return self._buckets
+
+    @property
+    def bucket_digests(self) -> List[bytes]:
+        if self._bucket_digests is None:
+            self._bucket_digests = [_node_digest([self.digest(key) for key in keys]) for keys in self.buckets]
+        return self._bucket_digests
+
+    @property
+    def root(self) -> bytes:
+        if self._root is None:
+            self._root = _node_digest(self.bucket_digests)
+        return self._root
+
+
+_BASE_HASH_CACHES: Dict[int, _BaseHashCache] = {}
+
+
+def _base_cache(base: Dict[str, Any]) -> _BaseHashCache:
+    cache = _BASE_HASH_CACHES.get(id(base))
+    if cache is None or cache.base is not base:
+        cache = _BaseHashCache(base)
+        _BASE_HASH_CACHES[id(base)] = cache
+    return cache
+
+
+def _join_tuple(parts: List[str]) -> str:
+    # str() of a tuple whose elements have the given reprs
+    if len(parts) == 1:
+        return f"({parts[0]},)"
+    return "(" + ", ".join(parts) + ")"
+
+
+def _collection_repr(collection: Any) -> str:
+    if not isinstance(collection, CopyOnWriteCollection):
+        return repr(to_hashable(collection))
+    cache = _base_cache(collection._base)
+    touched = collection.touched_keys
+    parts = []
+    for key in sorted(collection):
+        if key in touched:
+            parts.append(_entry_repr(key, collection.peek(key)))
+        else:
+            parts.append(cache.entry(key))
+    return _join_tuple(parts)
+
+
+def _collection_digest(collection: Any) -> bytes:
+    if not isinstance(collection, CopyOnWriteCollection):
+        if not isinstance(collection, Mapping):
+            return sha256(repr(to_hashable(collection)).encode("utf-8")).digest()
+        buckets: List[List[bytes]] = [[] for _ in range(TREE_BUCKETS)]
+        for key in sorted(collection):
+            buckets[_bucket(key)].append(_record_digest(key, collection[key]))
+        return _node_digest([_node_digest(bucket) for bucket in buckets])
+    cache = _base_cache(collection._base)
+    touched = collection.touched_keys
+    if not touched:
+        return cache.root
+    touched_buckets: Dict[int, Set[str]] = {}
+    for key in touched:
+        touched_buckets.setdefault(_bucket(key), set()).add(key)
+    bucket_digests = list(cache.bucket_digests)
+    for index, keys in touched_buckets.items():
+        current = sorted(key for key in keys.union(cache.buckets[index]) if key in collection)
+        bucket_digests[index] = _node_digest([
+            _record_digest(key, collection.peek(key)) if key in keys else cache.digest(key) for key in current
+        ])
+    return _node_digest(bucket_digests)
+
+
+def data_hash(data: Dict[str, Any], incremental: bool = False) -> str:
+    """Hashes a database made of named record collections.
+
+    By default the result is byte-identical to `consistent_hash(to_hashable(data))`, the
+    hash the ground-truth cache holds. Records that a copy-on-write snapshot has not touched
+    reuse their serialization cached on the shared base, but the whole database is still
+    streamed through SHA-256, so every call is O(all records).
+
+    With `incremental=True` the result is the root of a hash tree instead: record digests,
+    bucket digests (records are spread over `TREE_BUCKETS` buckets by key), one digest per
+    collection and the root over the collections. The digests of the base are cached, so a
+    snapshot only rehashes its touched records and the buckets they fall in. The two modes
+    give different digests and must not be compared with each other.
+    """
+    names = sorted(data)
+    if incremental:
+        return _node_digest([
+            _node_digest([sha256(repr(name).encode("utf-8")).digest(), _collection_digest(data[name])]) for name in names
+        ]).hex()
+    parts = [f"({name!r}, {_collection_repr(data[name])})" for name in names]
+    return sha256(_join_tuple(parts).encode("utf-8")).hexdigest()
+
+
+def _collections_equal(collection: Any, other: Any) -> bool:
+    if (
+        isinstance(collection, CopyOnWriteCollection)
+        and isinstance(other, CopyOnWriteCollection)
+        and collection._base is other._base
+    ):
+        # untouched records are the shared base records on both sides
+        for key in collection.touched_keys | other.touched_keys:
+            present = key in collection
+            if present != (key in other):
+                return False
+            if present and _entry_repr(key, collection.peek(key)) != _entry_repr(key, other.peek(key)):
+                return False
+        return True
+    return repr(to_hashable(collection)) == repr(to_hashable(other))
+
+
+def data_equal(data: Dict[str, Any], other: Dict[str, Any]) -> bool:
+    """Whether `data_hash(data) == data_hash(other)`.
+
+    Copy-on-write snapshots of the same base only compare the records either of
+    them touched, using the same serialization as the hash, so the cost is
+    O(touched records) instead of hashing both databases.
+    """
+    if sorted(data) != sorted(other):
+        return False
+    return all(_collections_equal(data[name], other[name]) for name in data)
@@ -0,0 +1,57 @@
+"""Task splits stored as data files.
+
+Every split is a JSON lines file `<env>/data/tasks_<split>.jsonl` with one task per line, read through a
+`TaskStore`, so loading a range or a selection of tasks only parses those tasks. Fields of a line that `Task`
+does not declare (e.g. `annotator`) are kept in the file and ignored when loading.
+"""
+
+import os
+from functools import lru_cache
+from typing import Collection, Dict, List, Optional, Tuple
+
+from tau_bench.envs.task_store import TaskStore
+from tau_bench.types import Task
+
+ENVS_FOLDER_PATH = os.path.dirname(__file__)
+
+# env name -> split names
+TASK_SPLITS: Dict[str, Tuple[str, ...]] = {
+    "retail": ("train", "test", "dev"),
+    "airline": ("test",),
+}
+
+
+def task_split_path(env_name: str, split: str) -> str:
+    if split not in TASK_SPLITS.get(env_name, ()):
+        raise ValueError(f"Unknown task split: {split}")
+    return os.path.join(ENVS_FOLDER_PATH, env_name, "data", f"tasks_{split}.jsonl")
+
+
+@lru_cache(maxsize=None)
+def get_task_store(env_name: str, split: str) -> TaskStore:
+    return TaskStore(task_split_path(env_name, split))
+
+
+def count_tasks(env_name: str, split: str) -> int:
+    return len(get_task_store(env_name, split))
+
+
+def load_tasks(env_name: str, split: str, start: int = 0, end: Optional[int] = None) -> List[Task]:
+    """Tasks `start` to `end` (exclusive, None for the end of the split) of a split; only those tasks are parsed."""
+    store = get_task_store(env_name, split)
+    return store.load(range(*slice(start, end).indices(len(store))))
+
+
+def select_tasks(
+    env_name: str,
+    split: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    user_id: Optional[str] = None,
+    tools: Optional[Collection[str]] = None,
+    has_outputs: Optional[bool] = None,
+) -> List[Tuple[int, Task]]:
+    """(index in the split, task) of the tasks matching `TaskStore.select`; only the matches are parsed."""
+    store = get_task_store(env_name, split)
+    indices = store.select(start, end, user_id=user_id, tools=tools, has_outputs=has_outputs)
+    return list(zip(indices, store.load(indices)))
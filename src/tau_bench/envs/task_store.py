@@ -0,0 +1,160 @@
+"""Random access to a JSON lines task file through an offset index.
+
+The index holds, for every task (line) of the file, its byte offset and length and the fields tasks are
+selected by: `user_id`, the tools its actions call and whether it has expected outputs. Reading task `i` is
+one seek and one `json.loads`; selecting tasks only looks at the index. The index is built with one pass over
+the file and saved next to it as `<file>.index.json`, stamped with the file's size and modification time so
+that it is rebuilt as soon as the file changes.
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Collection, Dict, Iterable, List, Optional, Tuple
+
+from tau_bench.file_utils import file_lock
+from tau_bench.types import Task
+
+INDEX_SUFFIX = ".index.json"
+
+
+@dataclass(frozen=True)
+class TaskIndexEntry:
+    """Task stored as `length` bytes at `offset` of the task file."""
+
+    offset: int
+    length: int
+    user_id: str
+    tools: Tuple[str, ...]
+    has_outputs: bool
+
+    @classmethod
+    def from_record(cls, offset: int, length: int, record: Dict[str, Any]) -> "TaskIndexEntry":
+        # distinct tool names in call order
+        tools = tuple(dict.fromkeys(action["name"] for action in record.get("actions", [])))
+        return cls(offset, length, record["user_id"], tools, bool(record.get("outputs")))
+
+    def to_row(self) -> List[Any]:
+        return [self.offset, self.length, self.user_id, list(self.tools), self.has_outputs]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "TaskIndexEntry":
+        offset, length, user_id, tools, has_outputs = row
+        return cls(offset, length, user_id, tuple(tools), has_outputs)
+
+
+def _source_stamp(path: str) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class TaskStore:
+    """
+    The tasks of one JSON lines file (one task per line, see `task_splits`), addressed by their line number.
+
+    Safe to share between threads. `append` adds tasks at the end of the file and keeps the index current,
+    e.g. to grow a synthetic split without rewriting it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self._lock = threading.Lock()
+        self.entries: List[TaskIndexEntry] = self._load_index()
+
+    def _load_index(self) -> List[TaskIndexEntry]:
+        with open(self.path, "rb") as f, file_lock(f, shared=True):
+            return self._read_index(f)
+
+    def _read_index(self, f: BinaryIO) -> List[TaskIndexEntry]:
+        """
+        The index of the task file open as `f` (locked by the caller, so no append is in progress): the saved
+        index if it is current, otherwise rebuilt and saved.
+        """
+        stamp = _source_stamp(self.path)
+        self._stamp = stamp
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index.get("source") == stamp:
+                return [TaskIndexEntry.from_row(row) for row in index["entries"]]
+        entries = []
+        offset = 0
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                entries.append(TaskIndexEntry.from_record(offset, len(line), json.loads(line)))
+            offset += len(line)
+        self._save_index(entries, stamp)
+        return entries
+
+    def _save_index(self, entries: List[TaskIndexEntry], stamp: Dict[str, int]) -> None:
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"source": stamp, "entries": [entry.to_row() for entry in entries]}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # e.g. a read-only checkout: the index is rebuilt by every process instead
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _read(self, f, entry: TaskIndexEntry) -> Task:
+        f.seek(entry.offset)
+        return Task(**json.loads(f.read(entry.length)))
+
+    def get(self, index: int) -> Task:
+        return self.load([index])[0]
+
+    def load(self, indices: Iterable[int]) -> List[Task]:
+        """The tasks at `indices`, in that order."""
+        entries = [self.entries[index] for index in indices]
+        with open(self.path, "rb") as f:
+            return [self._read(f, entry) for entry in entries]
+
+    def select(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        user_id: Optional[str] = None,
+        tools: Optional[Collection[str]] = None,
+        has_outputs: Optional[bool] = None,
+    ) -> List[int]:
+        """
+        Indices in `start:end` of the tasks of `user_id` that call any of `tools` and have (or do not have)
+        expected outputs; None leaves a criterion out.
+        """
+        tools = set(tools) if tools is not None else None
+        return [
+            index
+            for index in range(*slice(start, end).indices(len(self.entries)))
+            if (user_id is None or self.entries[index].user_id == user_id)
+            and (tools is None or not tools.isdisjoint(self.entries[index].tools))
+            and (has_outputs is None or self.entries[index].has_outputs == has_outputs)
+        ]
+
+    def append(self, tasks: Iterable[Task]) -> List[int]:
+        """
+        Appends `tasks` to the file and the index. Returns their indices. Other processes may append to the
+        same file: the file stays locked from reading its current end until the index is saved, and tasks
+        they appended since this store loaded its index are indexed first.
+        """
+        lines = [(json.dumps(task.model_dump(), ensure_ascii=False) + "\n").encode("utf-8") for task in tasks]
+        with self._lock, open(self.path, "a+b") as f, file_lock(f):
+            if _source_stamp(self.path) != self._stamp:
+                self.entries = self._read_index(f)
+            offset = os.fstat(f.fileno()).st_size
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            first = len(self.entries)
+            for line in lines:
+                self.entries.append(TaskIndexEntry.from_record(offset, len(line), json.loads(line)))
+                offset += len(line)
+            self._stamp = _source_stamp(self.path)
+            self._save_index(self.entries, self._stamp)
+            return list(range(first, len(self.entries)))
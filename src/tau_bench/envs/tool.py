@@ -3,6 +3,9 @@ from typing import Any
 
 
 class Tool(abc.ABC):
+    # True for tools that never modify `data`; rewards skip database comparisons for episodes that only call these
+    read_only: bool = False
+
     @staticmethod
     def invoke(*args, **kwargs):
         raise NotImplementedError
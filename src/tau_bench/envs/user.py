@@ -2,10 +2,56 @@
 
 import abc
 import enum
+import time
 from litellm import completion
 
 from typing import Optional, List, Dict, Any, Union
 
+from tau_bench.llm_cache import PersistentLLMCache
+from tau_bench.llm_usage import LLMUsage, openai_usage, report_usage
+from tau_bench.rate_limit import (
+    Priority,
+    RateLimitScheduler,
+    estimate_tokens,
+    get_default_scheduler,
+)
+
+
+def scheduled_completion(
+    model: str,
+    provider: str,
+    messages: List[Dict[str, Any]],
+    scheduler: Optional[RateLimitScheduler] = None,
+):
+    """Runs a litellm completion through the shared rate limit scheduler at user priority."""
+    scheduler = scheduler or get_default_scheduler()
+    estimated_tokens = estimate_tokens(messages)
+    started = time.perf_counter()
+    res = scheduler.call(
+        provider,
+        lambda: completion(
+            model=model, custom_llm_provider=provider, messages=messages
+        ),
+        priority=Priority.USER,
+        estimated_tokens=estimated_tokens,
+    )
+    scheduler.record_headers(provider, res._hidden_params.get("additional_headers"))
+    usage = getattr(res, "usage", None)
+    scheduler.record_usage(
+        provider, estimated_tokens, getattr(usage, "total_tokens", None)
+    )
+    report_usage(
+        openai_usage(
+            provider,
+            model,
+            "user",
+            usage,
+            latency_s=time.perf_counter() - started,
+            cost=res._hidden_params.get("response_cost"),
+        )
+    )
+    return res
+
 
 class BaseUserSimulationEnv(abc.ABC):
     metadata = {}
@@ -35,22 +81,54 @@ class HumanUserSimulationEnv(BaseUserSimulationEnv):
 
 
 class LLMUserSimulationEnv(BaseUserSimulationEnv):
-    def __init__(self, model: str, provider: str) -> None:
+    def __init__(
+        self,
+        model: str,
+        provider: str,
+        cache: Optional[PersistentLLMCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+    ) -> None:
         super().__init__()
         self.messages: List[Dict[str, Any]] = []
         self.model = model
         self.provider = provider
-        self.total_cost = 0.0
+        self.cache = cache
+        self.scheduler = scheduler
         self.reset()
 
-    def generate_next_message(self, messages: List[Dict[str, Any]]) -> str:
-        res = completion(
-            model=self.model, custom_llm_provider=self.provider, messages=messages
+    def complete(self, messages: List[Dict[str, Any]], attempt: int = 0) -> Dict[str, Any]:
+        """
+        Calls the user model and returns the generated message, served from `self.cache` when possible.
+        `attempt` > 0 asks for another sample of the same messages, e.g. after a rejected response.
+        """
+        key = None
+        if self.cache is not None:
+            # attempt 0 keeps the keys of plain completions
+            attempt_params = {"attempt": attempt} if attempt else {}
+            key = self.cache.make_key(
+                model=self.model, messages=messages, provider=self.provider, **attempt_params
+            )
+            cached_message = self.cache.get(key)
+            if cached_message is not None:
+                report_usage(
+                    LLMUsage(
+                        self.provider, self.model, "user", from_response_cache=True
+                    )
+                )
+                return cached_message
+        res = scheduled_completion(
+            self.model, self.provider, messages, scheduler=self.scheduler
         )
-        message = res.choices[0].message
-        self.messages.append(message.model_dump())
-        self.total_cost = res._hidden_params["response_cost"]
-        return message.content
+        message = res.choices[0].message.model_dump()
+        self.total_cost += res._hidden_params.get("response_cost") or 0.0
+        if key is not None:
+            self.cache.set(key, message)
+        return message
+
+    def generate_next_message(self, messages: List[Dict[str, Any]]) -> str:
+        message = self.complete(messages)
+        self.messages.append(message)
+        return message["content"]
 
     def build_system_prompt(self, instruction: Optional[str]) -> str:
         instruction_display = (
@@ -68,6 +146,7 @@ Rules:
 - Try to make the conversation as natural as possible, and stick to the personalities in the instruction."""
 
     def reset(self, instruction: Optional[str] = None) -> str:
+        self.total_cost = 0.0
         self.messages = [
             {
                 "role": "system",
@@ -86,8 +165,16 @@ Rules:
 
 
 class ReactUserSimulationEnv(LLMUserSimulationEnv):
-    def __init__(self, model: str, provider: str) -> None:
-        super().__init__(model=model, provider=provider)
+    def __init__(
+        self,
+        model: str,
+        provider: str,
+        cache: Optional[PersistentLLMCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+    ) -> None:
+        super().__init__(
+            model=model, provider=provider, cache=cache, scheduler=scheduler
+        )
         self.reset()
 
     def build_system_prompt(self, instruction: Optional[str]) -> str:
@@ -115,15 +202,12 @@ User Response:
 <the user response (this will be parsed and sent to the agent)>"""
 
     def generate_next_message(self, messages: List[Dict[str, Any]]) -> str:
-        res = completion(
-            model=self.model, custom_llm_provider=self.provider, messages=messages
-        )
-        message = res.choices[0].message
-        self.messages.append(message.model_dump())
-        self.total_cost = res._hidden_params["response_cost"]
-        return self.parse_response(message.content)
+        message = self.complete(messages)
+        self.messages.append(message)
+        return self.parse_response(message["content"])
 
     def reset(self, instruction: Optional[str] = None) -> str:
+        self.total_cost = 0.0
         self.messages = [
             {
                 "role": "system",
@@ -154,29 +238,38 @@ User Response:
 
 
 class VerifyUserSimulationEnv(LLMUserSimulationEnv):
-    def __init__(self, model: str, provider: str, max_attempts: int = 3) -> None:
+    def __init__(
+        self,
+        model: str,
+        provider: str,
+        max_attempts: int = 3,
+        cache: Optional[PersistentLLMCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+    ) -> None:
         self.model = model
         self.provider = provider
         self.max_attempts = max_attempts
+        self.cache = cache
+        self.scheduler = scheduler
         self.reset()
 
     def generate_next_message(self, messages: List[Dict[str, Any]]) -> str:
         attempts = 0
         cur_message = None
         while attempts < self.max_attempts:
-            res = completion(
-                model=self.model, custom_llm_provider=self.provider, messages=messages
-            )
-            cur_message = res.choices[0].message
-            self.total_cost = res._hidden_params["response_cost"]
-            if verify(self.model, self.provider, cur_message, messages):
-                self.messages.append(cur_message.model_dump())
-                return cur_message.content
+            # every attempt is its own sample, a cached rejected response must not come back
+            cur_message = self.complete(messages, attempt=attempts)
+            if verify(
+                self.model, self.provider, cur_message, messages, self.scheduler
+            ):
+                self.messages.append(cur_message)
+                return cur_message["content"]
             attempts += 1
         assert cur_message is not None
-        return cur_message.content
+        return cur_message["content"]
 
     def reset(self, instruction: Optional[str] = None) -> str:
+        self.total_cost = 0.0
         self.messages = [
             {
                 "role": "system",
@@ -204,7 +297,11 @@ def map_role_label(role: str) -> str:
 
 
 def verify(
-    model: str, provider: str, response: str, messages: List[Dict[str, Any]]
+    model: str,
+    provider: str,
+    response: str,
+    messages: List[Dict[str, Any]],
+    scheduler: Optional[RateLimitScheduler] = None,
 ) -> bool:
     transcript = "\n".join(
         [
@@ -224,16 +321,18 @@ Your answer will be parsed, so do not include any other text than the classifica
 -----
 
 Classification:"""
-    res = completion(
-        model=model,
-        custom_llm_provider=provider,
-        messages=[{"role": "user", "content": prompt}],
+    res = scheduled_completion(
+        model, provider, [{"role": "user", "content": prompt}], scheduler=scheduler
     )
     return "true" in res.choices[0].message.content.lower()
 
 
 def reflect(
-    model: str, provider: str, response: str, messages: List[Dict[str, Any]]
+    model: str,
+    provider: str,
+    response: str,
+    messages: List[Dict[str, Any]],
+    scheduler: Optional[RateLimitScheduler] = None,
 ) -> str:
     transcript = "\n".join(
         [
@@ -258,40 +357,64 @@ Reflection:
 
 Response:
 <the response (this will be parsed and sent to the agent)>"""
-    res = completion(
-        model=model,
-        custom_llm_provider=provider,
-        messages=[{"role": "user", "content": prompt}],
+    res = scheduled_completion(
+        model, provider, [{"role": "user", "content": prompt}], scheduler=scheduler
     )
     _, response = res.choices[0].message.content.split("Response:")
     return response.strip()
 
 
 class ReflectionUserSimulationEnv(LLMUserSimulationEnv):
-    def __init__(self, model: str, provider: str, max_attempts: int = 2) -> None:
+    def __init__(
+        self,
+        model: str,
+        provider: str,
+        max_attempts: int = 2,
+        cache: Optional[PersistentLLMCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+    ) -> None:
         self.model = model
         self.provider = provider
         self.max_attempts = max_attempts
+        self.cache = cache
+        self.scheduler = scheduler
         self.reset()
 
     def generate_next_message(self, messages: List[Dict[str, Any]]) -> str:
         cur_messages = messages.copy()
         initial_response = super().generate_next_message(cur_messages)
-        if verify(self.model, self.provider, initial_response, cur_messages):
+        if verify(
+            self.model,
+            self.provider,
+            initial_response,
+            cur_messages,
+            self.scheduler,
+        ):
             return initial_response
         attempts = 1
         while attempts < self.max_attempts:
             new_message = reflect(
-                self.model, self.provider, initial_response, cur_messages
+                self.model,
+                self.provider,
+                initial_response,
+                cur_messages,
+                self.scheduler,
             )
             cur_messages.append({"role": "user", "content": new_message})
             new_response = super().generate_next_message(cur_messages)
-            if verify(self.model, self.provider, new_response, cur_messages):
+            if verify(
+                self.model,
+                self.provider,
+                new_response,
+                cur_messages,
+                self.scheduler,
+            ):
                 return new_response
             attempts += 1
         return initial_response
 
     def reset(self, instruction: Optional[str] = None) -> str:
+        self.total_cost = 0.0
         self.messages = [
             {
                 "role": "system",
@@ -321,6 +444,8 @@ def load_user(
     user_strategy: Union[str, UserStrategy],
     model: Optional[str] = "gpt-4o",
     provider: Optional[str] = None,
+    cache: Optional[PersistentLLMCache] = None,
+    scheduler: Optional[RateLimitScheduler] = None,
 ) -> BaseUserSimulationEnv:
     if isinstance(user_strategy, str):
         user_strategy = UserStrategy(user_strategy)
@@ -331,23 +456,31 @@ def load_user(
             raise ValueError("LLM user strategy requires a model")
         if provider is None:
             raise ValueError("LLM user strategy requires a model provider")
-        return LLMUserSimulationEnv(model=model, provider=provider)
+        return LLMUserSimulationEnv(
+            model=model, provider=provider, cache=cache, scheduler=scheduler
+        )
     elif user_strategy == UserStrategy.REACT:
         if model is None:
             raise ValueError("React user strategy requires a model")
         if provider is None:
             raise ValueError("React user strategy requires a model provider")
-        return ReactUserSimulationEnv(model=model, provider=provider)
+        return ReactUserSimulationEnv(
+            model=model, provider=provider, cache=cache, scheduler=scheduler
+        )
     elif user_strategy == UserStrategy.VERIFY:
         if model is None:
             raise ValueError("Verify user strategy requires a model")
         if provider is None:
             raise ValueError("Verify user strategy requires a model provider")
-        return VerifyUserSimulationEnv(model=model, provider=provider)
+        return VerifyUserSimulationEnv(
+            model=model, provider=provider, cache=cache, scheduler=scheduler
+        )
     elif user_strategy == UserStrategy.REFLECTION:
         if model is None:
             raise ValueError("Reflection user strategy requires a model")
         if provider is None:
             raise ValueError("Reflection user strategy requires a model provider")
-        return ReflectionUserSimulationEnv(model=model, provider=provider)
+        return ReflectionUserSimulationEnv(
+            model=model, provider=provider, cache=cache, scheduler=scheduler
+        )
     raise ValueError(f"Unknown user strategy {user_strategy}")
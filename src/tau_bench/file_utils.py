@@ -0,0 +1,59 @@
+import os
+from contextlib import contextmanager
+from typing import IO, BinaryIO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, appends then rely on O_APPEND only
+    fcntl = None
+
+
+@contextmanager
+def file_lock(f: IO, shared: bool = False) -> Iterator[None]:
+    """Holds an exclusive (or shared) lock on the open file `f` for the duration of the block."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def locked_append(f: BinaryIO, data: bytes, fsync: bool = False) -> None:
+    """
+    Appends `data` to a file opened in append mode with a single write under an exclusive lock, so lines written
+    by several processes never interleave.
+    """
+    with file_lock(f):
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+
+def read_complete_lines(path: str) -> Iterator[bytes]:
+    """Lines of an append-only file, skipping a truncated last line left by a writer that was killed mid-append."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield line
+
+
+def truncate_partial_line(path: str) -> None:
+    """Drops a truncated last line so that appending to the file starts on a fresh line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f, file_lock(f):
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        content = f.read()
+        f.truncate(content.rfind(b"\n") + 1)
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+from typing import Any, Dict, Iterator, List, Optional
+
+_sample: ContextVar[int] = ContextVar("llm_cache_sample", default=0)
+
+
+@contextmanager
+def cache_sample(sample: int) -> Iterator[None]:
+    """
+    Keys LLM calls made in the current context (thread or asyncio task, including `asyncio.to_thread` calls
+    started from it) to `sample`, e.g. the trial of an episode. Completions are sampled, so independent trials
+    of a task must not replay each other's cached responses; sample 0 uses the same keys as no sample at all.
+    """
+    token = _sample.set(sample)
+    try:
+        yield
+    finally:
+        _sample.reset(token)
+
+
+class PersistentLLMCache:
+    """Content-addressed, size-bounded LRU cache of LLM responses stored in SQLite.
+
+    Keys are derived from everything that determines a completion (model, messages,
+    stop sequences, sampling parameters and the sample set with `cache_sample`), never
+    from object identities, so entries survive restarts and can be shared by several
+    worker processes through the same cache directory.
+
+    The total size of the entries is kept in a `meta` row updated in the same transaction
+    as every insert and eviction, so bounding the cache never scans it. Hits do not write:
+    `last_access` is only refreshed when it is older than `ACCESS_RESOLUTION_S`, and those
+    refreshes are written in batches, with the next insert or by `flush`.
+    """
+
+    FILE_NAME = "llm_cache.sqlite3"
+    ACCESS_RESOLUTION_S = 60.0
+    TOUCH_BATCH_SIZE = 64
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 1 << 30) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.max_size_bytes = max_size_bytes
+        self._local = threading.local()
+        # key -> last access time not written yet
+        self._pending_touches: Dict[str, float] = {}
+        self._touches_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # caches created before the running total existed are summed once
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (name, value) SELECT 'total_size', COALESCE(SUM(size), 0) FROM responses"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        stop_sequences: Optional[List[str]] = None,
+        temperature: Optional[float] = None,
+        **params: Any,
+    ) -> str:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stop_sequences": stop_sequences or [],
+            "temperature": temperature,
+            "params": params,
+        }
+        sample = _sample.get()
+        if sample:
+            payload["sample"] = sample
+        return sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT value, last_access FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, last_access = row
+        now = time.time()
+        if now - last_access >= self.ACCESS_RESOLUTION_S:
+            with self._touches_lock:
+                self._pending_touches[key] = now
+                batch_full = len(self._pending_touches) >= self.TOUCH_BATCH_SIZE
+            if batch_full:
+                self.flush()
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        serialized = json.dumps(value)
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, serialized, len(serialized), time.time()),
+            )
+            self._add_size(conn, len(serialized) - (row[0] if row is not None else 0))
+            self._write_touches(conn)
+            self._evict(conn)
+
+    def flush(self) -> None:
+        """Writes the pending `last_access` refreshes."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_touches(conn)
+
+    def _write_touches(self, conn: sqlite3.Connection) -> None:
+        with self._touches_lock:
+            touches, self._pending_touches = self._pending_touches, {}
+        conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?", [(at, key) for key, at in touches.items()])
+
+    @staticmethod
+    def _add_size(conn: sqlite3.Connection, delta: int) -> None:
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_size'", (delta,))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (total_size,) = conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            stale_keys.append((key,))
+            freed += size
+            if total_size - freed <= self.max_size_bytes:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self._add_size(conn, -freed)
+
+    def __len__(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+@dataclass
+class LLMUsage:
+    """
+    Token usage, latency and cost of one LLM call. Cached prompt tokens were served from the provider's
+    prompt-prefix cache. `latency_s` is the wall time of the call including rate limit waits and retries;
+    `step` is the agent iteration the call was made in, if any.
+    """
+
+    provider: str
+    model: str
+    phase: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    cache_creation_tokens: int = 0
+    from_response_cache: bool = False
+    latency_s: float = 0.0
+    cost: float = 0.0
+    step: Optional[int] = None
+
+    @property
+    def uncached_prompt_tokens(self) -> int:
+        return self.prompt_tokens - self.cached_prompt_tokens
+
+    def model_dump(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+UsageSink = Callable[[LLMUsage], None]
+
+_usage_sinks: ContextVar[Tuple[UsageSink, ...]] = ContextVar("llm_usage_sinks", default=())
+
+
+@contextmanager
+def collect_usage(sink: UsageSink) -> Iterator[None]:
+    """
+    Sends the usage of every LLM call made in the current context (thread or asyncio task, including
+    `asyncio.to_thread` calls started from it) to `sink`. Nested collectors all receive the calls,
+    innermost first.
+    """
+    token = _usage_sinks.set((sink,) + _usage_sinks.get())
+    try:
+        yield
+    finally:
+        _usage_sinks.reset(token)
+
+
+def report_usage(usage: LLMUsage) -> None:
+    for sink in _usage_sinks.get():
+        sink(usage)
+
+
+def estimate_cost(usage: LLMUsage) -> float:
+    """USD cost from litellm's price map (with cache discounts), 0 for models it does not know."""
+    if usage.from_response_cache:
+        return 0.0
+    try:
+        import litellm
+
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=usage.model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cache_read_input_tokens=usage.cached_prompt_tokens,
+            cache_creation_input_tokens=usage.cache_creation_tokens,
+        )
+    except Exception:
+        return 0.0
+    return prompt_cost + completion_cost
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _with_cost(usage: LLMUsage, cost: Optional[float]) -> LLMUsage:
+    usage.cost = estimate_cost(usage) if cost is None else cost
+    return usage
+
+
+def openai_usage(
+    provider: str, model: str, phase: Optional[str], usage: Any, latency_s: float = 0.0, cost: Optional[float] = None
+) -> LLMUsage:
+    """From an OpenAI-style `usage` (also returned by litellm); cached tokens are in `prompt_tokens_details`."""
+    return _with_cost(LLMUsage(
+        provider=provider,
+        model=model,
+        phase=phase,
+        prompt_tokens=_field(usage, "prompt_tokens") or 0,
+        completion_tokens=_field(usage, "completion_tokens") or 0,
+        cached_prompt_tokens=_field(_field(usage, "prompt_tokens_details"), "cached_tokens") or 0,
+        cache_creation_tokens=_field(usage, "cache_creation_input_tokens") or 0,
+        latency_s=latency_s,
+    ), cost)
+
+
+def gemini_usage(
+    provider: str, model: str, phase: Optional[str], usage_metadata: Any, latency_s: float = 0.0, cost: Optional[float] = None
+) -> LLMUsage:
+    return _with_cost(LLMUsage(
+        provider=provider,
+        model=model,
+        phase=phase,
+        prompt_tokens=_field(usage_metadata, "prompt_token_count") or 0,
+        completion_tokens=_field(usage_metadata, "candidates_token_count") or 0,
+        cached_prompt_tokens=_field(usage_metadata, "cached_content_token_count") or 0,
+        latency_s=latency_s,
+    ), cost)
+
+
+def anthropic_usage(
+    provider: str, model: str, phase: Optional[str], usage: Any, latency_s: float = 0.0, cost: Optional[float] = None
+) -> LLMUsage:
+    """Anthropic reports cache reads and writes separately from `input_tokens`, which only counts uncached tokens."""
+    cache_read = _field(usage, "cache_read_input_tokens") or 0
+    cache_creation = _field(usage, "cache_creation_input_tokens") or 0
+    return _with_cost(LLMUsage(
+        provider=provider,
+        model=model,
+        phase=phase,
+        prompt_tokens=(_field(usage, "input_tokens") or 0) + cache_read + cache_creation,
+        completion_tokens=_field(usage, "output_tokens") or 0,
+        cached_prompt_tokens=cache_read,
+        cache_creation_tokens=cache_creation,
+        latency_s=latency_s,
+    ), cost)
@@ -0,0 +1,125 @@
+import threading
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Iterable, List, Optional
+
+from tau_bench.llm_usage import LLMUsage
+
+UNKNOWN_PHASE = "other"
+
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    response_cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    cache_creation_tokens: int = 0
+    latency_s: float = 0.0
+    cost: float = 0.0
+
+    def add(self, usage: LLMUsage) -> None:
+        self.calls += 1
+        self.response_cache_hits += int(usage.from_response_cache)
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.cached_prompt_tokens += usage.cached_prompt_tokens
+        self.cache_creation_tokens += usage.cache_creation_tokens
+        self.latency_s += usage.latency_s
+        self.cost += usage.cost
+
+    def merge(self, other: "UsageTotals") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UsageTotals":
+        # ignores derived values such as `cached_prompt_ratio`
+        return cls(**{field.name: data[field.name] for field in fields(cls) if field.name in data})
+
+    @property
+    def cached_prompt_ratio(self) -> float:
+        return self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def model_dump(self) -> Dict[str, Any]:
+        return {**asdict(self), "cached_prompt_ratio": self.cached_prompt_ratio}
+
+
+def summarize_usage(calls: Iterable[LLMUsage]) -> Dict[str, Any]:
+    """Totals over `calls`, overall and per phase (user, belief, plan, action, final_answer)."""
+    total = UsageTotals()
+    by_phase: Dict[str, UsageTotals] = {}
+    for usage in calls:
+        total.add(usage)
+        by_phase.setdefault(usage.phase or UNKNOWN_PHASE, UsageTotals()).add(usage)
+    return {"total": total.model_dump(), "by_phase": {phase: totals.model_dump() for phase, totals in by_phase.items()}}
+
+
+class MetricsCollector:
+    """
+    Thread-safe sink for `LLMUsage` records (see `tau_bench.llm_usage.collect_usage`), aggregated per phase.
+
+    An episode collector keeps the individual calls so they can also be split per agent step; a run-level
+    collector (`keep_calls=False`) only merges the per-phase totals of its episodes.
+    """
+
+    def __init__(self, keep_calls: bool = True) -> None:
+        self.keep_calls = keep_calls
+        self.calls: List[LLMUsage] = []
+        self.total = UsageTotals()
+        self.by_phase: Dict[str, UsageTotals] = {}
+        self.episodes = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage: LLMUsage) -> None:
+        with self._lock:
+            if self.keep_calls:
+                self.calls.append(usage)
+            self.total.add(usage)
+            self.by_phase.setdefault(usage.phase or UNKNOWN_PHASE, UsageTotals()).add(usage)
+
+    def merge(self, episode: "MetricsCollector") -> None:
+        with self._lock:
+            self.episodes += 1
+            self.total.merge(episode.total)
+            for phase, totals in episode.by_phase.items():
+                self.by_phase.setdefault(phase, UsageTotals()).merge(totals)
+
+    def merge_summary(self, summary: Dict[str, Any]) -> None:
+        """Merges an episode's `summary()`, e.g. one read back from a run manifest."""
+        with self._lock:
+            self.episodes += 1
+            self.total.merge(UsageTotals.from_dict(summary["total"]))
+            for phase, totals in summary["by_phase"].items():
+                self.by_phase.setdefault(phase, UsageTotals()).merge(UsageTotals.from_dict(totals))
+
+    def by_step(self) -> Dict[Optional[int], Dict[str, Any]]:
+        steps: Dict[Optional[int], List[LLMUsage]] = {}
+        for usage in self.calls:
+            steps.setdefault(usage.step, []).append(usage)
+        return {step: summarize_usage(calls) for step, calls in steps.items()}
+
+    def summary(self, include_steps: bool = False) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "total": self.total.model_dump(),
+            "by_phase": {phase: totals.model_dump() for phase, totals in self.by_phase.items()},
+        }
+        if self.episodes:
+            summary["episodes"] = self.episodes
+        if include_steps:
+            # calls outside agent steps (e.g. the user simulator's opening message) have no step
+            summary["by_step"] = [
+                {"step": step, **step_summary} for step, step_summary in self.by_step().items()
+            ]
+        return summary
+
+    def format_table(self) -> str:
+        """Per-phase table for console summaries."""
+        header = f"{'phase':<14}{'calls':>8}{'prompt tok':>14}{'cached':>9}{'output tok':>12}{'latency s':>12}{'cost $':>10}"
+        rows = [header]
+        for phase, totals in sorted(self.by_phase.items()) + [("total", self.total)]:
+            rows.append(
+                f"{phase:<14}{totals.calls:>8}{totals.prompt_tokens:>14}{totals.cached_prompt_ratio:>9.0%}"
+                f"{totals.completion_tokens:>12}{totals.latency_s:>12.1f}{totals.cost:>10.4f}"
+            )
+        return "\n".join(rows)
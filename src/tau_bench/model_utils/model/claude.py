@@ -1,6 +1,7 @@
 import json
 import os
 
+from tau_bench.llm_usage import anthropic_usage, report_usage
 from tau_bench.model_utils.api.datapoint import Datapoint
 from tau_bench.model_utils.model.chat import ChatModel, Message
 from tau_bench.model_utils.model.completion import approx_cost_for_datapoint, approx_prompt_str
@@ -31,6 +32,8 @@ MAX_CONTEXT_LENGTH_MAP = {
 }
 MAX_CONTEXT_LENGTH_FALLBACK = 8192
 
+CACHE_CONTROL = {"type": "ephemeral"}
+
 
 class ClaudeModel(ChatModel):
     def __init__(
@@ -105,6 +108,23 @@ class ClaudeModel(ChatModel):
                     remapped[-1]["content"] += "\n\n" + message["content"]
         return remapped
 
+    def _add_cache_breakpoints(self, messages: list[dict[str, str]]) -> list[dict]:
+        """
+        Marks prompt-cache breakpoints (https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching):
+        after the first message, which holds the instructions, and after the conversation up to the latest
+        turn, so the next call reuses everything but the newest messages. The input is not modified.
+        """
+        breakpoints = {0, len(messages) - 2}
+        return [
+            {
+                "role": message["role"],
+                "content": [{"type": "text", "text": message["content"], "cache_control": CACHE_CONTROL}],
+            }
+            if i in breakpoints
+            else message
+            for i, message in enumerate(messages)
+        ]
+
     def build_generate_message_state(
         self,
         messages: list[Message],
@@ -129,10 +149,11 @@ class ClaudeModel(ChatModel):
         msgs = self.build_generate_message_state(messages)
         res = self.client.messages.create(
             model=self.model,
-            messages=msgs,
+            messages=self._add_cache_breakpoints(msgs),
             temperature=wrap_temperature(temperature),
             max_tokens=DEFAULT_MAX_TOKENS,
         )
+        report_usage(anthropic_usage("anthropic", self.model, None, res.usage))
         return self.handle_generate_message_response(
             prompt=msgs, content=res.content[0].text, force_json=force_json
         )
@@ -1,5 +1,6 @@
 import os
 
+from tau_bench.llm_usage import openai_usage, report_usage
 from tau_bench.model_utils.api.datapoint import Datapoint
 from tau_bench.model_utils.model.chat import ChatModel, Message
 from tau_bench.model_utils.model.completion import approx_cost_for_datapoint, approx_prompt_str
@@ -99,6 +100,8 @@ class OpenAIModel(ChatModel):
             temperature=wrap_temperature(temperature),
             response_format={"type": "json_object" if force_json else "text"},
         )
+        # OpenAI caches prompt prefixes automatically, hits are reported as cached prompt tokens
+        report_usage(openai_usage("openai", self.model, None, res.usage))
         return self.handle_generate_message_response(
             prompt=msgs, content=res.choices[0].message.content, force_json=force_json
         )
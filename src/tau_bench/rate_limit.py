@@ -0,0 +1,273 @@
+import asyncio
+import enum
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Priority(enum.IntEnum):
+    """Lower values are served first when callers wait for the same provider budget."""
+
+    USER = 0
+    ACTION = 1
+    PLANNING = 2
+
+
+PHASE_PRIORITIES: Dict[str, Priority] = {
+    "user": Priority.USER,
+    "action": Priority.ACTION,
+    "final_answer": Priority.ACTION,
+    "belief": Priority.PLANNING,
+    "plan": Priority.PLANNING,
+}
+
+
+def priority_for_phase(phase: Optional[str]) -> Priority:
+    return PHASE_PRIORITIES.get(phase, Priority.ACTION)
+
+
+def estimate_tokens(messages: Any) -> int:
+    """Rough prompt size used to reserve token budget before the real usage is known (~4 characters per token)."""
+    return len(str(messages)) // 4 + 1
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_SCALE = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parses reset durations such as '1s', '6m0s' or '250ms' from rate limit headers."""
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_SCALE[unit] for amount, unit in parts)
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float, scale: float) -> None:
+        capacity = self.per_minute * scale
+        self.level = min(capacity, self.level + (now - self.updated_at) * capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        if self.level >= amount:
+            return 0.0
+        # a request larger than the whole budget only has to wait for a full bucket
+        missing = min(amount, self.per_minute * scale) - self.level
+        return max(missing, 0.0) * 60.0 / (self.per_minute * scale)
+
+
+class ProviderBudget:
+    """Requests-per-minute and tokens-per-minute budget of one provider.
+
+    Limits can be configured up front or learned from `x-ratelimit-*` response
+    headers. `scale` shrinks the effective budget after 429s and recovers slowly on
+    success (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        self.requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.configured = requests_per_minute is not None or tokens_per_minute is not None
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.waiting: Dict[Priority, int] = {priority: 0 for priority in Priority}
+
+    def try_acquire(self, priority: Priority, tokens: int) -> float:
+        """Takes budget for one request and returns 0, or returns how long to wait before retrying."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if any(count > 0 for waiting_priority, count in self.waiting.items() if waiting_priority < priority):
+            return 0.05
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now, self.scale)
+                wait = max(wait, bucket.wait_time(amount, self.scale))
+        if wait > 0:
+            return wait
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= tokens
+        return 0.0
+
+    def record_usage(self, reserved_tokens: int, used_tokens: int) -> None:
+        if self.tokens is not None:
+            self.tokens.level -= used_tokens - reserved_tokens
+
+    def record_success(self) -> None:
+        self.scale = min(1.0, self.scale + 0.01)
+
+    def record_rate_limited(self, delay: float) -> None:
+        self.scale = max(0.1, self.scale * 0.8)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        normalized = {}
+        for key, value in headers.items():
+            key = key.lower()
+            if key.startswith("llm_provider-"):
+                key = key[len("llm_provider-"):]
+            normalized[key] = value
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            limit = normalized.get(f"x-ratelimit-limit-{kind}")
+            remaining = normalized.get(f"x-ratelimit-remaining-{kind}")
+            reset = normalized.get(f"x-ratelimit-reset-{kind}")
+            bucket = getattr(self, kind)
+            if limit is not None and not self.configured:
+                try:
+                    per_minute = float(limit)
+                except ValueError:
+                    continue
+                if bucket is None:
+                    bucket = _TokenBucket(per_minute)
+                    setattr(self, kind, bucket)
+                bucket.per_minute = per_minute
+            if bucket is not None and remaining is not None:
+                try:
+                    bucket.refill(now, self.scale)
+                    bucket.level = min(bucket.level, float(remaining))
+                except ValueError:
+                    pass
+                if reset is not None and bucket.level <= 0:
+                    reset_seconds = _parse_duration(reset)
+                    if reset_seconds is not None:
+                        self.paused_until = max(self.paused_until, now + reset_seconds)
+
+
+class RateLimitScheduler:
+    """Admission control and retries shared by every LLM caller in the process.
+
+    Callers wait for their provider's budget in priority order (user-simulator turns
+    before actions before belief/plan calls). Rate limit errors are retried with
+    exponential backoff and full jitter, and pause the whole provider so concurrent
+    callers back off together instead of hammering it. Any other error, or running
+    out of retries, is raised to the caller.
+    """
+
+    def __init__(self, max_retries: int = 6, base_delay: float = 2.0, max_delay: float = 60.0) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._budgets: Dict[str, ProviderBudget] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, provider: str, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        with self._lock:
+            self._budgets[provider] = ProviderBudget(requests_per_minute, tokens_per_minute)
+
+    def _budget(self, provider: str) -> ProviderBudget:
+        # callers must hold self._lock
+        budget = self._budgets.get(provider)
+        if budget is None:
+            budget = ProviderBudget()
+            self._budgets[provider] = budget
+        return budget
+
+    def budget(self, provider: str) -> ProviderBudget:
+        with self._lock:
+            return self._budget(provider)
+
+    def _try_acquire(self, budget: ProviderBudget, priority: Priority, tokens: int) -> float:
+        with self._lock:
+            return budget.try_acquire(priority, tokens)
+
+    def _set_waiting(self, budget: ProviderBudget, priority: Priority, delta: int) -> None:
+        with self._lock:
+            budget.waiting[priority] += delta
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record_headers(self, provider: str, headers: Optional[Mapping[str, str]]) -> None:
+        if headers:
+            with self._lock:
+                self._budget(provider).update_from_headers(headers)
+
+    def record_usage(self, provider: str, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        if used_tokens is not None:
+            with self._lock:
+                self._budget(provider).record_usage(reserved_tokens, used_tokens)
+
+    def _on_error(self, budget: ProviderBudget, error: BaseException, attempt: int) -> float:
+        if not is_rate_limit_error(error) or attempt >= self.max_retries:
+            raise error
+        delay = self._backoff(attempt)
+        with self._lock:
+            budget.record_rate_limited(delay)
+        return delay
+
+    def _on_success(self, budget: ProviderBudget) -> None:
+        with self._lock:
+            budget.record_success()
+
+    def call(self, provider: str, fn: Callable[[], T], priority: Priority = Priority.ACTION, estimated_tokens: int = 0) -> T:
+        budget = self.budget(provider)
+        attempt = 0
+        while True:
+            self._set_waiting(budget, priority, 1)
+            try:
+                while (wait := self._try_acquire(budget, priority, estimated_tokens)) > 0:
+                    time.sleep(min(wait, 1.0))
+            finally:
+                self._set_waiting(budget, priority, -1)
+            try:
+                result = fn()
+            except Exception as e:
+                self._on_error(budget, e, attempt)
+                attempt += 1
+                continue
+            self._on_success(budget)
+            return result
+
+    async def acall(self, provider: str, fn: Callable[[], Awaitable[T]], priority: Priority = Priority.ACTION, estimated_tokens: int = 0) -> T:
+        budget = self.budget(provider)
+        attempt = 0
+        while True:
+            self._set_waiting(budget, priority, 1)
+            try:
+                while (wait := self._try_acquire(budget, priority, estimated_tokens)) > 0:
+                    await asyncio.sleep(min(wait, 1.0))
+            finally:
+                self._set_waiting(budget, priority, -1)
+            try:
+                result = await fn()
+            except Exception as e:
+                self._on_error(budget, e, attempt)
+                attempt += 1
+                continue
+            self._on_success(budget)
+            return result
+
+
+_default_scheduler = RateLimitScheduler()
+
+
+def get_default_scheduler() -> RateLimitScheduler:
+    return _default_scheduler
+
+
+def set_default_scheduler(scheduler: RateLimitScheduler) -> None:
+    global _default_scheduler
+    _default_scheduler = scheduler
@@ -0,0 +1,37 @@
+from math import comb
+from typing import Dict, Iterable, List, Tuple
+
+from tau_bench.run_manifest import ManifestEntry
+
+
+def is_successful(reward: float) -> bool:
+    return reward >= 1 - 1e-6
+
+
+def task_success_counts(entries: Iterable[ManifestEntry]) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """(split, task id) -> (successful trials, trials)."""
+    counts: Dict[Tuple[str, int], Tuple[int, int]] = {}
+    for entry in entries:
+        successes, trials = counts.get((entry.split, entry.task_id), (0, 0))
+        counts[(entry.split, entry.task_id)] = (successes + is_successful(entry.reward), trials + 1)
+    return dict(sorted(counts.items()))
+
+
+def pass_hat_k(counts: Dict[Tuple[str, int], Tuple[int, int]], max_k: int) -> Dict[int, float]:
+    """
+    pass^k as defined by tau-bench: the chance that k trials of a task drawn without replacement all succeed,
+    C(c, k) / C(n, k) for a task with c successes in n trials, averaged over the tasks with at least k trials.
+    """
+    pass_hat_ks = {}
+    for k in range(1, max_k + 1):
+        estimates = [comb(successes, k) / comb(trials, k) for successes, trials in counts.values() if trials >= k]
+        if estimates:
+            pass_hat_ks[k] = sum(estimates) / len(estimates)
+    return pass_hat_ks
+
+
+def format_task_success_table(counts: Dict[Tuple[str, int], Tuple[int, int]]) -> str:
+    rows: List[str] = [f"{'split':<8}{'task':>6}{'successes':>12}{'trials':>8}{'rate':>8}"]
+    for (split, task_id), (successes, trials) in counts.items():
+        rows.append(f"{split:<8}{task_id:>6}{successes:>12}{trials:>8}{successes / trials:>8.0%}")
+    return "\n".join(rows)
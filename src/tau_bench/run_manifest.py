@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from tau_bench.file_utils import locked_append, read_complete_lines, truncate_partial_line
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+SHARD_DIRECTORY_PREFIX = "shard-"
+
+EpisodeKey = Tuple[str, int, int]
+
+
+@dataclass
+class ManifestEntry:
+    """A finished episode: task `task_id` of `split`, trial `trial`."""
+
+    split: str
+    task_id: int
+    trial: int
+    reward: float
+    # None when the database was not checked because expected outputs were missing
+    r_actions: Optional[float]
+    usage: Optional[Dict[str, Any]] = None
+    finished_at: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> EpisodeKey:
+        return (self.split, self.task_id, self.trial)
+
+    def model_dump(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def in_shard(task_id: int, shard: Tuple[int, int]) -> bool:
+    """Whether task `task_id` belongs to shard `(index, count)`; all trials of a task are in the same shard."""
+    index, count = shard
+    return task_id % count == index
+
+
+def shard_directory(directory: str, shard: Tuple[int, int]) -> str:
+    """Where shard `(index, count)` of a run in `directory` keeps its manifest and trajectories."""
+    index, count = shard
+    return os.path.join(directory, f"{SHARD_DIRECTORY_PREFIX}{index}-of-{count}")
+
+
+def shard_directories(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(SHARD_DIRECTORY_PREFIX) and os.path.isdir(os.path.join(directory, name))
+    )
+
+
+def move_aside(path: str) -> None:
+    """Renames a non-empty file to `<path>.<time>` so that a new run starts without deleting the old one."""
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        os.replace(path, f"{path}.{time.strftime('%m%d%H%M%S')}")
+
+
+def _check_config(path: str, recorded: Dict[str, Any], config: Dict[str, Any]) -> None:
+    mismatched = sorted(key for key in set(recorded) | set(config) if recorded.get(key) != config.get(key))
+    if mismatched:
+        raise ValueError(f"cannot resume {path}: the run was started with different {', '.join(mismatched)}")
+
+
+def read_manifest(path: str, config: Dict[str, Any]) -> List[ManifestEntry]:
+    """The episodes recorded in a manifest file. Raises ValueError if it was written with a different `config`."""
+    entries = []
+    for line in read_complete_lines(path):
+        record = json.loads(line)
+        if record["type"] == "config":
+            _check_config(path, record["config"], config)
+        else:
+            entries.append(ManifestEntry(**record["episode"]))
+    return entries
+
+
+def manifest_paths(directory: str) -> List[str]:
+    """The manifest of `directory` and those of its shard directories, as far as they exist."""
+    paths = [os.path.join(path, MANIFEST_FILE_NAME) for path in [directory] + shard_directories(directory)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def latest_entries(entries: Iterable[ManifestEntry]) -> List[ManifestEntry]:
+    """One entry per episode, the latest one if it was recorded twice (e.g. by shards of different layouts)."""
+    latest: Dict[EpisodeKey, ManifestEntry] = {}
+    for entry in entries:
+        if entry.key not in latest or entry.finished_at >= latest[entry.key].finished_at:
+            latest[entry.key] = entry
+    return sorted(latest.values(), key=lambda entry: entry.finished_at)
+
+
+def merge_manifests(directory: str, config: Dict[str, Any]) -> List[ManifestEntry]:
+    """
+    Merges the manifests of the shard directories of `directory` into the manifest of `directory` (replacing
+    it atomically, its own episodes are kept), so that the run reads like a single-process run, e.g. for
+    `--resume` without shards. Returns the merged episodes.
+    """
+    entries = latest_entries(entry for path in manifest_paths(directory) for entry in read_manifest(path, config))
+    path = os.path.join(directory, MANIFEST_FILE_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "config", "config": config}) + "\n")
+        for entry in entries:
+            f.write(json.dumps({"type": "episode", "episode": entry.model_dump()}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return entries
+
+
+class RunManifest:
+    """
+    Append-only record of the finished episodes of a run in `directory`, used to resume the run after a crash.
+
+    The first line holds the run configuration; every finished episode is appended as one line and fsynced
+    before `record` returns, so an interrupted run loses at most the episodes that were still running. Starting
+    a run without `resume` moves an existing manifest aside instead of deleting it.
+    """
+
+    def __init__(self, directory: str, config: Dict[str, Any], resume: bool = False) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, MANIFEST_FILE_NAME)
+        self.config = config
+        self.entries: List[ManifestEntry] = []
+        self._lock = threading.Lock()
+        if resume:
+            truncate_partial_line(self.path)
+            self.entries = read_manifest(self.path, config)
+        else:
+            move_aside(self.path)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "ab")
+        if is_new:
+            self._append({"type": "config", "config": config})
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        locked_append(self._file, (json.dumps(record) + "\n").encode("utf-8"), fsync=True)
+
+    def completed(self) -> Set[EpisodeKey]:
+        with self._lock:
+            return {entry.key for entry in self.entries}
+
+    def record(self, entry: ManifestEntry) -> None:
+        with self._lock:
+            self._append({"type": "episode", "episode": entry.model_dump()})
+            self.entries.append(entry)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "RunManifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from tau_bench.file_utils import locked_append, read_complete_lines, truncate_partial_line
+from tau_bench.run_manifest import shard_directories
+
+INDEX_FILE_NAME = "index.jsonl"
+COMPRESSIONS = ("none", "zstd")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compressed trajectory shards require the `zstandard` package (pip install zstandard)")
+    return zstandard
+
+
+@dataclass
+class TrajectoryIndexEntry:
+    """Where one episode is stored: `length` bytes at `offset` of `shard` (relative to the store directory)."""
+
+    task_id: Optional[int]
+    split: Optional[str]
+    reward: Optional[float]
+    shard: str
+    offset: int
+    length: int
+    trial: Optional[int] = None
+
+    def model_dump(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TrajectoryWriter:
+    """
+    Appends episodes as JSON lines to rotating shard files and records each one in the store's index.
+
+    Every writer owns its shards (their names include the process id), so several threads and processes can
+    write to the same directory; index lines are appended under an exclusive file lock. With zstd compression
+    each episode is its own zstd frame, so a shard is still a valid zstd stream and any episode can be
+    decompressed on its own. Records are flushed as they are written and fsynced at most every
+    `fsync_interval_s` seconds, and on rotation and close.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "trajectories",
+        max_shard_bytes: int = 256 * 1024 * 1024,
+        compression: str = "none",
+        fsync_interval_s: float = 5.0,
+    ) -> None:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = f"{prefix}-{os.getpid()}"
+        self.max_shard_bytes = max_shard_bytes
+        self.compression = compression
+        self.fsync_interval_s = fsync_interval_s
+        self._compressor = _zstandard().ZstdCompressor() if compression == "zstd" else None
+        self._lock = threading.Lock()
+        self._shard_number = 0
+        self._shard_name: Optional[str] = None
+        self._shard = None
+        self._last_fsync = time.monotonic()
+        index_path = os.path.join(directory, INDEX_FILE_NAME)
+        truncate_partial_line(index_path)
+        self._index = open(index_path, "ab")
+
+    def _shard_file_name(self, number: int) -> str:
+        suffix = ".jsonl.zst" if self.compression == "zstd" else ".jsonl"
+        return f"{self.prefix}-{number:05d}{suffix}"
+
+    def _open_next_shard(self) -> None:
+        self._close_shard()
+        # never append to a shard left behind by an earlier process that had the same pid
+        while True:
+            self._shard_number += 1
+            name = self._shard_file_name(self._shard_number)
+            try:
+                self._shard = open(os.path.join(self.directory, name), "xb")
+            except FileExistsError:
+                continue
+            self._shard_name = name
+            return
+
+    def _close_shard(self) -> None:
+        if self._shard is not None:
+            self._shard.flush()
+            os.fsync(self._shard.fileno())
+            self._shard.close()
+            self._shard = None
+
+    def write(
+        self,
+        record: Dict[str, Any],
+        task_id: Optional[int] = None,
+        split: Optional[str] = None,
+        reward: Optional[float] = None,
+        trial: Optional[int] = None,
+    ) -> TrajectoryIndexEntry:
+        payload = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._compressor is not None:
+                # compressor objects are not thread-safe
+                payload = self._compressor.compress(payload)
+            if self._shard is None or (self._shard.tell() > 0 and self._shard.tell() + len(payload) > self.max_shard_bytes):
+                self._open_next_shard()
+            offset = self._shard.tell()
+            self._shard.write(payload)
+            # the record must be readable before the index points at it
+            self._shard.flush()
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval_s:
+                os.fsync(self._shard.fileno())
+                os.fsync(self._index.fileno())
+                self._last_fsync = now
+            entry = TrajectoryIndexEntry(task_id, split, reward, self._shard_name, offset, len(payload), trial)
+            locked_append(self._index, (json.dumps(entry.model_dump()) + "\n").encode("utf-8"))
+        return entry
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_shard()
+            if not self._index.closed:
+                self._index.flush()
+                os.fsync(self._index.fileno())
+                self._index.close()
+
+    def __enter__(self) -> "TrajectoryWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Random access to the episodes of a store directory through its index. The episodes written by the shards
+    of a multi-process run (`run_manifest.shard_directory`) are included, their `shard` file names are then
+    relative to the store directory as well.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def entries(self) -> List[TrajectoryIndexEntry]:
+        entries = []
+        for directory in [self.directory] + shard_directories(self.directory):
+            prefix = os.path.relpath(directory, self.directory)
+            for line in read_complete_lines(os.path.join(directory, INDEX_FILE_NAME)):
+                entry = TrajectoryIndexEntry(**json.loads(line))
+                entries.append(entry if prefix == os.curdir else replace(entry, shard=os.path.join(prefix, entry.shard)))
+        return entries
+
+    def read(self, entry: TrajectoryIndexEntry) -> Dict[str, Any]:
+        with open(os.path.join(self.directory, entry.shard), "rb") as f:
+            f.seek(entry.offset)
+            payload = f.read(entry.length)
+        if entry.shard.endswith(".zst"):
+            payload = _zstandard().ZstdDecompressor().decompress(payload)
+        return json.loads(payload)
+
+    def find(self, task_id: int, split: Optional[str] = None, trial: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [
+            self.read(entry)
+            for entry in self.entries()
+            if entry.task_id == task_id and (split is None or entry.split == split) and (trial is None or entry.trial == trial)
+        ]
+
+    def iter_records(self, where: Optional[Callable[[TrajectoryIndexEntry], bool]] = None) -> Iterator[Dict[str, Any]]:
+        for entry in self.entries():
+            if where is None or where(entry):
+                yield self.read(entry)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_records()
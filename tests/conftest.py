@@ -0,0 +1,4 @@
+import os
+
+# importing tau_bench.envs pulls in litellm, which would otherwise download its model cost map
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
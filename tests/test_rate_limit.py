@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tau_bench import rate_limit
+from tau_bench.rate_limit import Priority, ProviderBudget, RateLimitScheduler
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake)
+    return fake
+
+
+def test_request_bucket_refills_at_its_rate(clock):
+    budget = ProviderBudget(requests_per_minute=60)
+    for _ in range(60):
+        assert budget.try_acquire(Priority.ACTION, 0) == 0.0
+    assert budget.try_acquire(Priority.ACTION, 0) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert budget.try_acquire(Priority.ACTION, 0) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert budget.try_acquire(Priority.ACTION, 0) == 0.0
+
+    # an idle bucket refills to its capacity, not beyond
+    clock.now += 3600
+    for _ in range(60):
+        assert budget.try_acquire(Priority.ACTION, 0) == 0.0
+    assert budget.try_acquire(Priority.ACTION, 0) > 0
+
+
+def test_token_bucket_reserves_estimates_and_settles_usage(clock):
+    budget = ProviderBudget(tokens_per_minute=600)
+    assert budget.try_acquire(Priority.ACTION, 500) == 0.0
+    assert budget.try_acquire(Priority.ACTION, 200) == pytest.approx(10.0)
+
+    # the call used less than reserved, the difference goes back into the bucket
+    budget.record_usage(reserved_tokens=500, used_tokens=300)
+    assert budget.try_acquire(Priority.ACTION, 200) == 0.0
+
+    # a request larger than the whole budget waits for a full bucket only (500 of 600 tokens are missing)
+    assert budget.try_acquire(Priority.ACTION, 10_000) == pytest.approx(50.0)
+
+
+def test_rate_limits_shrink_the_budget_and_pause_the_provider(clock):
+    budget = ProviderBudget(requests_per_minute=100)
+    budget.record_rate_limited(delay=2.0)
+    assert budget.scale == pytest.approx(0.8)
+    assert budget.try_acquire(Priority.USER, 0) == pytest.approx(2.0)
+
+    clock.now += 2.0
+    for _ in range(80):
+        assert budget.try_acquire(Priority.ACTION, 0) == 0.0
+    assert budget.try_acquire(Priority.ACTION, 0) > 0
+
+    for _ in range(100):
+        budget.record_success()
+    assert budget.scale == 1.0
+
+
+def test_limits_are_learned_from_headers(clock):
+    budget = ProviderBudget()
+    budget.update_from_headers({
+        "llm_provider-x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1.5s",
+        "x-ratelimit-limit-tokens": "30000",
+        "x-ratelimit-remaining-tokens": "29000",
+        "x-ratelimit-reset-tokens": "6m0s",
+    })
+    assert budget.requests.per_minute == 500
+    assert budget.requests.level == 0
+    assert budget.tokens.per_minute == 30000
+    assert budget.tokens.level == 29000
+    assert budget.paused_until == pytest.approx(clock.now + 1.5)
+
+
+def test_configured_limits_are_not_overridden_by_headers(clock):
+    budget = ProviderBudget(requests_per_minute=10)
+    budget.update_from_headers({"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "3"})
+    assert budget.requests.per_minute == 10
+    assert budget.requests.level == 3
+
+
+def test_lower_priorities_wait_while_higher_ones_are_queued(clock):
+    budget = ProviderBudget(requests_per_minute=60)
+    budget.waiting[Priority.USER] = 1
+    assert budget.try_acquire(Priority.PLANNING, 0) > 0
+    assert budget.try_acquire(Priority.ACTION, 0) > 0
+    assert budget.try_acquire(Priority.USER, 0) == 0.0
+
+    budget.waiting[Priority.USER] = 0
+    assert budget.try_acquire(Priority.PLANNING, 0) == 0.0
+
+
+def test_user_turns_are_served_before_queued_planning_calls():
+    scheduler = RateLimitScheduler()
+    scheduler.configure("p", requests_per_minute=60)
+    scheduler.budget("p").requests.level = 0
+    order = []
+
+    def call(priority, name):
+        scheduler.call("p", lambda: order.append(name), priority=priority)
+
+    planners = [threading.Thread(target=call, args=(Priority.PLANNING, f"plan{i}")) for i in range(2)]
+    for thread in planners:
+        thread.start()
+    time.sleep(0.1)
+    user = threading.Thread(target=call, args=(Priority.USER, "user"))
+    user.start()
+    for thread in planners + [user]:
+        thread.join()
+
+    assert order[0] == "user"
+    assert sorted(order[1:]) == ["plan0", "plan1"]
+
+
+def test_rate_limit_errors_are_retried_and_others_raised():
+    scheduler = RateLimitScheduler(max_retries=3, base_delay=0.01)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError()
+        return "ok"
+
+    assert scheduler.call("x", flaky) == "ok"
+    assert len(attempts) == 3
+
+    def always_limited():
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        scheduler.call("y", always_limited)
+    with pytest.raises(ZeroDivisionError):
+        scheduler.call("z", lambda: 1 / 0)
+
+
+def test_async_calls_are_retried():
+    scheduler = RateLimitScheduler(base_delay=0.01)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RateLimitError()
+        return "ok"
+
+    assert asyncio.run(scheduler.acall("x", flaky)) == "ok"
+    assert len(attempts) == 2
@@ -0,0 +1,51 @@
+from itertools import combinations
+
+import pytest
+
+from tau_bench.reward_summary import format_task_success_table, pass_hat_k, task_success_counts
+from tau_bench.run_manifest import ManifestEntry
+
+
+def entries(rewards_by_task, split="test"):
+    return [
+        ManifestEntry(split=split, task_id=task_id, trial=trial, reward=reward, r_actions=reward)
+        for task_id, rewards in rewards_by_task.items()
+        for trial, reward in enumerate(rewards)
+    ]
+
+
+def test_success_counts_per_task():
+    counts = task_success_counts(entries({2: [1.0, 0.0, 1.0], 0: [0.0], 1: [0.9999999, 0.5]}))
+    assert counts == {("test", 0): (0, 1), ("test", 1): (1, 2), ("test", 2): (2, 3)}
+    assert list(counts) == [("test", 0), ("test", 1), ("test", 2)]
+
+
+def test_pass_hat_k_matches_its_definition():
+    outcomes = {0: [1, 1, 1], 1: [1, 0, 1], 2: [0, 0, 0], 3: [1, 0, 0, 1]}
+    counts = task_success_counts(entries({task: [float(o) for o in trials] for task, trials in outcomes.items()}))
+    result = pass_hat_k(counts, 4)
+
+    for k in range(1, 5):
+        # the share of k-subsets of a task's trials that all succeed, averaged over tasks with k trials
+        per_task = [
+            sum(all(subset) for subset in combinations(trials, k)) / len(list(combinations(trials, k)))
+            for trials in outcomes.values()
+            if len(trials) >= k
+        ]
+        assert result[k] == pytest.approx(sum(per_task) / len(per_task))
+    assert result[1] == pytest.approx((1 + 2 / 3 + 0 + 1 / 2) / 4)
+    assert result[3] == pytest.approx((1 + 0 + 0 + 0) / 4)
+    assert result[4] == pytest.approx(0.0)
+
+
+def test_pass_hat_k_skips_k_without_enough_trials():
+    counts = task_success_counts(entries({0: [1.0, 1.0]}))
+    assert pass_hat_k(counts, 3) == {1: 1.0, 2: 1.0}
+
+
+def test_success_table_lists_every_task():
+    table = format_task_success_table(task_success_counts(entries({0: [1.0, 0.0], 5: [1.0, 1.0]})))
+    lines = table.splitlines()
+    assert lines[0].split() == ["split", "task", "successes", "trials", "rate"]
+    assert lines[1].split() == ["test", "0", "1", "2", "50%"]
+    assert lines[2].split() == ["test", "5", "2", "2", "100%"]
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from tau_bench.run_manifest import MANIFEST_FILE_NAME, ManifestEntry, RunManifest
+
+CONFIG = {"model": "gpt-4o", "task_split": "test", "num_trials": 2}
+
+
+def entry(task_id, trial=0, reward=1.0):
+    return ManifestEntry(split="test", task_id=task_id, trial=trial, reward=reward, r_actions=reward)
+
+
+def test_resume_restores_the_finished_episodes(tmp_path):
+    with RunManifest(str(tmp_path), CONFIG) as manifest:
+        manifest.record(entry(0))
+        manifest.record(entry(0, trial=1, reward=0.0))
+        manifest.record(entry(3))
+
+    with RunManifest(str(tmp_path), CONFIG, resume=True) as resumed:
+        assert resumed.completed() == {("test", 0, 0), ("test", 0, 1), ("test", 3, 0)}
+        assert [e.reward for e in resumed.entries] == [1.0, 0.0, 1.0]
+        resumed.record(entry(4))
+
+    with RunManifest(str(tmp_path), CONFIG, resume=True) as resumed:
+        assert ("test", 4, 0) in resumed.completed()
+        assert len(resumed.entries) == 4
+
+
+def test_resume_drops_a_partially_written_episode(tmp_path):
+    with RunManifest(str(tmp_path), CONFIG) as manifest:
+        manifest.record(entry(0))
+    # a run killed in the middle of an append
+    with open(tmp_path / MANIFEST_FILE_NAME, "ab") as f:
+        f.write(b'{"type": "episode", "episode": {"split": "te')
+
+    with RunManifest(str(tmp_path), CONFIG, resume=True) as resumed:
+        assert resumed.completed() == {("test", 0, 0)}
+        resumed.record(entry(1))
+    with RunManifest(str(tmp_path), CONFIG, resume=True) as resumed:
+        assert resumed.completed() == {("test", 0, 0), ("test", 1, 0)}
+
+
+def test_resume_refuses_a_different_configuration(tmp_path):
+    with RunManifest(str(tmp_path), CONFIG) as manifest:
+        manifest.record(entry(0))
+    with pytest.raises(ValueError, match="model"):
+        RunManifest(str(tmp_path), {**CONFIG, "model": "gpt-4o-mini"}, resume=True)
+
+
+def test_a_new_run_moves_the_old_manifest_aside(tmp_path):
+    with RunManifest(str(tmp_path), CONFIG) as manifest:
+        manifest.record(entry(0))
+
+    with RunManifest(str(tmp_path), CONFIG) as fresh:
+        assert fresh.completed() == set()
+    names = os.listdir(tmp_path)
+    assert MANIFEST_FILE_NAME in names
+    moved = [name for name in names if name.startswith(MANIFEST_FILE_NAME + ".")]
+    assert len(moved) == 1
+    with RunManifest(str(tmp_path), CONFIG, resume=True) as resumed:
+        assert resumed.completed() == set()
@@ -0,0 +1,134 @@
+import copy
+import pickle
+
+from tau_bench.envs.snapshot import ABSENT, WriteEntry, copy_on_write_snapshot, get_write_log, rollback, to_plain
+from tau_bench.envs.state_diff import diff_data
+from tau_bench.envs.state_hash import data_equal, data_hash
+
+
+def make_base():
+    return {
+        "orders": {
+            "#W1": {"status": "pending", "items": [{"item_id": "a", "price": 10.0}, {"item_id": "b", "price": 20.0}], "address": {"city": "X"}},
+            "#W2": {"status": "delivered", "items": [{"item_id": "c", "price": 5.0}], "address": {"city": "Y"}},
+        },
+        "users": {"u1": {"orders": ["#W1", "#W2"], "payment_methods": {"gift_card_1": {"balance": 100}}}},
+    }
+
+
+def plain(data):
+    return {name: {key: to_plain(record) for key, record in collection.items()} for name, collection in data.items()}
+
+
+def test_nested_dict_writes_are_logged_and_leave_the_base_untouched():
+    base = make_base()
+    data = copy_on_write_snapshot(base)
+    log = get_write_log(data)
+
+    data["orders"]["#W1"]["address"]["city"] = "Z"
+    data["users"]["u1"]["payment_methods"]["gift_card_1"]["balance"] -= 30
+    data["orders"]["#W1"]["address"]["zip"] = "12345"
+
+    assert log.entries == [
+        WriteEntry("orders", "#W1", ("address", "city"), "X", "Z"),
+        WriteEntry("users", "u1", ("payment_methods", "gift_card_1", "balance"), 100, 70),
+        WriteEntry("orders", "#W1", ("address", "zip"), ABSENT, "12345"),
+    ]
+    assert base == make_base()
+    assert data["orders"]["#W1"]["address"] == {"city": "Z", "zip": "12345"}
+
+
+def test_list_mutations_are_logged_with_the_whole_list():
+    base = make_base()
+    data = copy_on_write_snapshot(base)
+    log = get_write_log(data)
+    items = data["orders"]["#W1"]["items"]
+
+    items.append({"item_id": "d", "price": 1.0})
+    assert log.entries[-1].path == ("items",)
+    assert [item["item_id"] for item in log.entries[-1].old] == ["a", "b"]
+    assert [item["item_id"] for item in log.entries[-1].new] == ["a", "b", "d"]
+
+    assert items.pop(0) == {"item_id": "a", "price": 10.0}
+    items.extend([{"item_id": "e", "price": 2.0}])
+    items[0:2] = [{"item_id": "f", "price": 3.0}]
+    assert [item["item_id"] for item in items] == ["f", "e"]
+    assert len(log) == 4
+
+    # items appended or moved by a list mutation are tracked at their new index
+    items[1]["price"] = 4.0
+    assert log.entries[-1] == WriteEntry("orders", "#W1", ("items", 1, "price"), 2.0, 4.0)
+    data["users"]["u1"]["orders"][0] = "#W9"
+    assert log.entries[-1] == WriteEntry("users", "u1", ("orders", 0), "#W1", "#W9")
+    assert base == make_base()
+
+
+def test_reads_do_not_touch_records_but_writes_do():
+    data = copy_on_write_snapshot(make_base())
+    assert data["orders"]["#W2"]["status"] == "delivered"
+    assert data["orders"].touched_keys == set()
+
+    data["orders"]["#W1"]["status"] = "cancelled"
+    del data["orders"]["#W2"]
+    data["orders"]["#W3"] = {"status": "pending", "items": []}
+    assert data["orders"].touched_keys == {"#W1", "#W2", "#W3"}
+    assert data["users"].touched_keys == set()
+
+
+def test_rollback_restores_the_base():
+    base = make_base()
+    data = copy_on_write_snapshot(base)
+    log = get_write_log(data)
+
+    data["orders"]["#W1"]["status"] = "processed"
+    mark = log.mark()
+    after_first_write = plain(data)
+    data["orders"]["#W1"]["items"].pop()
+    data["orders"]["#W1"]["items"][0]["price"] = 0.0
+    data["users"]["u1"]["payment_methods"]["gift_card_1"]["balance"] = 0
+    del data["orders"]["#W2"]
+    data["orders"]["#W3"] = {"status": "pending"}
+
+    rollback(data, mark)
+    assert plain(data) == after_first_write
+    assert data["orders"].touched_keys == {"#W1"}
+    assert data["users"].touched_keys == set()
+
+    rollback(data, 0)
+    assert plain(data) == make_base()
+    assert len(log) == 0
+    assert data_hash(data) == data_hash(base)
+    # records restored by a rollback are tracked again
+    data["orders"]["#W1"]["items"][0]["price"] = 7.0
+    assert log.entries == [WriteEntry("orders", "#W1", ("items", 0, "price"), 10.0, 7.0)]
+
+
+def test_touched_keys_feed_data_equal_and_diff_data():
+    base = make_base()
+    agent, expected = copy_on_write_snapshot(base), copy_on_write_snapshot(base)
+    for data in (agent, expected):
+        data["orders"]["#W1"]["status"] = "cancelled"
+    assert data_equal(agent, expected)
+    assert diff_data(agent, expected) == []
+
+    agent["orders"]["#W1"]["items"][1]["price"] = 25.0
+    expected["users"]["u1"]["payment_methods"]["gift_card_1"]["balance"] = 80
+    assert not data_equal(agent, expected)
+    assert diff_data(agent, expected) == [
+        {"collection": "orders", "key": "#W1", "path": ["items", 1, "price"], "agent": 25.0, "expected": 20.0, "base": 20.0},
+        {"collection": "users", "key": "u1", "path": ["payment_methods", "gift_card_1", "balance"], "agent": 100, "expected": 80, "base": 100},
+    ]
+
+    # a write that restores the base value makes the records equal again
+    agent["orders"]["#W1"]["items"][1]["price"] = 20.0
+    expected["users"]["u1"]["payment_methods"]["gift_card_1"]["balance"] = 100
+    assert data_equal(agent, expected)
+    assert diff_data(agent, expected) == []
+
+
+def test_tracked_records_copy_and_pickle_as_plain_data():
+    data = copy_on_write_snapshot(make_base())
+    record = data["orders"]["#W1"]
+    for copied in (copy.deepcopy(record), pickle.loads(pickle.dumps(record))):
+        assert type(copied) is dict and type(copied["items"]) is list
+        assert copied == make_base()["orders"]["#W1"]
@@ -0,0 +1,93 @@
+import pytest
+
+from tau_bench.envs import state_hash
+from tau_bench.envs.snapshot import copy_on_write_snapshot, to_plain
+from tau_bench.envs.state_hash import consistent_hash, data_equal, data_hash, to_hashable
+
+
+def make_base():
+    return {
+        "orders": {
+            f"#W{index}": {"status": "pending", "items": [{"item_id": str(index), "price": 10.0 + index}], "user_id": f"u{index % 7}"}
+            for index in range(300)
+        },
+        "users": {f"u{index}": {"name": {"first": "A", "last": str(index)}, "orders": []} for index in range(7)},
+    }
+
+
+def plain(data):
+    return {name: {key: to_plain(record) for key, record in collection.items()} for name, collection in data.items()}
+
+
+def write(data):
+    data["orders"]["#W3"]["status"] = "cancelled"
+    data["orders"]["#W5"]["items"].append({"item_id": "x", "price": 1.0})
+    data["users"]["u2"]["name"]["first"] = "B"
+    data["orders"]["#W999"] = {"status": "pending", "items": [], "user_id": "u1"}
+    del data["orders"]["#W7"]
+
+
+def test_default_mode_matches_consistent_hash_and_tracks_writes():
+    base = make_base()
+    data = copy_on_write_snapshot(base)
+    before = data_hash(data)
+    assert before == consistent_hash(to_hashable(base))
+
+    write(data)
+    after = data_hash(data)
+    assert after != before
+    assert after == consistent_hash(to_hashable(plain(data)))
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_hash_depends_on_content_only(incremental):
+    base = make_base()
+    first, second = copy_on_write_snapshot(base), copy_on_write_snapshot(base)
+    write(first)
+    write(second)
+    assert data_hash(first, incremental) == data_hash(second, incremental)
+    assert data_hash(first, incremental) == data_hash(plain(first), incremental)
+    assert data_equal(first, second)
+
+    second["orders"]["#W3"]["status"] = "pending"
+    assert data_hash(first, incremental) != data_hash(second, incremental)
+    assert not data_equal(first, second)
+
+    # a record written back to its base value hashes like the untouched record
+    fresh = copy_on_write_snapshot(base)
+    fresh["orders"]["#W4"]["status"] = "delivered"
+    fresh["orders"]["#W4"]["status"] = "pending"
+    assert data_hash(fresh, incremental) == data_hash(base, incremental)
+
+
+def test_incremental_mode_tracks_every_kind_of_write():
+    base = make_base()
+    data = copy_on_write_snapshot(base)
+    seen = {data_hash(data, incremental=True)}
+    for mutation in (
+        lambda: data["orders"]["#W1"].__setitem__("status", "delivered"),
+        lambda: data["orders"]["#W1"]["items"][0].__setitem__("price", 99.0),
+        lambda: data["orders"]["#W2"]["items"].pop(),
+        lambda: data["users"]["u0"]["orders"].extend(["#W1", "#W2"]),
+        lambda: data["orders"].__setitem__("#W1000", {"status": "pending"}),
+        lambda: data["orders"].__delitem__("#W10"),
+    ):
+        mutation()
+        digest = data_hash(data, incremental=True)
+        assert digest not in seen
+        assert digest == data_hash(plain(data), incremental=True)
+        seen.add(digest)
+
+
+def test_incremental_mode_rehashes_only_touched_records(monkeypatch):
+    base = make_base()
+    data_hash(copy_on_write_snapshot(base), incremental=True)  # fills the base digests
+
+    hashed = []
+    record_digest = state_hash._record_digest
+    monkeypatch.setattr(state_hash, "_record_digest", lambda key, value: hashed.append(key) or record_digest(key, value))
+    data = copy_on_write_snapshot(base)
+    data["orders"]["#W3"]["status"] = "cancelled"
+    data["users"]["u2"]["name"]["first"] = "B"
+    data_hash(data, incremental=True)
+    assert sorted(hashed) == ["#W3", "u2"]
@@ -0,0 +1,86 @@
+import json
+import multiprocessing
+import os
+
+from tau_bench.envs.task_store import INDEX_SUFFIX, TaskStore
+from tau_bench.types import Action, Task
+
+
+def make_task(user_id: str, tool: str = "get_user_details", outputs=()) -> Task:
+    return Task(user_id=user_id, actions=[Action(name=tool, kwargs={"user_id": user_id})], instruction=f"help {user_id}", outputs=list(outputs))
+
+
+def write_tasks(path, tasks):
+    with open(path, "w") as f:
+        for task in tasks:
+            f.write(json.dumps(task.model_dump()) + "\n")
+
+
+def test_index_is_built_saved_and_reused(tmp_path):
+    path = str(tmp_path / "tasks.jsonl")
+    tasks = [make_task("a"), make_task("b", "cancel_pending_order", outputs=["10"]), make_task("a", "return_delivered_order_items")]
+    write_tasks(path, tasks)
+
+    store = TaskStore(path)
+    assert os.path.exists(path + INDEX_SUFFIX)
+    assert store.load(range(3)) == tasks
+    assert store.select(user_id="a") == [0, 2]
+    assert store.select(tools=["cancel_pending_order"]) == [1]
+    assert store.select(has_outputs=False) == [0, 2]
+    assert TaskStore(path).entries == store.entries
+
+
+def test_append_extends_file_and_index(tmp_path):
+    path = str(tmp_path / "tasks.jsonl")
+    write_tasks(path, [make_task("a")])
+    store = TaskStore(path)
+
+    assert store.append([make_task("b"), make_task("c")]) == [1, 2]
+    assert [task.user_id for task in store.load(range(3))] == ["a", "b", "c"]
+    reopened = TaskStore(path)
+    assert reopened.entries == store.entries
+    os.remove(path + INDEX_SUFFIX)
+    assert TaskStore(path).entries == store.entries
+
+
+def test_append_indexes_tasks_appended_by_another_store(tmp_path):
+    path = str(tmp_path / "tasks.jsonl")
+    write_tasks(path, [make_task("a")])
+    first, second = TaskStore(path), TaskStore(path)
+
+    assert first.append([make_task("b")]) == [1]
+    assert second.append([make_task("c")]) == [2]
+    assert [task.user_id for task in second.load(range(3))] == ["a", "b", "c"]
+
+
+def _append_from_process(path, worker, count, queue):
+    store = TaskStore(path)
+    indices = []
+    for i in range(count):
+        indices += store.append([make_task(f"w{worker}-{i}")])
+    queue.put((worker, indices))
+
+
+def test_concurrent_appends_from_several_processes(tmp_path):
+    path = str(tmp_path / "tasks.jsonl")
+    write_tasks(path, [make_task("seed")])
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers, count = 4, 25
+    processes = [context.Process(target=_append_from_process, args=(path, worker, count, queue)) for worker in range(workers)]
+    for process in processes:
+        process.start()
+    results = dict(queue.get(timeout=60) for _ in processes)
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    store = TaskStore(path)
+    assert len(store) == 1 + workers * count
+    for worker, indices in results.items():
+        assert [task.user_id for task in store.load(indices)] == [f"w{worker}-{i}" for i in range(count)]
+    # the saved index is current and matches one rebuilt from the file
+    with open(path + INDEX_SUFFIX) as f:
+        assert json.load(f)["source"]["size"] == os.path.getsize(path)
+    os.remove(path + INDEX_SUFFIX)
+    assert TaskStore(path).entries == store.entries